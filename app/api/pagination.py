@@ -0,0 +1,14 @@
+from datetime import datetime
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from app.services.run_history import stream_runs
+
+
+def run_page_response(scope: str, key, limit: int, cursor: str | None, since: datetime | None,
+                      until: datetime | None) -> StreamingResponse:
+    """Streamed page of task runs; pass `next_cursor` back as `cursor` for the next one."""
+    try:
+        body = stream_runs(scope, key, limit, cursor, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(body, media_type="application/json")
@@ -0,0 +1,66 @@
+"""Lean JSON responses for the hot endpoints (run_task, get_store, list_tasks).
+
+Those handlers select exactly the columns of their response schema (`schema_columns`)
+and return `json_response(...)` with plain dicts. FastAPI passes a Response through
+untouched, so trusted rows skip response_model validation and the jsonable_encoder
+walk; `response_model` stays on the route for the OpenAPI schema.
+
+The encoder is stdlib json unless JSON_ENCODER=orjson, which needs the orjson package.
+Both produce the same compact JSON for the types these endpoints return.
+"""
+from __future__ import annotations
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable
+from uuid import UUID
+from fastapi import Response
+from pydantic import BaseModel
+from app.core.config import settings
+
+JSON_ENCODERS = ("json", "orjson")
+
+
+def _default(obj: Any):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (Decimal, float)):
+        # float subclasses such as numpy.float64 reach here under orjson
+        return float(obj)
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def _std_dumps(content: Any) -> bytes:
+    # the same output as Starlette's JSONResponse
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default).encode()
+
+
+def get_encoder(name: str | None = None) -> Callable[[Any], bytes]:
+    name = name or settings.JSON_ENCODER
+    if name == "json":
+        return _std_dumps
+    if name == "orjson":
+        try:
+            import orjson
+        except ImportError as e:
+            raise ValueError("JSON_ENCODER=orjson needs the orjson package") from e
+        return lambda content: orjson.dumps(content, default=_default)
+    raise ValueError(f"Unknown JSON_ENCODER {name!r}; expected one of {JSON_ENCODERS}")
+
+
+class LeanJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return get_encoder()(content)
+
+
+def json_response(content: Any, status_code: int = 200, headers: dict[str, str] | None = None) -> LeanJSONResponse:
+    return LeanJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def schema_columns(schema: type[BaseModel], model) -> list:
+    """The mapped columns of `model` named like the fields of `schema`, in field order."""
+    return [getattr(model, field) for field in schema.model_fields]
@@ -4,6 +4,8 @@ from app.core.db import get_db
 from app.models.models import Company
 from app.schemas.schemas import CompanyCreate, CompanyOut, CompanyUpdate
 from app.core.auth import require_role
+from app.services.change_feed import company_changed
+from app.workers.tasks import index_company_cells
 
 router = APIRouter()
 
@@ -22,6 +24,8 @@ def update_company(company_id: int, payload: CompanyUpdate, db: Session = Depend
         raise HTTPException(status_code=404, detail="Company not found")
     c.geofence_radius_m = payload.geofence_radius_m
     db.commit()
+    company_changed(company_id)
+    index_company_cells.delay(company_id)
     db.refresh(c)
     return c
 
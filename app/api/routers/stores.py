@@ -1,18 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+import io
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from typing import Literal, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.core.db import get_db
-from app.models.models import Store, Company, GeocodeJob
-from app.schemas.schemas import StoreCreate, StoreOut
-from app.core.auth import require_role
-from app.workers.tasks import enqueue_geocode
+from app.core.db import SessionLocal, get_db, get_async_db
+from app.models.models import Store, Company, GeocodeJob, StoreImport
+from app.schemas.schemas import GeofencePolygon, StoreCreate, StoreOut, StoreNearbyOut, StoreImportOut, TaskRunDailyOut
+from app.api.pagination import run_page_response
+from app.api.responses import json_response, schema_columns
+from app.core.auth import get_current_user, require_role
+from app.core.config import settings
+from app.services.cell_index import index_stores, stores_at
+from app.services.change_feed import stores_changed
+from app.services.distances import nearby_stores
+from app.services.polygons import fence_from_geojson, set_fence
+from app.services.run_rollup import store_daily
+from app.services.store_import import format_for, geocode_progress, run_import
+from app.workers.tasks import claim_geocode, enqueue_geocode, enqueue_geocode_batches, enqueue_geocode_once, queue_jobs
 
 router = APIRouter()
 
+STORE_OUT_COLUMNS = schema_columns(StoreOut, Store)
+
 @router.post("", response_model=StoreOut, dependencies=[Depends(require_role("admin"))])
 def create_store(payload: StoreCreate, db: Session = Depends(get_db)):
     company = db.get(Company, payload.company_id)
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
+    fence = _fence_or_400(payload.geofence) if payload.geofence else None
 
     s = Store(
         company_id=payload.company_id,
@@ -25,30 +43,160 @@ def create_store(payload: StoreCreate, db: Session = Depends(get_db)):
         geocode_status="pending"
     )
     db.add(s)
+    db.flush()
+    if fence is not None:
+        set_fence(db, s.id, fence)
+        index_stores(db, [s.id])
     db.commit()
     db.refresh(s)
+    if fence is not None:
+        # fenced stores are in the cell index from the start
+        stores_changed([s.id])
 
     job = GeocodeJob(store_id=s.id, status="queued")
     db.add(job)
     db.commit()
 
-    enqueue_geocode.delay(s.id)
+    enqueue_geocode_once(s.id)
     return s
 
+# uploads larger than this spill from memory to a temp file
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+def _run_import_from_spool(import_id: int, spool):
+    db = SessionLocal()
+    try:
+        lines = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+        run_import(db, import_id, lines, enqueue=enqueue_geocode_batches)
+    finally:
+        db.close()
+        spool.close()
+
+@router.post(":bulk", response_model=StoreImportOut, status_code=202, dependencies=[Depends(require_role("admin"))])
+async def bulk_import_stores(
+    request: Request,
+    background: BackgroundTasks,
+    company_id: int = Query(...),
+    format: Optional[Literal["csv", "ndjson"]] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    fmt = format or format_for(request.headers.get("content-type"))
+    if not fmt:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass ?format=")
+    if not await db.get(Company, company_id):
+        raise HTTPException(status_code=404, detail="Company not found")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    imp = StoreImport(company_id=company_id, source=fmt, status="queued", total_rows=0, inserted=0, failed=0)
+    db.add(imp)
+    await db.commit()
+    background.add_task(_run_import_from_spool, imp.id, spool)
+    return imp
+
+@router.get("/imports/{import_id}", response_model=StoreImportOut, dependencies=[Depends(require_role("admin"))])
+def get_store_import(import_id: int, db: Session = Depends(get_db)):
+    imp = db.get(StoreImport, import_id)
+    if not imp:
+        raise HTTPException(status_code=404, detail="Import not found")
+    out = StoreImportOut.model_validate(imp)
+    out.geocoding = geocode_progress(db, import_id)
+    return out
+
+@router.get(":nearby", response_model=list[StoreNearbyOut], dependencies=[Depends(get_current_user)])
+def get_nearby_stores(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(1000, gt=0, le=50000),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    return nearby_stores(db, lat, lng, radius, limit)
+
+@router.get(":here", response_model=list[StoreNearbyOut], dependencies=[Depends(get_current_user)])
+def get_stores_here(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    db: Session = Depends(get_db),
+):
+    # stores whose geofence contains the point, from the in-memory cell index
+    return stores_at(db, lat, lng)
+
 @router.get("/{store_id}", response_model=StoreOut)
-def get_store(store_id: int, db: Session = Depends(get_db)):
-    s = db.get(Store, store_id)
-    if not s:
+async def get_store(store_id: int, db: AsyncSession = Depends(get_async_db)):
+    # only the StoreOut columns: the location and geofence geographies are never loaded
+    res = await db.execute(select(*STORE_OUT_COLUMNS).where(Store.id == store_id))
+    row = res.mappings().first()
+    if not row:
         raise HTTPException(status_code=404, detail="Store not found")
-    return s
+    return json_response(dict(row))
+
+def _fence_or_400(polygon: GeofencePolygon):
+    try:
+        return fence_from_geojson(polygon.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/{store_id}/geofence", dependencies=[Depends(require_role("admin"))])
+def set_store_geofence(store_id: int, payload: GeofencePolygon, db: Session = Depends(get_db)):
+    fence = _fence_or_400(payload)
+    if not db.get(Store, store_id):
+        raise HTTPException(status_code=404, detail="Store not found")
+    set_fence(db, store_id, fence)
+    index_stores(db, [store_id])
+    db.commit()
+    stores_changed([store_id])
+    return {"status": "ok", "polygons": len(fence.geoms)}
+
+@router.delete("/{store_id}/geofence", dependencies=[Depends(require_role("admin"))])
+def delete_store_geofence(store_id: int, db: Session = Depends(get_db)):
+    if not db.get(Store, store_id):
+        raise HTTPException(status_code=404, detail="Store not found")
+    set_fence(db, store_id, None)
+    index_stores(db, [store_id])
+    db.commit()
+    stores_changed([store_id])
+    return {"status": "ok"}
 
 @router.post("/{store_id}/geocode:retry", dependencies=[Depends(require_role("admin"))])
 def retry_geocode(store_id: int, db: Session = Depends(get_db)):
     s = db.get(Store, store_id)
     if not s:
         raise HTTPException(status_code=404, detail="Store not found")
+    if not claim_geocode(s.id):
+        return {"status": "already_queued"}
     s.geocode_status = "pending"
+    queue_jobs(db, [s.id])
     db.commit()
+    stores_changed([s.id])
     enqueue_geocode.delay(s.id)
     return {"status": "queued"}
 
+@router.get("/{store_id}/runs", dependencies=[Depends(require_role("admin"))])
+async def list_store_runs(
+    store_id: int,
+    limit: int = Query(settings.TASK_RUN_PAGE_SIZE, ge=1, le=settings.TASK_RUN_PAGE_MAX),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    return run_page_response("store", store_id, limit, cursor, since, until)
+
+# longest range one rollup request may cover
+MAX_DAILY_RANGE = timedelta(days=366)
+
+@router.get("/{store_id}/runs:daily", response_model=list[TaskRunDailyOut], dependencies=[Depends(require_role("admin"))])
+async def get_store_daily_runs(
+    store_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end or end - start > MAX_DAILY_RANGE:
+        raise HTTPException(status_code=400, detail="start must be before end and at most 366 days apart")
+    return await store_daily(db, store_id, start, end)
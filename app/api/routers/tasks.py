@@ -1,15 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import time
+from datetime import datetime
+from typing import Literal, Optional
+import jwt
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from app.core.db import get_db
-from app.models.models import Task, Store, Company
-from app.schemas.schemas import TaskCreate, TaskOut, TaskRunRequest, TaskRunOut
-from app.core.auth import get_current_user, require_role
+from sqlalchemy import select, text
+from pydantic import ValidationError
+from app.core.db import async_session, get_db, get_async_db
+from app.models.models import Task, Store
+from app.schemas.schemas import (
+    TaskCreate, TaskOut, TaskRunRequest, TaskRunOut,
+    TaskRunBatchRequest, TaskRunBatchResult, TaskRunBatchOut, PingSubscribe, LocationPing,
+)
+from app.api.pagination import run_page_response
+from app.api.responses import json_response, schema_columns
+from app.core.auth import DEMO_USER, get_current_user, require_role, verify_token, websocket_token, websocket_user
+from app.core.config import settings
+from app.core.metrics import CHECKIN_OUTCOMES, PRESENCE_EVENTS, stage
 from app.core.ratelimit import rate_limit
-from app.services.distances import within_radius_and_distance
+from app.services.decision import adecide, decide_many
+from app.services.presence import PresenceTracker, process_ping, record_transitions
+from app.services.run_buffer import accept_run, arecorded_run_ids, get_run_buffer, new_record, recorded_run_ids
+from app.services.run_export import ExportFilter, export_chunks, export_filename, iter_export_rows, media_type
+from app.services.store_cache import aget_store_geofence, get_store_geofences
 
 router = APIRouter()
 
+TASK_OUT_COLUMNS = schema_columns(TaskOut, Task)
+
 @router.post("", response_model=TaskOut, dependencies=[Depends(require_role("admin"))])
 def create_task(payload: TaskCreate, db: Session = Depends(get_db)):
     store = db.get(Store, payload.store_id)
@@ -22,45 +42,259 @@ def create_task(payload: TaskCreate, db: Session = Depends(get_db)):
     return t
 
 @router.get("", response_model=list[TaskOut])
-def list_tasks(store_id: int = Query(...), db: Session = Depends(get_db)):
-    return db.query(Task).filter(Task.store_id == store_id).all()
+async def list_tasks(
+    request: Request,
+    store_id: int = Query(...),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="page size; all tasks without it"),
+    after_id: Optional[int] = Query(None, description="last task id of the previous page"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    q = select(*TASK_OUT_COLUMNS).where(Task.store_id == store_id)
+    if after_id is not None:
+        q = q.where(Task.id > after_id)
+    q = q.order_by(Task.id)
+    if limit is not None:
+        # one extra row tells whether there is a next page
+        q = q.limit(limit + 1)
+    rows = [dict(row) for row in (await db.execute(q)).mappings()]
+    headers = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_url = request.url.include_query_params(after_id=rows[-1]["id"])
+        headers = {"Link": f'<{next_url}>; rel="next"'}
+    return json_response(rows, headers=headers)
+
+@router.get("/runs:export", dependencies=[Depends(require_role("admin"))])
+def export_task_runs(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    compression: Literal["none", "gzip", "zstd"] = "none",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    company_id: Optional[int] = None,
+    store_id: Optional[int] = None,
+):
+    # streamed from a server-side cursor: memory does not grow with the number of rows
+    rows = iter_export_rows(ExportFilter(since, until, company_id, store_id))
+    try:
+        body = export_chunks(rows, format, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"Content-Disposition": f'attachment; filename="{export_filename(format, compression)}"'}
+    return StreamingResponse(body, media_type=media_type(format, compression), headers=headers)
+
+@router.get("/{task_id}/runs", dependencies=[Depends(require_role("admin"))])
+async def list_task_runs(
+    task_id: int,
+    limit: int = Query(settings.TASK_RUN_PAGE_SIZE, ge=1, le=settings.TASK_RUN_PAGE_MAX),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    return run_page_response("task", task_id, limit, cursor, since, until)
 
 @router.post("/{task_id}/run", response_model=TaskRunOut, dependencies=[Depends(rate_limit('task_run', 10, 60))])
-def run_task(task_id: int, payload: TaskRunRequest, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    task = db.get(Task, task_id)
-    if not task or not task.active:
+async def run_task(task_id: int, payload: TaskRunRequest, db: AsyncSession = Depends(get_async_db), user=Depends(get_current_user)):
+    with stage("lookup"):
+        geo = await aget_store_geofence(db, task_id)
+    if not geo or not geo.task_active:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    store = db.get(Store, task.store_id)
-    if not store:
-        raise HTTPException(status_code=404, detail="Store not found")
-
-    if store.geocode_status != "success" or store.location is None:
+    if not geo.checkable:
+        CHECKIN_OUTCOMES.labels("location_not_ready").inc()
         raise HTTPException(status_code=409, detail="Store location not ready")
 
-    company = db.get(Company, store.company_id)
-    effective_radius = store.custom_radius_m or company.geofence_radius_m
-
-    within, distance = within_radius_and_distance(db, store.id, payload.lat, payload.lng, effective_radius)
-    if distance is None:
+    with stage("distance"):
+        decision = await adecide(db, geo, payload.lat, payload.lng, payload.accuracy_m)
+    if decision is None:
+        CHECKIN_OUTCOMES.labels("location_not_ready").inc()
         raise HTTPException(status_code=409, detail="Store location not ready")
+    within, distance = decision.allowed, decision.distance_m
+
+    if get_run_buffer() is not None:
+        record = new_record(geo.task_id, user.sub, payload.lat, payload.lng, distance, within, payload.client_run_id)
+        with stage("insert"):
+            # without a client id there is nothing a retry could be matched on
+            buffered = await accept_run(record, dedup=payload.client_run_id is not None)
+        if buffered:
+            CHECKIN_OUTCOMES.labels("allowed" if within else "denied").inc()
+            return json_response({"allowed": within, "distance_m": distance, "decision": decision.status})
 
     # Insert the task run atomically with the client location to avoid NULL constraint issues
     insert_sql = text(
-        "INSERT INTO task_runs (task_id, worker_id, client_location, distance_m, allowed) "
-        "VALUES (:task_id, :worker_id, ST_SetSRID(ST_MakePoint(:lng,:lat),4326)::geography, :distance_m, :allowed) RETURNING id"
+        "INSERT INTO task_runs (task_id, worker_id, client_location, distance_m, allowed, client_run_id) "
+        "VALUES (:task_id, :worker_id, ST_SetSRID(ST_MakePoint(:lng,:lat),4326)::geography, :distance_m, :allowed, "
+        ":client_run_id) RETURNING id"
     )
     params = {
-        "task_id": task.id,
+        "task_id": geo.task_id,
         "worker_id": user.sub,
         "lng": payload.lng,
         "lat": payload.lat,
         "distance_m": distance,
-        "allowed": bool(within),
+        "allowed": within,
+        "client_run_id": str(payload.client_run_id) if payload.client_run_id else None,
     }
-    res = db.execute(insert_sql, params)
-    # consume the returned id to ensure the INSERT executed successfully
-    res.scalar_one()
-    db.commit()
+    with stage("insert"):
+        # a retried check-in is answered again but recorded once
+        if not (params["client_run_id"] and await arecorded_run_ids(db, [params["client_run_id"]])):
+            res = await db.execute(insert_sql, params)
+            # consume the returned id to ensure the INSERT executed successfully
+            res.scalar_one()
+    with stage("commit"):
+        await db.commit()
+
+    CHECKIN_OUTCOMES.labels("allowed" if within else "denied").inc()
+    return json_response({"allowed": within, "distance_m": distance, "decision": decision.status})
+
+
+# One statement for the whole batch: the arrays are zipped back into rows server-side.
+BATCH_INSERT_SQL = text(
+    "INSERT INTO task_runs (task_id, worker_id, client_location, distance_m, allowed, client_ts, client_run_id) "
+    "SELECT r.task_id, :worker_id, ST_SetSRID(ST_MakePoint(r.lng, r.lat), 4326)::geography, r.distance_m, r.allowed, "
+    "r.client_ts, r.client_run_id "
+    "FROM unnest(CAST(:task_ids AS integer[]), CAST(:lats AS float8[]), CAST(:lngs AS float8[]), "
+    "CAST(:distances AS float8[]), CAST(:allowed AS boolean[]), CAST(:client_ts AS timestamptz[]), "
+    "CAST(:client_run_ids AS uuid[])) "
+    "AS r(task_id, lat, lng, distance_m, allowed, client_ts, client_run_id)"
+)
+
+@router.post("/runs:batch", response_model=TaskRunBatchOut, dependencies=[Depends(rate_limit('task_run_batch', 10, 60))])
+def run_tasks_batch(payload: TaskRunBatchRequest, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    items = payload.items
+    with stage("lookup"):
+        geos = get_store_geofences(db, [item.task_id for item in items])
+
+    results = [TaskRunBatchResult(task_id=item.task_id, status=404, detail="Task not found") for item in items]
+    ready = []
+    for i, item in enumerate(items):
+        geo = geos.get(item.task_id)
+        if not geo or not geo.task_active:
+            continue
+        if not geo.checkable:
+            results[i] = TaskRunBatchResult(task_id=item.task_id, status=409, detail="Store location not ready")
+            continue
+        ready.append(i)
+
+    with stage("distance"):
+        decisions = decide_many(
+            db,
+            [geos[items[i].task_id] for i in ready],
+            [items[i].lat for i in ready],
+            [items[i].lng for i in ready],
+            [items[i].accuracy_m for i in ready],
+        )
+
+    # an upload retried after a lost response: items whose client_run_id is recorded
+    # already (or repeated in this batch) are answered again but not inserted twice
+    run_ids = {str(item.client_run_id) for item in items if item.client_run_id}
+    with stage("insert"):
+        seen = recorded_run_ids(db, sorted(run_ids))
+
+    rows = []
+    for i, decision in zip(ready, decisions):
+        item = items[i]
+        if decision is None:
+            results[i] = TaskRunBatchResult(task_id=item.task_id, status=409, detail="Store location not ready")
+            continue
+        within, distance = decision.allowed, decision.distance_m
+        results[i] = TaskRunBatchResult(
+            task_id=item.task_id, status=200, allowed=within, distance_m=distance, decision=decision.status,
+        )
+        run_id = str(item.client_run_id) if item.client_run_id else None
+        if run_id in seen:
+            continue
+        if run_id:
+            seen.add(run_id)
+        rows.append((item, distance, within, run_id))
+
+    if rows:
+        with stage("insert"):
+            db.execute(BATCH_INSERT_SQL, {
+                "worker_id": user.sub,
+                "task_ids": [item.task_id for item, _, _, _ in rows],
+                "lats": [item.lat for item, _, _, _ in rows],
+                "lngs": [item.lng for item, _, _, _ in rows],
+                "distances": [distance for _, distance, _, _ in rows],
+                "allowed": [within for _, _, within, _ in rows],
+                "client_ts": [item.client_ts for item, _, _, _ in rows],
+                "client_run_ids": [run_id for _, _, _, run_id in rows],
+            })
+    with stage("commit"):
+        # also releases the client_run_id locks when nothing was inserted
+        db.commit()
+
+    for result in results:
+        if result.status == 200:
+            CHECKIN_OUTCOMES.labels("allowed" if result.allowed else "denied").inc()
+        elif result.status == 409:
+            CHECKIN_OUTCOMES.labels("location_not_ready").inc()
+
+    return TaskRunBatchOut(results=results)
+
+
+@router.websocket("/pings")
+async def stream_pings(websocket: WebSocket):
+    """Stream location pings; only enter/exit/dwell transitions are sent back and stored.
+
+    The handshake authenticates like the HTTP routes (bearer header, `?token=` or
+    X-Demo-Token). The first message is `{"task_ids": [...]}`, answered with
+    `{"type": "ready", "task_ids": [...], "unknown": [...]}`. Every later message is a
+    ping `{"lat", "lng", "accuracy_m", "ts"}`; pings that change the worker's presence are
+    answered with `{"type": "events", "events": [...]}` (app/services/presence.py).
+    """
+    user = websocket_user(websocket)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated")
+        return
+    # the token was verified once; re-checking the cached verdict per ping ends the stream at exp
+    token = websocket_token(websocket) if user is not DEMO_USER else None
+    await websocket.accept()
+    try:
+        try:
+            subscribe = PingSubscribe.model_validate_json(await websocket.receive_text())
+        except ValidationError:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason='Expected {"task_ids": [...]}')
+            return
+        task_ids = list(dict.fromkeys(subscribe.task_ids))
+        if len(task_ids) > settings.PING_MAX_TASKS:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION,
+                                  reason=f"At most {settings.PING_MAX_TASKS} tasks per connection")
+            return
+        async with async_session() as db:
+            geos = {task_id: await aget_store_geofence(db, task_id) for task_id in task_ids}
+        known = [task_id for task_id, geo in geos.items() if geo and geo.task_active]
+        await websocket.send_json({
+            "type": "ready", "task_ids": known, "unknown": [t for t in task_ids if t not in known],
+        })
+        if not known:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Task not found")
+            return
 
-    return TaskRunOut(allowed=bool(within), distance_m=distance)
+        tracker = PresenceTracker(known)
+        min_interval = settings.PING_MIN_INTERVAL_MS / 1000
+        last_at = None
+        while True:
+            message = await websocket.receive_text()
+            if token is not None:
+                try:
+                    verify_token(token)
+                except (jwt.PyJWTError, KeyError):
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expired")
+                    return
+            try:
+                ping = LocationPing.model_validate_json(message)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": e.errors(include_url=False, include_context=False)})
+                continue
+            at = time.monotonic()
+            if last_at is not None and at - last_at < min_interval:
+                PRESENCE_EVENTS.labels("throttled").inc()
+                continue
+            last_at = at
+            async with async_session() as db:
+                transitions = await process_ping(db, tracker, ping.lat, ping.lng, ping.accuracy_m, ping.ts, at)
+                await record_transitions(db, user.sub, transitions)
+            if transitions:
+                await websocket.send_json({"type": "events", "events": [t.to_json() for t in transitions]})
+    except WebSocketDisconnect:
+        return
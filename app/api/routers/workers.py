@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.api.pagination import run_page_response
+from app.core.auth import get_current_user
+from app.core.config import settings
+
+router = APIRouter()
+
+@router.get("/{worker_id}/runs")
+async def list_worker_runs(
+    worker_id: str,
+    limit: int = Query(settings.TASK_RUN_PAGE_SIZE, ge=1, le=settings.TASK_RUN_PAGE_MAX),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user=Depends(get_current_user),
+):
+    # workers see their own history, admins anyone's
+    if user.role != "admin" and user.sub != worker_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return run_page_response("worker", worker_id, limit, cursor, since, until)
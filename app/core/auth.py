@@ -1,9 +1,14 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from fastapi import Depends, HTTPException, status, Header
+from fastapi import Depends, HTTPException, status, Header, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from pydantic import BaseModel
 from app.core.config import settings
+from app.core.metrics import stage
 
 security = HTTPBearer(auto_error=False)
 
@@ -11,26 +16,120 @@ class TokenData(BaseModel):
     sub: str
     role: str
 
+DEMO_USER = TokenData(sub="demo@user", role="worker")
+
 def create_access_token(subject: str, role: str, expires_minutes: int | None = None) -> str:
     now = datetime.now(timezone.utc)
     expire = now + timedelta(minutes=expires_minutes or settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {"sub": subject, "role": role, "iat": int(now.timestamp()), "exp": int(expire.timestamp())}
     return jwt.encode(payload, settings.SECRET_KEY, algorithm="HS256")
 
+
+class TokenCache:
+    """Bounded LRU of verified bearer tokens -> TokenData.
+
+    Keyed by `token_digest`, so raw tokens are not kept and a changed SECRET_KEY misses.
+    An entry expires at the token's `exp`, or after `ttl_sec` if that comes first.
+    Only successfully verified tokens are stored.
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: int):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[bytes, tuple[float, TokenData]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> TokenData | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, user = item
+            # exp is wall-clock epoch seconds, so expiry is too
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, key: bytes, user: TokenData, exp: float | None) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_sec
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+verified_tokens = TokenCache(settings.AUTH_TOKEN_CACHE_MAX_ENTRIES, settings.AUTH_TOKEN_CACHE_TTL_SEC)
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(f"{settings.SECRET_KEY}\0{token}".encode()).digest()
+
+
+def verify_token(token: str) -> TokenData:
+    """Claims of a valid HS256 token, from the cache when it was verified before.
+
+    Raises jwt.PyJWTError (or KeyError without `sub`) for an invalid token.
+    """
+    key = token_digest(token)
+    user = verified_tokens.get(key)
+    if user is not None:
+        return user
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    user = TokenData(sub=payload["sub"], role=payload.get("role", "worker"))
+    verified_tokens.put(key, user, payload.get("exp"))
+    return user
+
+
+# FastAPI resolves a dependency once per request, so routes that use get_current_user
+# both directly and through rate_limit/require_role still authenticate once.
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
     x_demo_token: str | None = Header(default=None, alias="X-Demo-Token")
 ) -> TokenData:
-    if settings.DEMO_TOKEN and x_demo_token == settings.DEMO_TOKEN:
-        return TokenData(sub="demo@user", role="worker")
-    if not credentials:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    token = credentials.credentials
+    with stage("auth"):
+        if settings.DEMO_TOKEN and x_demo_token == settings.DEMO_TOKEN:
+            return DEMO_USER
+        if not credentials:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        try:
+            return verify_token(credentials.credentials)
+        except (jwt.PyJWTError, KeyError):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+def websocket_token(websocket: WebSocket) -> str | None:
+    """Bearer token of a WebSocket handshake: the Authorization header, or the `token`
+    query parameter for clients (browsers) that cannot set headers on a WebSocket."""
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials
+    return websocket.query_params.get("token")
+
+
+def websocket_user(websocket: WebSocket) -> TokenData | None:
+    """get_current_user for a WebSocket handshake; None instead of 401."""
+    if settings.DEMO_TOKEN and websocket.headers.get("x-demo-token") == settings.DEMO_TOKEN:
+        return DEMO_USER
+    token = websocket_token(websocket)
+    if not token:
+        return None
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        return TokenData(sub=payload["sub"], role=payload.get("role", "worker"))
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        return verify_token(token)
+    except (jwt.PyJWTError, KeyError):
+        return None
 
 def require_role(expected: str):
     async def dep(user: TokenData = Depends(get_current_user)):
@@ -38,4 +137,3 @@ def require_role(expected: str):
             raise HTTPException(status_code=403, detail="Forbidden")
         return user
     return dep
-
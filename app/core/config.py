@@ -6,6 +6,10 @@ class Settings(BaseModel):
     SECRET_KEY: str = os.getenv("SECRET_KEY", "changeme")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
     DEMO_TOKEN: str | None = os.getenv("DEMO_TOKEN")
+    # Verified bearer tokens are cached per process until their exp, and re-verified at
+    # least every AUTH_TOKEN_CACHE_TTL_SEC; 0 entries disables the cache
+    AUTH_TOKEN_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+    AUTH_TOKEN_CACHE_TTL_SEC: int = int(os.getenv("AUTH_TOKEN_CACHE_TTL_SEC", "300"))
 
     POSTGRES_HOST: str = os.getenv("POSTGRES_HOST", "localhost")
     POSTGRES_PORT: int = int(os.getenv("POSTGRES_PORT", "5432"))
@@ -13,12 +17,134 @@ class Settings(BaseModel):
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "geofence")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "geofence")
 
+    # Shared by the sync (psycopg2) and async (asyncpg) engines, per engine and process
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT_SEC: float = float(os.getenv("DB_POOL_TIMEOUT_SEC", "30"))
+    # -1 disables recycling; with pre-ping off, recycle below the server/proxy idle timeout
+    DB_POOL_RECYCLE_SEC: int = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+    # pre-ping costs a round trip per checkout; turn it off when recycle already covers stale connections
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+    # /readyz fails once checked-out connections reach this share of pool_size + max_overflow
+    DB_POOL_READY_MAX_SATURATION: float = float(os.getenv("DB_POOL_READY_MAX_SATURATION", "1.0"))
+
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    # Redis errors: "open" lets the request through, "closed" answers 503
+    RATE_LIMIT_FAIL_MODE: str = os.getenv("RATE_LIMIT_FAIL_MODE", "open")
+    # reject users Redis already limited, until their retry time, without a Redis round trip
+    RATE_LIMIT_LOCAL_PREFILTER: bool = os.getenv("RATE_LIMIT_LOCAL_PREFILTER", "true").lower() in ("1", "true", "yes")
+    # Geocode providers tried in order: local (offline gazetteer) | google | nominatim.
+    # A leading "local" is consulted before the geocode cache, the rest on a cache miss.
+    GEOCODE_PROVIDERS: str = os.getenv("GEOCODE_PROVIDERS", "local,google")
+    # compiled gazetteer file (scripts/build_gazetteer.py); unset disables the local provider
+    GEOCODE_GAZETTEER_PATH: str = os.getenv("GEOCODE_GAZETTEER_PATH", "")
+    # gazetteer matches "local" may answer with: address | postal_code | locality. Centroids can
+    # be kilometres off; a GeoNames postal-code build only has postal_code,locality entries.
+    GEOCODE_LOCAL_PRECISIONS: str = os.getenv("GEOCODE_LOCAL_PRECISIONS", "address")
     GOOGLE_MAPS_API_KEY: str = os.getenv("GOOGLE_MAPS_API_KEY", "")
+    # point at a local mock geocoder for benchmarks and offline development
+    GOOGLE_GEOCODE_URL: str = os.getenv("GOOGLE_GEOCODE_URL", "https://maps.googleapis.com/maps/api/geocode/json")
+    NOMINATIM_URL: str = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+    NOMINATIM_USER_AGENT: str = os.getenv("NOMINATIM_USER_AGENT", "geofence-mvp")
+    # Shared geocoder HTTP client (per worker process): connection cap and per-request timeout
+    GEOCODE_HTTP_MAX_CONNECTIONS: int = int(os.getenv("GEOCODE_HTTP_MAX_CONNECTIONS", "20"))
+    GEOCODE_HTTP_TIMEOUT_SEC: float = float(os.getenv("GEOCODE_HTTP_TIMEOUT_SEC", "10"))
+    # geocoder requests in flight per geocode_stores batch task
+    GEOCODE_CONCURRENCY: int = int(os.getenv("GEOCODE_CONCURRENCY", "10"))
+    # cluster-wide requests/sec per provider (Redis token bucket); unlisted providers are unthrottled
+    GEOCODE_PROVIDER_QPS: str = os.getenv("GEOCODE_PROVIDER_QPS", "google=50,nominatim=1")
+    # enqueue_geocode retries: exponential backoff with equal jitter, capped
+    GEOCODE_MAX_RETRIES: int = int(os.getenv("GEOCODE_MAX_RETRIES", "5"))
+    GEOCODE_RETRY_BASE_SEC: float = float(os.getenv("GEOCODE_RETRY_BASE_SEC", "10"))
+    GEOCODE_RETRY_MAX_SEC: float = float(os.getenv("GEOCODE_RETRY_MAX_SEC", "600"))
+    # a store with a pending enqueue_geocode is not queued again for this long (covers all retries)
+    GEOCODE_DEDUP_TTL_SEC: int = int(os.getenv("GEOCODE_DEDUP_TTL_SEC", "7200"))
+
+    # Geocode cache: Redis tier TTL, and max age of a Postgres entry before it is re-geocoded
+    GEOCODE_CACHE_TTL_SEC: int = int(os.getenv("GEOCODE_CACHE_TTL_SEC", str(30 * 24 * 3600)))
+    GEOCODE_CACHE_MAX_AGE_DAYS: int = int(os.getenv("GEOCODE_CACHE_MAX_AGE_DAYS", "365"))
+
+    # Bulk store import: rows per INSERT/commit, and store ids per Celery geocode task
+    STORE_IMPORT_CHUNK_SIZE: int = int(os.getenv("STORE_IMPORT_CHUNK_SIZE", "1000"))
+    GEOCODE_BATCH_SIZE: int = int(os.getenv("GEOCODE_BATCH_SIZE", "50"))
+
+    # task_runs partition maintenance (scripts/task_runs_partitions.py): months created ahead,
+    # months kept attached (0 keeps everything) and what happens to older ones: detach | archive | drop
+    TASK_RUNS_PARTITIONS_AHEAD: int = int(os.getenv("TASK_RUNS_PARTITIONS_AHEAD", "3"))
+    TASK_RUNS_RETAIN_MONTHS: int = int(os.getenv("TASK_RUNS_RETAIN_MONTHS", "0"))
+    TASK_RUNS_RETIRE_MODE: str = os.getenv("TASK_RUNS_RETIRE_MODE", "detach")
+
+    # task_runs writes from POST /tasks/{id}/run: sync (INSERT + commit per request) or
+    # write-behind through a redis stream / in-process memory queue (app/services/run_buffer.py)
+    TASK_RUN_WRITE_MODE: str = os.getenv("TASK_RUN_WRITE_MODE", "sync")
+    TASK_RUN_FLUSH_BATCH: int = int(os.getenv("TASK_RUN_FLUSH_BATCH", "500"))
+    # how long a flusher waits for the first record of a batch
+    TASK_RUN_FLUSH_INTERVAL_MS: int = int(os.getenv("TASK_RUN_FLUSH_INTERVAL_MS", "200"))
+    # memory mode: queued runs before requests fall back to inline writes
+    TASK_RUN_BUFFER_MAX: int = int(os.getenv("TASK_RUN_BUFFER_MAX", "100000"))
+    TASK_RUN_STREAM: str = os.getenv("TASK_RUN_STREAM", "task_runs:buffer")
+    # approximate stream cap; a backlog beyond it loses the oldest unflushed runs
+    TASK_RUN_STREAM_MAXLEN: int = int(os.getenv("TASK_RUN_STREAM_MAXLEN", "1000000"))
+    # redis mode: entries a dead flusher left unacked are claimed after this idle time
+    TASK_RUN_CLAIM_IDLE_MS: int = int(os.getenv("TASK_RUN_CLAIM_IDLE_MS", "60000"))
+    # how long an accepted client_run_id is remembered to drop client retries
+    TASK_RUN_DEDUP_TTL_SEC: int = int(os.getenv("TASK_RUN_DEDUP_TTL_SEC", "86400"))
+    # run a flusher inside each API process; turn off when scripts/run_writer.py does it
+    TASK_RUN_FLUSHER_IN_API: bool = os.getenv("TASK_RUN_FLUSHER_IN_API", "true").lower() in ("1", "true", "yes")
+
+    # Run history pages (GET /tasks|stores|workers/{id}/runs) and the task_run_daily rollup,
+    # refreshed by Celery beat every TASK_RUN_ROLLUP_INTERVAL_SEC for the last LOOKBACK days
+    TASK_RUN_PAGE_SIZE: int = int(os.getenv("TASK_RUN_PAGE_SIZE", "100"))
+    TASK_RUN_PAGE_MAX: int = int(os.getenv("TASK_RUN_PAGE_MAX", "1000"))
+    TASK_RUN_ROLLUP_INTERVAL_SEC: int = int(os.getenv("TASK_RUN_ROLLUP_INTERVAL_SEC", "300"))
+    TASK_RUN_ROLLUP_LOOKBACK_DAYS: int = int(os.getenv("TASK_RUN_ROLLUP_LOOKBACK_DAYS", "1"))
+
+    # rows per server-side cursor fetch and per encoded chunk of a task_runs export
+    TASK_RUN_EXPORT_CHUNK_ROWS: int = int(os.getenv("TASK_RUN_EXPORT_CHUNK_ROWS", "5000"))
+
+    # Encoder of the lean JSON responses (app/api/responses.py): json | orjson
+    JSON_ENCODER: str = os.getenv("JSON_ENCODER", "json")
+
+    # Geofence distance backend: postgis | geodesic | haversine (see app/services/distances.py)
+    DISTANCE_BACKEND: str = os.getenv("DISTANCE_BACKEND", "geodesic")
+    # Check-in decisions (app/services/decision.py): equirectangular early exit before the
+    # backend, and the verdict when the GPS accuracy circle straddles the edge: center | allow | deny
+    GEOFENCE_FAST_TIER: bool = os.getenv("GEOFENCE_FAST_TIER", "true").lower() in ("1", "true", "yes")
+    GEOFENCE_UNCERTAIN_POLICY: str = os.getenv("GEOFENCE_UNCERTAIN_POLICY", "center")
+
+    # Streamed location pings (WS /tasks/pings, app/services/presence.py): one dwell event per
+    # visit after PING_DWELL_SEC inside, pings closer than PING_MIN_INTERVAL_MS are dropped,
+    # at most PING_MAX_TASKS tasks per connection
+    PING_DWELL_SEC: int = int(os.getenv("PING_DWELL_SEC", "300"))
+    PING_MIN_INTERVAL_MS: int = int(os.getenv("PING_MIN_INTERVAL_MS", "1000"))
+    PING_MAX_TASKS: int = int(os.getenv("PING_MAX_TASKS", "20"))
+
+    # Redis pub/sub channel announcing store/company changes to every process's caches
+    # (app/services/change_feed.py); with it on, the cache TTLs below can be long
+    CHANGE_FEED_ENABLED: bool = os.getenv("CHANGE_FEED_ENABLED", "true").lower() in ("1", "true", "yes")
+    CHANGE_FEED_CHANNEL: str = os.getenv("CHANGE_FEED_CHANNEL", "geofence:changes")
+
+    # In-process task -> store geofence cache used by POST /tasks/{id}/run
+    STORE_CACHE_TTL_SEC: int = int(os.getenv("STORE_CACHE_TTL_SEC", "300"))
+    STORE_CACHE_MAX_ENTRIES: int = int(os.getenv("STORE_CACHE_MAX_ENTRIES", "10000"))
+    # Prepared polygon geofences kept per process (same TTL)
+    STORE_FENCE_CACHE_MAX_ENTRIES: int = int(os.getenv("STORE_FENCE_CACHE_MAX_ENTRIES", "2000"))
+
+    # Geohash cell index of store geofences (app/services/cell_index.py): finest precision,
+    # coarsest fallback for large fences, cells per store before falling back, and how
+    # often each process reloads its in-memory copy
+    STORE_CELL_PRECISION: int = int(os.getenv("STORE_CELL_PRECISION", "7"))
+    STORE_CELL_MIN_PRECISION: int = int(os.getenv("STORE_CELL_MIN_PRECISION", "4"))
+    STORE_CELL_MAX_CELLS: int = int(os.getenv("STORE_CELL_MAX_CELLS", "2000"))
+    STORE_CELL_INDEX_TTL_SEC: int = int(os.getenv("STORE_CELL_INDEX_TTL_SEC", "60"))
 
     @property
     def DATABASE_URL(self) -> str:
         return f"postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
 settings = Settings()
 
@@ -1,9 +1,52 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.core.config import settings
+from app.core.metrics import DB_POOL_CHECKOUT_FAILURES, DB_POOL_CHECKOUT_SECONDS, register_pool
 
-engine = create_engine(settings.DATABASE_URL, future=True, pool_pre_ping=True)
+
+class _InstrumentedPoolMixin:
+    """Times every checkout and counts failures; the engine label is the pool's logging name."""
+
+    def connect(self):
+        engine = self._orig_logging_name or "default"
+        started = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_FAILURES.labels(engine, "timeout").inc()
+            raise
+        except Exception:
+            DB_POOL_CHECKOUT_FAILURES.labels(engine, "error").inc()
+            raise
+        DB_POOL_CHECKOUT_SECONDS.labels(engine).observe(time.perf_counter() - started)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options(name: str) -> dict:
+    return {
+        "pool_logging_name": name,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SEC,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SEC,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(settings.DATABASE_URL, future=True, poolclass=InstrumentedQueuePool, **_pool_options("sync"))
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+register_pool("sync", lambda: engine.pool)
 
 class Base(DeclarativeBase):
     pass
@@ -15,3 +58,43 @@ def get_db():
     finally:
         db.close()
 
+
+# Async (asyncpg) engine for the hot handlers; created on first use so processes that
+# never touch it (Celery worker, scripts, alembic) don't need asyncpg.
+_async_engine: AsyncEngine | None = None
+_AsyncSessionLocal: async_sessionmaker[AsyncSession] | None = None
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        _async_engine = create_async_engine(
+            settings.ASYNC_DATABASE_URL, poolclass=InstrumentedAsyncQueuePool, **_pool_options("async")
+        )
+        _AsyncSessionLocal = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+def async_session() -> AsyncSession:
+    """A new AsyncSession, for code that outlives the request's dependencies (streamed bodies)."""
+    get_async_engine()
+    return _AsyncSessionLocal()
+
+async def get_async_db():
+    async with async_session() as db:
+        yield db
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine, _AsyncSessionLocal = None, None
+
+register_pool("async", lambda: _async_engine.sync_engine.pool if _async_engine is not None else None)
+
+
+def pool_saturation() -> dict[str, float]:
+    """Checked-out connections over pool_size + max_overflow, per live engine."""
+    capacity = max(1, settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW)
+    out = {"sync": engine.pool.checkedout() / capacity}
+    if _async_engine is not None:
+        out["async"] = _async_engine.sync_engine.pool.checkedout() / capacity
+    return out
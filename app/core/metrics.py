@@ -0,0 +1,165 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy.pool import Pool
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route template",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+HTTP_REQUEST_STAGE_SECONDS = Histogram(
+    "http_request_stage_seconds",
+    "Time spent in named stages of a request (auth, rate_limit, lookup, distance, insert, commit)",
+    ["route", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+CHECKIN_OUTCOMES = Counter(
+    "checkin_outcomes_total",
+    "Check-in decisions: allowed, denied, location_not_ready (409)",
+    ["outcome"],
+)
+GEOCODE_CACHE_LOOKUPS = Counter(
+    "geocode_cache_lookups_total",
+    "Geocode lookups by where they were answered: local (gazetteer), redis, db (cache hits) or provider (miss)",
+    ["source"],
+)
+TASK_RUN_BUFFER_RECORDS = Counter(
+    "task_run_buffer_records_total",
+    "Write-behind task runs: buffered, duplicate (client retry), inline (buffer unavailable), "
+    "written, redelivered (already in task_runs), dropped (rejected by the database)",
+    ["outcome"],
+)
+TASK_RUN_BUFFER_FLUSH_SECONDS = Histogram(
+    "task_run_buffer_flush_seconds",
+    "Time to COPY one buffered batch into task_runs",
+    buckets=_LATENCY_BUCKETS,
+)
+
+GEOFENCE_DECISIONS = Counter(
+    "geofence_decisions_total",
+    "Check-in geofence decisions by tier (fast: equirectangular early exit, exact: distance backend, "
+    "polygon) and result (allowed, denied, uncertain)",
+    ["tier", "result"],
+)
+
+PRESENCE_EVENTS = Counter(
+    "presence_events_total",
+    "Location pings over WS /tasks/pings (ping, throttled) and the transitions they produced "
+    "(enter, exit, dwell); only transitions are written to task_runs",
+    ["kind"],
+)
+CHANGE_FEED_EVENTS = Counter(
+    "change_feed_events_total",
+    "Store cache changes published by this process or applied from other processes",
+    ["kind", "direction"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Time to check a connection out of the pool (queue wait, connect and pre-ping)",
+    ["engine"],
+    buckets=_LATENCY_BUCKETS + (30,),
+)
+DB_POOL_CHECKOUT_FAILURES = Counter(
+    "db_pool_checkout_failures_total",
+    "Connection checkouts that raised (reason=timeout is QueuePool exhaustion)",
+    ["engine", "reason"],
+)
+
+# Stages recorded while serving the current request; set by MetricsMiddleware.
+_request_stages: ContextVar[list | None] = ContextVar("request_stages", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the current request (no-op outside a request)."""
+    stages = _request_stages.get()
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages.append((name, time.perf_counter() - started))
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware: latency per route template plus the stages recorded by `stage()`.
+
+    Everything is observed after the response is sent, in one place.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages: list = []
+        token = _request_stages.set(stages)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stages.reset(token)
+            # the router stores the matched route in the (shared) scope; unmatched paths share one label
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(elapsed)
+            for name, seconds in stages:
+                HTTP_REQUEST_STAGE_SECONDS.labels(path, name).observe(seconds)
+
+
+# engine label -> callable returning that engine's current pool (pools are replaced on dispose)
+_pool_sources: dict[str, Callable[[], Pool | None]] = {}
+
+
+def register_pool(engine: str, source: Callable[[], Pool | None]) -> None:
+    _pool_sources[engine] = source
+
+
+class PoolCollector:
+    """Reads pool gauges at scrape time, so checkouts pay nothing for them."""
+
+    def collect(self):
+        gauges = {
+            "size": GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["engine"]),
+            "checked_out": GaugeMetricFamily("db_pool_checked_out", "Connections currently checked out", labels=["engine"]),
+            "checked_in": GaugeMetricFamily("db_pool_checked_in", "Idle connections in the pool", labels=["engine"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Current overflow (negative while the pool is still filling)", labels=["engine"]),
+        }
+        for engine, source in _pool_sources.items():
+            pool = source()
+            if pool is None or not hasattr(pool, "checkedout"):
+                continue
+            gauges["size"].add_metric([engine], pool.size())
+            gauges["checked_out"].add_metric([engine], pool.checkedout())
+            gauges["checked_in"].add_metric([engine], pool.checkedin())
+            gauges["overflow"].add_metric([engine], pool.overflow())
+        yield from gauges.values()
+
+
+REGISTRY.register(PoolCollector())
+
+
+def render_latest() -> tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,29 +1,114 @@
 from __future__ import annotations
+import threading
 import time
 from typing import Callable
 from fastapi import HTTPException, Depends
 import redis
 from app.core.config import settings
 from app.core.auth import get_current_user, TokenData
+from app.core.metrics import stage
 
 try:
     _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
 except Exception:
     _redis = None
 
+# GCRA (a token bucket of `limit` tokens refilled over `window`) in one atomic EVALSHA:
+# read the theoretical arrival time, decide, write it back with its own expiry.
+# Returns {allowed, retry_after_ms}. Times are integer milliseconds from the caller.
+_GCRA_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local interval = window / limit
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - window
+if allow_at > now then
+  return {0, math.ceil(allow_at - now)}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, 0}
+"""
+
+_gcra_script = None
+
+
+def run_gcra(client, key: str, limit: int, window_ms: int) -> tuple[int, int]:
+    # Script runs EVALSHA and reloads itself after a SCRIPT FLUSH or on a new server
+    global _gcra_script
+    if _gcra_script is None:
+        _gcra_script = client.register_script(_GCRA_LUA)
+    allowed, retry_after_ms = _gcra_script(keys=[key], args=[limit, window_ms, int(time.time() * 1000)], client=client)
+    return int(allowed), int(retry_after_ms)
+
+
+class LocalBlocklist:
+    """In-process pre-filter: remembers users Redis already rejected until their retry time.
+
+    Requests from a blocked user are answered with 429 without a Redis round trip.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._until: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: str) -> float:
+        until = self._until.get(key)
+        if until is None:
+            return 0.0
+        remaining = until - time.monotonic()
+        if remaining <= 0:
+            self._until.pop(key, None)
+            return 0.0
+        return remaining
+
+    def block(self, key: str, seconds: float) -> None:
+        with self._lock:
+            if len(self._until) >= self.max_entries:
+                now = time.monotonic()
+                self._until = {k: v for k, v in self._until.items() if v > now}
+                if len(self._until) >= self.max_entries:
+                    return
+            self._until[key] = time.monotonic() + seconds
+
+    def clear(self) -> None:
+        with self._lock:
+            self._until.clear()
+
+
+local_blocks = LocalBlocklist()
+
+
+def _too_many(bucket: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded for {bucket}",
+        headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+    )
+
+
 def rate_limit(bucket: str, limit: int, window_sec: int) -> Callable[[TokenData], None]:
     def _inner(user: TokenData = Depends(get_current_user)):
         if _redis is None:
             return
+        key = f"rl:{bucket}:{user.sub}"
+        if settings.RATE_LIMIT_LOCAL_PREFILTER:
+            blocked_for = local_blocks.retry_after(key)
+            if blocked_for > 0:
+                raise _too_many(bucket, blocked_for)
         try:
-            now = int(time.time())
-            key = f"rl:{bucket}:{user.sub}:{now // window_sec}"
-            current = _redis.incr(key)
-            if current == 1:
-                _redis.expire(key, window_sec)
-            if current > limit:
-                raise HTTPException(status_code=429, detail=f"Rate limit exceeded for {bucket}")
-        except Exception:
+            with stage("rate_limit"):
+                allowed, retry_after_ms = run_gcra(_redis, key, limit, window_sec * 1000)
+        except redis.RedisError:
+            if settings.RATE_LIMIT_FAIL_MODE == "closed":
+                raise HTTPException(status_code=503, detail="Rate limiter unavailable")
             return
+        if not allowed:
+            retry_after = retry_after_ms / 1000
+            if settings.RATE_LIMIT_LOCAL_PREFILTER:
+                local_blocks.block(key, retry_after)
+            raise _too_many(bucket, retry_after)
     return _inner
-
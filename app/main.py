@@ -1,10 +1,30 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
 from sqlalchemy import text
 from app.core.config import settings
 from app.api.routes import router as api_router
-from app.core.db import engine
+from app.core.db import engine, dispose_async_engine, pool_saturation
+from app.core.metrics import MetricsMiddleware, render_latest
+from app.services.change_feed import start_change_feed, stop_change_feed
+from app.services.run_buffer import start_flusher, stop_flusher
 
-app = FastAPI(title="Store Geofence MVP", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the memory buffer can only be drained by the process that holds it
+    if settings.TASK_RUN_FLUSHER_IN_API or settings.TASK_RUN_WRITE_MODE == "memory":
+        await start_flusher(engine)
+    await start_change_feed()
+    yield
+    await stop_change_feed()
+    # flush what is still buffered before the engines go away
+    await stop_flusher()
+    # asyncpg connections are bound to the loop that opened them
+    await dispose_async_engine()
+
+
+app = FastAPI(title="Store Geofence MVP", version="0.1.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/healthz")
 def healthz():
@@ -21,12 +41,22 @@ def healthz():
 
 @app.get("/readyz")
 def readyz():
-    # Readiness check: report non-200 if DB isn't available.
+    # Readiness check: report non-200 if DB isn't available or the pool is exhausted.
+    # Saturation is checked first so a full pool doesn't block this probe for pool_timeout.
+    saturation = pool_saturation()
+    if max(saturation.values()) >= settings.DB_POOL_READY_MAX_SATURATION:
+        raise HTTPException(status_code=503, detail={"error": "db pool saturated", "pool_saturation": saturation})
     try:
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
     except Exception:
         raise HTTPException(status_code=503, detail="db not ready")
-    return {"status": "ready", "env": settings.APP_ENV}
+    return {"status": "ready", "env": settings.APP_ENV, "pool_saturation": saturation}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
 
 app.include_router(api_router)
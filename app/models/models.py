@@ -1,7 +1,9 @@
 # app/models/models.py
 from __future__ import annotations
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, DateTime, func, Numeric
+import uuid
+from datetime import date, datetime
+from sqlalchemy import BigInteger, Column, Integer, String, ForeignKey, Boolean, Text, Date, DateTime, func, Float, Index, Sequence
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 from geoalchemy2 import Geography
 from app.core.db import Base
@@ -26,16 +28,33 @@ class Store(Base):
 
     # geography(Point, 4326), nullable until geocoded
     location = Column(Geography(geometry_type="POINT", srid=4326), nullable=True)
+    # optional polygon geofence; when set it replaces the radius check (app/services/polygons.py)
+    geofence = Column(Geography(geometry_type="MULTIPOLYGON", srid=4326), nullable=True)
 
     geocode_status: Mapped[str] = mapped_column(String(20), default="pending")  # pending/success/failed
     custom_radius_m: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    import_id: Mapped[int | None] = mapped_column(ForeignKey("store_imports.id"), nullable=True, index=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class StoreImport(Base):
+    __tablename__ = "store_imports"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    company_id: Mapped[int] = mapped_column(ForeignKey("companies.id"), nullable=False)
+    source: Mapped[str] = mapped_column(String(20), nullable=False)  # csv/ndjson
+    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued/running/done/failed
+    total_rows: Mapped[int] = mapped_column(Integer, default=0)
+    inserted: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    error_msg: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class GeocodeJob(Base):
     __tablename__ = "geocode_jobs"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    store_id: Mapped[int] = mapped_column(ForeignKey("stores.id"), nullable=False)
+    # one row per store, reused by every attempt and manual retry
+    store_id: Mapped[int] = mapped_column(ForeignKey("stores.id"), nullable=False, unique=True)
     status: Mapped[str] = mapped_column(String(20), default="queued")  # queued/running/success/failed
     provider: Mapped[str] = mapped_column(String(40), default="google")
     attempts: Mapped[int] = mapped_column(Integer, default=0)
@@ -43,8 +62,18 @@ class GeocodeJob(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+class GeocodeCacheEntry(Base):
+    __tablename__ = "geocode_cache"
+    address_key: Mapped[str] = mapped_column(Text, primary_key=True)  # normalize_address() output
+    lat: Mapped[float] = mapped_column(Float(precision=53), nullable=False)
+    lng: Mapped[float] = mapped_column(Float(precision=53), nullable=False)
+    provider: Mapped[str] = mapped_column(String(40), nullable=False)
+    precision: Mapped[str | None] = mapped_column(String(40), nullable=True)  # e.g. ROOFTOP/APPROXIMATE
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (Index("ix_tasks_store_id", "store_id", "id"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     store_id: Mapped[int] = mapped_column(ForeignKey("stores.id"), nullable=False)
     title: Mapped[str] = mapped_column(String(200), nullable=False)
@@ -53,14 +82,48 @@ class Task(Base):
     created_by: Mapped[str | None] = mapped_column(String(120), nullable=True)
 
 class TaskRun(Base):
+    # RANGE-partitioned by created_at, one partition per month (migration 0007,
+    # app/services/partitions.py), so the partition key is part of the primary key.
     __tablename__ = "task_runs"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    __table_args__ = (
+        Index("ix_task_runs_task_id_created_at", "task_id", "created_at"),
+        Index("ix_task_runs_worker_id_created_at", "worker_id", "created_at"),
+        Index("uq_task_runs_client_run_id_created_at", "client_run_id", "created_at", unique=True),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    id: Mapped[int] = mapped_column(BigInteger, Sequence("task_runs_id_seq"), primary_key=True)
     task_id: Mapped[int] = mapped_column(ForeignKey("tasks.id"), nullable=False)
     worker_id: Mapped[str] = mapped_column(String(120), nullable=False)
+    # idempotency key from the client (or generated); write-behind replays are deduplicated on it
+    client_run_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
 
     # client reported location
     client_location = Column(Geography(geometry_type="POINT", srid=4326), nullable=False)
 
-    distance_m: Mapped[float] = mapped_column(Numeric(10, 2))
+    distance_m: Mapped[float] = mapped_column(Float(precision=53), nullable=False)
     allowed: Mapped[bool] = mapped_column(Boolean, default=False)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    # device time for check-ins uploaded later (POST /tasks/runs:batch)
+    client_ts: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # enter | exit | dwell for presence transitions from WS /tasks/pings, NULL for check-ins
+    event: Mapped[str | None] = mapped_column(String(10), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+
+class TaskRunDaily(Base):
+    # per store, per UTC day rollup of task_runs (app/services/run_rollup.py)
+    __tablename__ = "task_run_daily"
+    store_id: Mapped[int] = mapped_column(ForeignKey("stores.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, nullable=False)
+    allowed: Mapped[int] = mapped_column(Integer, nullable=False)
+    distance_p50: Mapped[float | None] = mapped_column(Float(precision=53), nullable=True)
+    distance_p90: Mapped[float | None] = mapped_column(Float(precision=53), nullable=True)
+    distance_p99: Mapped[float | None] = mapped_column(Float(precision=53), nullable=True)
+    # counts per run_rollup.DISTANCE_BUCKETS_M bucket
+    distance_histogram: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    refreshed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+class StoreCell(Base):
+    # geohash cells covered by a store's geofence (app/services/cell_index.py)
+    __tablename__ = "store_cells"
+    cell: Mapped[str] = mapped_column(String(12), primary_key=True)
+    store_id: Mapped[int] = mapped_column(ForeignKey("stores.id", ondelete="CASCADE"), primary_key=True, index=True)
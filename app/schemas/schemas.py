@@ -1,3 +1,5 @@
+from datetime import date, datetime
+from uuid import UUID
 from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional, Literal
 
@@ -23,6 +25,11 @@ class CompanyOut(BaseModel):
 class CompanyUpdate(BaseModel):
     geofence_radius_m: int
 
+class GeofencePolygon(BaseModel):
+    # GeoJSON geometry, [lng, lat] positions
+    type: Literal["Polygon", "MultiPolygon"]
+    coordinates: list
+
 class StoreCreate(BaseModel):
     company_id: int
     name: str
@@ -31,6 +38,8 @@ class StoreCreate(BaseModel):
     country: str
     state: Optional[str] = None
     postal_code: Optional[str] = None
+    # optional polygon geofence; replaces the radius check for this store
+    geofence: Optional[GeofencePolygon] = None
 
 class StoreOut(BaseModel):
     id: int
@@ -40,6 +49,27 @@ class StoreOut(BaseModel):
     custom_radius_m: Optional[int] = None
     model_config = ConfigDict(from_attributes=True)
 
+class StoreImportOut(BaseModel):
+    id: int
+    company_id: int
+    source: str
+    status: str
+    total_rows: int
+    inserted: int
+    failed: int
+    error_msg: Optional[str] = None
+    # geocode_status -> number of stores from this import
+    geocoding: dict[str, int] = {}
+    model_config = ConfigDict(from_attributes=True)
+
+class StoreNearbyOut(BaseModel):
+    id: int
+    company_id: int
+    name: str
+    distance_m: float
+    radius_m: int
+    within: bool
+
 class TaskCreate(BaseModel):
     store_id: int
     title: str
@@ -56,8 +86,58 @@ class TaskOut(BaseModel):
 class TaskRunRequest(BaseModel):
     lat: float
     lng: float
-    accuracy_m: Optional[float] = None
+    # radius of the GPS uncertainty circle; check-ins straddling the geofence edge are "uncertain"
+    accuracy_m: Optional[float] = Field(None, ge=0)
+    # idempotency key: a retried check-in with the same id is recorded once
+    client_run_id: Optional[UUID] = None
 
 class TaskRunOut(BaseModel):
     allowed: bool
     distance_m: float
+    decision: Optional[Literal["allowed", "denied", "uncertain"]] = None
+
+class TaskRunBatchItem(TaskRunRequest):
+    task_id: int
+    client_ts: Optional[datetime] = None
+
+class TaskRunBatchRequest(BaseModel):
+    items: list[TaskRunBatchItem] = Field(..., min_length=1, max_length=1000)
+
+class TaskRunBatchResult(BaseModel):
+    task_id: int
+    status: int
+    allowed: bool = False
+    distance_m: Optional[float] = None
+    decision: Optional[Literal["allowed", "denied", "uncertain"]] = None
+    detail: Optional[str] = None
+
+class TaskRunBatchOut(BaseModel):
+    results: list[TaskRunBatchResult]
+
+# WS /tasks/pings: the first message names the tasks, every later one is a ping
+class PingSubscribe(BaseModel):
+    task_ids: list[int] = Field(..., min_length=1)
+
+class LocationPing(BaseModel):
+    lat: float = Field(..., ge=-90, le=90)
+    lng: float = Field(..., ge=-180, le=180)
+    accuracy_m: Optional[float] = Field(None, ge=0)
+    # device time of the fix, stored as client_ts of the transitions it causes
+    ts: Optional[datetime] = None
+
+class DistanceBucket(BaseModel):
+    # runs with distance below lt_m (and at or above the previous bucket's); None is open-ended
+    lt_m: Optional[int] = None
+    count: int
+
+class TaskRunDailyOut(BaseModel):
+    day: date
+    runs: int
+    allowed: int
+    denied: int
+    allow_rate: float
+    deny_rate: float
+    distance_p50: Optional[float] = None
+    distance_p90: Optional[float] = None
+    distance_p99: Optional[float] = None
+    distance_histogram: list[DistanceBucket]
@@ -0,0 +1,17 @@
+import re
+import unicodedata
+
+_PUNCT = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    """Case-, accent-, punctuation- and whitespace-insensitive key for an address.
+
+    "Khreshchatyk 1; Kyiv, 01001" and "KHRESHCHATYK  1, Kyiv 01001" map to the same key.
+    Used for geocode cache keys and gazetteer keys.
+    """
+    s = unicodedata.normalize("NFKD", address)
+    s = "".join(c for c in s if not unicodedata.combining(c)).casefold()
+    s = _PUNCT.sub(" ", s)
+    return _SPACE.sub(" ", s).strip()
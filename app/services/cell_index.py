@@ -0,0 +1,329 @@
+"""Precomputed geohash cell index: which stores' geofences can contain a point.
+
+Every geocoded (or fenced) store is assigned the geohash cells its geofence touches:
+the circle of its effective radius, or its polygon. Rows live in store_cells (migration
+0011) and are rewritten when a store is geocoded, its polygon changes, or its company's
+radius changes (app/workers/tasks.py). A store is indexed at STORE_CELL_PRECISION, or
+at a coarser precision (down to STORE_CELL_MIN_PRECISION) when its fence would need
+more than STORE_CELL_MAX_CELLS cells.
+
+Each process loads the table into a dict (cell -> store ids). Resolving a ping is then
+one dict lookup per indexed precision, followed by the exact check against the few
+candidate stores; the cells over-cover, never under-cover. Refreshes run in a background
+thread, so lookups never wait for one after the first load: stores reported changed
+(app/services/change_feed.py) are reloaded in place, and the whole index is rebuilt and
+swapped in after STORE_CELL_INDEX_TTL_SEC or a change feed reconnect.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+from dataclasses import dataclass
+import shapely
+from shapely.geometry import box
+from shapely.prepared import prep
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.services import geohash
+from app.services.geodesy import haversine_m, vincenty_m
+from app.services.polygons import PreparedFence, get_fence, metres_per_degree
+
+logger = logging.getLogger(__name__)
+
+INDEX_STORES_SQL = text('''
+    SELECT s.id, ST_Y(s.location::geometry) AS lat, ST_X(s.location::geometry) AS lng,
+           COALESCE(NULLIF(s.custom_radius_m, 0), c.geofence_radius_m) AS radius_m,
+           ST_AsBinary(s.geofence::geometry) AS fence_wkb
+    FROM stores s
+    JOIN companies c ON c.id = s.company_id
+    WHERE s.id = ANY(CAST(:ids AS integer[]))
+      AND (s.geofence IS NOT NULL OR (s.geocode_status = 'success' AND s.location IS NOT NULL))
+''')
+COMPANY_STORES_SQL = text("SELECT id FROM stores WHERE company_id = :company_id")
+DELETE_CELLS_SQL = text("DELETE FROM store_cells WHERE store_id = ANY(CAST(:ids AS integer[]))")
+INSERT_CELLS_SQL = text('''
+    INSERT INTO store_cells (cell, store_id)
+    SELECT * FROM unnest(CAST(:cells AS text[]), CAST(:store_ids AS integer[]))
+''')
+LOAD_CELLS_SQL = text("SELECT cell, store_id FROM store_cells")
+_STORES_SELECT = '''
+    SELECT s.id, s.company_id, s.name, ST_Y(s.location::geometry) AS lat, ST_X(s.location::geometry) AS lng,
+           COALESCE(NULLIF(s.custom_radius_m, 0), c.geofence_radius_m) AS radius_m,
+           s.geofence IS NOT NULL AS has_geofence
+    FROM stores s
+    JOIN companies c ON c.id = s.company_id
+'''
+LOAD_STORES_SQL = text(_STORES_SELECT + "WHERE s.id IN (SELECT DISTINCT store_id FROM store_cells)")
+# a targeted update: the given stores plus every store of the given companies
+_SCOPE = "(s.id = ANY(CAST(:ids AS integer[])) OR s.company_id = ANY(CAST(:company_ids AS integer[])))"
+UPDATE_STORES_SQL = text(_STORES_SELECT + "WHERE " + _SCOPE)
+UPDATE_CELLS_SQL = text(
+    "SELECT sc.cell, sc.store_id FROM store_cells sc JOIN stores s ON s.id = sc.store_id WHERE " + _SCOPE
+)
+
+# a cell is kept if its nearest point is within radius * (1 + margin) + 1 m of the centre
+_MARGIN = 0.01
+
+
+def _precision_for(lat_min: float, lat_max: float, lng_min: float, lng_max: float) -> int:
+    for p in range(settings.STORE_CELL_PRECISION, settings.STORE_CELL_MIN_PRECISION - 1, -1):
+        if geohash.grid_count(lat_min, lat_max, lng_min, lng_max, p) <= settings.STORE_CELL_MAX_CELLS:
+            return p
+    return settings.STORE_CELL_MIN_PRECISION
+
+
+def circle_cells(lat: float, lng: float, radius_m: float) -> set[str]:
+    kx, ky = metres_per_degree(lat)
+    dlat, dlng = radius_m / ky, radius_m / max(kx, 1e-9)
+    box_ = (lat - dlat, lat + dlat, lng - dlng, lng + dlng)
+    reach = radius_m * (1 + _MARGIN) + 1
+    cells = set()
+    for cell, (lat_lo, lat_hi, lng_lo, lng_hi) in geohash.grid(*box_, _precision_for(*box_)):
+        # nearest point of the cell to the centre
+        near_lat = min(max(lat, lat_lo), lat_hi)
+        near_lng = min(max(lng, lng_lo), lng_hi)
+        if haversine_m(lat, lng, near_lat, near_lng) <= reach:
+            cells.add(cell)
+    return cells
+
+
+def polygon_cells(wkb) -> set[str]:
+    geom = shapely.from_wkb(bytes(wkb))
+    lng_min, lat_min, lng_max, lat_max = geom.bounds
+    box_ = (lat_min, lat_max, lng_min, lng_max)
+    fence = prep(geom)
+    return {
+        cell for cell, (lat_lo, lat_hi, lng_lo, lng_hi) in geohash.grid(*box_, _precision_for(*box_))
+        if fence.intersects(box(lng_lo, lat_lo, lng_hi, lat_hi))
+    }
+
+
+def index_stores(db: Session, store_ids: list[int]) -> int:
+    """Recompute store_cells for these stores; the caller commits. Returns rows written.
+
+    Stores that are neither geocoded nor fenced end up with no cells.
+    """
+    if not store_ids:
+        return 0
+    cells: list[str] = []
+    owners: list[int] = []
+    for row in db.execute(INDEX_STORES_SQL, {"ids": store_ids}).mappings():
+        covered = polygon_cells(row["fence_wkb"]) if row["fence_wkb"] is not None else circle_cells(
+            float(row["lat"]), float(row["lng"]), float(row["radius_m"])
+        )
+        cells.extend(covered)
+        owners.extend([row["id"]] * len(covered))
+    db.execute(DELETE_CELLS_SQL, {"ids": store_ids})
+    if cells:
+        db.execute(INSERT_CELLS_SQL, {"cells": cells, "store_ids": owners})
+    return len(cells)
+
+
+def index_company(db: Session, company_id: int) -> int:
+    ids = list(db.execute(COMPANY_STORES_SQL, {"company_id": company_id}).scalars())
+    return index_stores(db, ids)
+
+
+@dataclass(frozen=True)
+class IndexedStore:
+    id: int
+    company_id: int
+    name: str
+    lat: float | None
+    lng: float | None
+    radius_m: int
+    has_geofence: bool
+
+
+def _indexed_store(row) -> IndexedStore:
+    return IndexedStore(
+        id=row["id"], company_id=row["company_id"], name=row["name"],
+        lat=float(row["lat"]) if row["lat"] is not None else None,
+        lng=float(row["lng"]) if row["lng"] is not None else None,
+        radius_m=int(row["radius_m"]), has_geofence=bool(row["has_geofence"]),
+    )
+
+
+class CellIndex:
+    """In-memory cell -> store ids, plus what the exact check needs for each store."""
+
+    def __init__(self, cells: dict[str, tuple[int, ...]], stores: dict[int, IndexedStore]):
+        self.cells = cells
+        self.stores = stores
+        self.precisions = sorted({len(c) for c in cells}, reverse=True)
+        self.loaded_at = time.monotonic()
+        # store id -> its cells, to update one store without a full reload
+        self.store_cells: dict[int, set[str]] = {}
+        for cell, ids in cells.items():
+            for store_id in ids:
+                self.store_cells.setdefault(store_id, set()).add(cell)
+
+    @classmethod
+    def load(cls, db: Session) -> CellIndex:
+        grouped: dict[str, list[int]] = {}
+        for cell, store_id in db.execute(LOAD_CELLS_SQL):
+            grouped.setdefault(cell, []).append(store_id)
+        stores = {row["id"]: _indexed_store(row) for row in db.execute(LOAD_STORES_SQL).mappings()}
+        return cls({cell: tuple(ids) for cell, ids in grouped.items()}, stores)
+
+    def update(self, db: Session, store_ids: set[int], company_ids: set[int]) -> None:
+        """Reload the cells of these stores and of every store of these companies, in place.
+
+        New cells are added before stale ones are removed, so a concurrent lookup never
+        misses a store that stays indexed.
+        """
+        params = {"ids": sorted(store_ids), "company_ids": sorted(company_ids)}
+        rows = {row["id"]: _indexed_store(row) for row in db.execute(UPDATE_STORES_SQL, params).mappings()}
+        fresh: dict[int, set[str]] = {}
+        for cell, store_id in db.execute(UPDATE_CELLS_SQL, params):
+            fresh.setdefault(store_id, set()).add(cell)
+        affected = set(store_ids) | set(rows) | {
+            s.id for s in list(self.stores.values()) if s.company_id in company_ids
+        }
+        for store_id in affected:
+            cells = fresh.get(store_id, set())
+            old = self.store_cells.get(store_id, set())
+            if cells:
+                self.stores[store_id] = rows[store_id]
+            for cell in cells - old:
+                self.cells[cell] = self.cells.get(cell, ()) + (store_id,)
+            for cell in old - cells:
+                remaining = tuple(i for i in self.cells.get(cell, ()) if i != store_id)
+                if remaining:
+                    self.cells[cell] = remaining
+                else:
+                    self.cells.pop(cell, None)
+            if cells:
+                self.store_cells[store_id] = cells
+            else:
+                self.store_cells.pop(store_id, None)
+                self.stores.pop(store_id, None)
+        self.precisions = sorted({len(c) for c in self.cells}, reverse=True)
+
+    def candidates(self, lat: float, lng: float) -> set[int]:
+        if not self.precisions:
+            return set()
+        h = geohash.encode(lat, lng, self.precisions[0])
+        out: set[int] = set()
+        for p in self.precisions:
+            out.update(self.cells.get(h[:p], ()))
+        return out
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+
+_index: CellIndex | None = None
+_stale = False
+# store and company ids changed since the index was built, applied by the next refresh
+_dirty_stores: set[int] = set()
+_dirty_companies: set[int] = set()
+_changes_lock = threading.Lock()
+# one refresh (full or targeted) at a time; never held by a request that has an index to serve
+_loading = threading.Lock()
+
+
+def _expired(index: CellIndex) -> bool:
+    return time.monotonic() - index.loaded_at > settings.STORE_CELL_INDEX_TTL_SEC
+
+
+def _take_changes(full: bool) -> tuple[set[int], set[int]]:
+    global _stale
+    with _changes_lock:
+        stores, companies = set(_dirty_stores), set(_dirty_companies)
+        _dirty_stores.clear()
+        _dirty_companies.clear()
+        if full:
+            _stale = False
+        return stores, companies
+
+
+def _put_back(stores: set[int], companies: set[int], full: bool) -> None:
+    global _stale
+    with _changes_lock:
+        _dirty_stores.update(stores)
+        _dirty_companies.update(companies)
+        _stale = _stale or full
+
+
+def _refresh() -> None:
+    global _index
+    full = _stale or _index is None or _expired(_index)
+    # changes marked from here on stay dirty and are applied by the next refresh
+    stores, companies = _take_changes(full)
+    try:
+        with SessionLocal() as db:
+            if full:
+                _index = CellIndex.load(db)
+            else:
+                _index.update(db, stores, companies)
+    except Exception:
+        _put_back(stores, companies, full)
+        logger.exception("cell index refresh failed; serving the previous index")
+    finally:
+        _loading.release()
+
+
+def get_cell_index(db: Session) -> CellIndex:
+    """The process-wide index.
+
+    Only the first call loads it inline. Changed stores and companies are then reloaded
+    in place, and the whole index once it is older than STORE_CELL_INDEX_TTL_SEC or
+    invalidated, by a background thread; requests keep using the current index meanwhile.
+    """
+    global _index
+    index = _index
+    if index is None:
+        with _loading:
+            if _index is None:
+                _take_changes(full=True)
+                _index = CellIndex.load(db)
+            return _index
+    if (_stale or _dirty_stores or _dirty_companies or _expired(index)) and _loading.acquire(blocking=False):
+        threading.Thread(target=_refresh, name="cell-index-refresh", daemon=True).start()
+    return index
+
+
+def invalidate_cell_stores(store_ids: list[int]) -> None:
+    """Reload these stores' cells (new location, polygon or radius) on the next lookup."""
+    with _changes_lock:
+        _dirty_stores.update(store_ids)
+
+
+def invalidate_cell_company(company_id: int) -> None:
+    """Reload the cells of every store of the company (radius change) on the next lookup."""
+    with _changes_lock:
+        _dirty_companies.add(company_id)
+
+
+def invalidate_cell_index() -> None:
+    """Rebuild the whole index in the background on the next lookup."""
+    global _stale
+    with _changes_lock:
+        _stale = True
+
+
+def stores_at(db: Session, lat: float, lng: float) -> list[dict]:
+    """Stores whose geofence contains the point: cell lookup, then the exact check."""
+    index = get_cell_index(db)
+    out = []
+    for store_id in index.candidates(lat, lng):
+        store = index.stores.get(store_id)
+        if store is None:
+            continue
+        fence: PreparedFence | None = get_fence(db, store_id) if store.has_geofence else None
+        if fence is not None:
+            within, distance = fence.check(lat, lng)
+        elif store.lat is not None:
+            distance = vincenty_m(store.lat, store.lng, lat, lng)
+            within = distance <= store.radius_m
+        else:
+            continue
+        if within:
+            out.append({
+                "id": store.id, "company_id": store.company_id, "name": store.name,
+                "distance_m": distance, "radius_m": store.radius_m, "within": True,
+            })
+    return sorted(out, key=lambda s: s["distance_m"])
@@ -0,0 +1,163 @@
+"""Change feed that keeps per-process store caches coherent across API nodes.
+
+Writers call `stores_changed(ids)` or `company_changed(id)` after committing. The change
+is applied to this process's caches straight away and published on the Redis pub/sub
+channel CHANGE_FEED_CHANNEL. Every API process runs a `ChangeFeedSubscriber` (started
+from the app lifespan) that applies the changes other processes publish:
+
+- stores: their task geofences (store_cache), prepared polygons (polygons) and their
+  cells in the cell index (cell_index), since a new location or polygon moves them;
+- company: the geofences of all its tasks and the cells of all its stores (radius change).
+
+Pub/sub is fire and forget, so a subscriber that (re)connects clears every cache first
+(the cell index is rebuilt in the background): whatever it missed while disconnected is
+reloaded. Caches can therefore use long TTLs.
+Publishing never fails the caller; without Redis each process only sees its own
+changes, and the TTLs bound the staleness as before.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import uuid
+import redis
+import redis.asyncio as aioredis
+from app.core.config import settings
+from app.core.metrics import CHANGE_FEED_EVENTS
+from app.services.cell_index import invalidate_cell_company, invalidate_cell_index, invalidate_cell_stores
+from app.services.polygons import invalidate_fence, store_fences
+from app.services.store_cache import invalidate_company, invalidate_store, store_geofences
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("stores", "company")
+# identifies this process's own messages, which it already applied when publishing
+NODE_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+try:
+    _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True) if settings.CHANGE_FEED_ENABLED else None
+except Exception:
+    _redis = None
+
+
+def apply_change(kind: str, ids: list[int]) -> None:
+    if kind == "stores":
+        for store_id in ids:
+            invalidate_store(store_id)
+            invalidate_fence(store_id)
+        invalidate_cell_stores(ids)
+    elif kind == "company":
+        for company_id in ids:
+            invalidate_company(company_id)
+            invalidate_cell_company(company_id)
+    else:
+        raise ValueError(f"Unknown change kind {kind!r}; expected one of {KINDS}")
+
+
+def reset_caches() -> None:
+    store_geofences.clear()
+    store_fences.clear()
+    invalidate_cell_index()
+
+
+def encode_change(kind: str, ids: list[int]) -> str:
+    return json.dumps({"kind": kind, "ids": [int(i) for i in ids], "origin": NODE_ID})
+
+
+def publish_change(kind: str, ids: list[int]) -> None:
+    """Apply a change locally and announce it to the other processes."""
+    if not ids:
+        return
+    apply_change(kind, ids)
+    if _redis is None:
+        return
+    try:
+        _redis.publish(settings.CHANGE_FEED_CHANNEL, encode_change(kind, ids))
+        CHANGE_FEED_EVENTS.labels(kind, "published").inc()
+    except redis.RedisError as e:
+        logger.warning("change feed publish failed (%s %s): %s", kind, ids, e)
+
+
+def stores_changed(store_ids: list[int]) -> None:
+    publish_change("stores", store_ids)
+
+
+def company_changed(company_id: int) -> None:
+    publish_change("company", [company_id])
+
+
+def handle_message(data: str) -> None:
+    try:
+        change = json.loads(data)
+        kind, ids, origin = change["kind"], change["ids"], change.get("origin")
+        if origin == NODE_ID:
+            return
+        apply_change(kind, ids)
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("ignoring malformed change %r: %s", data, e)
+        return
+    CHANGE_FEED_EVENTS.labels(kind, "applied").inc()
+
+
+class ChangeFeedSubscriber:
+    """Background task applying the changes published by other processes."""
+
+    def __init__(self, client: aioredis.Redis, channel: str | None = None):
+        self.client = client
+        self.channel = channel or settings.CHANGE_FEED_CHANNEL
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.client.aclose()
+
+    async def run(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await self.listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("change feed disconnected, retrying in %.0fs: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            else:
+                delay = 1.0
+
+    async def listen(self) -> None:
+        async with self.client.pubsub() as pubsub:
+            await pubsub.subscribe(self.channel)
+            # anything published while we were not subscribed is lost: start from empty caches
+            reset_caches()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    handle_message(message["data"])
+
+
+_subscriber: ChangeFeedSubscriber | None = None
+
+
+async def start_change_feed() -> ChangeFeedSubscriber | None:
+    global _subscriber
+    if not settings.CHANGE_FEED_ENABLED or _subscriber is not None:
+        return _subscriber
+    _subscriber = ChangeFeedSubscriber(aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True))
+    _subscriber.start()
+    return _subscriber
+
+
+async def stop_change_feed() -> None:
+    global _subscriber
+    if _subscriber is not None:
+        await _subscriber.stop()
+        _subscriber = None
@@ -0,0 +1,146 @@
+"""Tiered, accuracy-aware geofence decisions for check-ins.
+
+A check-in carries the point and optionally `accuracy_m`, the radius of its GPS
+uncertainty circle. Against the store's geofence the check-in is:
+
+- allowed when the whole circle is inside,
+- denied when the whole circle is outside,
+- uncertain when the circle straddles the edge. GEOFENCE_UNCERTAIN_POLICY decides
+  those: `center` uses the point itself (the verdict without accuracy), `allow` or
+  `deny` uses that outcome.
+
+Without `accuracy_m` the circle is just the point and nothing is uncertain.
+
+Radius geofences go through two tiers:
+
+1. fast: an equirectangular distance from the cached store coordinates, scaled with
+   the WGS84 radii at the mid latitude. Within FAST_TIER_MAX_M it stays within 0.035%
+   of the geodesic (checked against Vincenty up to 80 degrees latitude). The tier
+   assumes FAST_TIER_REL_ERROR and decides only when every distance in that error
+   interval gets the same verdict.
+2. exact: the DISTANCE_BACKEND distance. It is needed only for points in the band
+   around the radius where the fast estimate is ambiguous, or farther than
+   FAST_TIER_MAX_M.
+
+Fast-tier decisions report the estimated distance. Polygon geofences are checked
+exactly against the prepared fence, and their distance is to the edge.
+Every decision is counted in geofence_decisions_total{tier, result}.
+"""
+from __future__ import annotations
+import math
+from typing import NamedTuple, Sequence
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import GEOFENCE_DECISIONS
+from app.services.distances import ageofence_distance, get_distance_backend
+from app.services.polygons import PreparedFence, aget_fence, get_fence, metres_per_degree
+from app.services.store_cache import StoreGeofence
+
+STATUSES = ("allowed", "denied", "uncertain")
+UNCERTAIN_POLICIES = ("center", "allow", "deny")
+
+FAST_TIER_MAX_M = 100_000.0
+# three times the worst relative error measured within FAST_TIER_MAX_M
+FAST_TIER_REL_ERROR = 1e-3
+FAST_TIER_ABS_ERROR_M = 0.01
+
+
+class Decision(NamedTuple):
+    status: str        # allowed | denied | uncertain
+    allowed: bool      # status with GEOFENCE_UNCERTAIN_POLICY applied
+    distance_m: float  # to the store location, or to the polygon edge
+    tier: str          # fast | exact | polygon
+
+
+def fast_distance_m(lat0: float, lng0: float, lat: float, lng: float) -> float:
+    kx, ky = metres_per_degree((lat0 + lat) / 2)
+    dx = ((lng - lng0 + 180.0) % 360.0 - 180.0) * kx
+    return math.hypot(dx, (lat - lat0) * ky)
+
+
+def classify(margin: float, accuracy: float) -> tuple[str, bool]:
+    """(status, whether the point itself is inside) for a point `margin` metres outside
+    the fence (negative: inside) with uncertainty radius `accuracy`."""
+    if margin <= -accuracy:
+        status = "allowed"
+    elif margin > accuracy:
+        status = "denied"
+    else:
+        status = "uncertain"
+    return status, margin <= 0
+
+
+def resolve(status: str, inside: bool, policy: str | None = None) -> bool:
+    if status != "uncertain":
+        return status == "allowed"
+    policy = policy or settings.GEOFENCE_UNCERTAIN_POLICY
+    if policy not in UNCERTAIN_POLICIES:
+        raise ValueError(f"Unknown GEOFENCE_UNCERTAIN_POLICY {policy!r}; expected one of {UNCERTAIN_POLICIES}")
+    return inside if policy == "center" else policy == "allow"
+
+
+def make_decision(margin: float, distance: float, accuracy: float, tier: str) -> Decision:
+    status, inside = classify(margin, accuracy)
+    GEOFENCE_DECISIONS.labels(tier, status).inc()
+    return Decision(status, resolve(status, inside), distance, tier)
+
+
+def fast_decision(store: StoreGeofence, lat: float, lng: float, accuracy: float) -> Decision | None:
+    """The decision from the equirectangular estimate, or None when it is ambiguous."""
+    distance = fast_distance_m(store.lat, store.lng, lat, lng)
+    if distance > FAST_TIER_MAX_M:
+        return None
+    error = FAST_TIER_ABS_ERROR_M + FAST_TIER_REL_ERROR * distance
+    margin = distance - store.radius_m
+    if classify(margin - error, accuracy) != classify(margin + error, accuracy):
+        return None
+    return make_decision(margin, distance, accuracy, "fast")
+
+
+def polygon_decision(fence: PreparedFence, lat: float, lng: float, accuracy: float) -> Decision:
+    covers, edge = fence.check(lat, lng)
+    return make_decision(-edge if covers else edge, edge, accuracy, "polygon")
+
+
+def decide_many(db: Session, stores: Sequence[StoreGeofence], lats, lngs, accuracies,
+                backend: str | None = None) -> list[Decision | None]:
+    """Decisions for check-ins against their stores; None where the store has no location yet.
+
+    Only the check-ins the fast tier leaves open go to the distance backend, in one call.
+    """
+    out: list[Decision | None] = [None] * len(stores)
+    exact = []
+    for i, store in enumerate(stores):
+        accuracy = accuracies[i] or 0.0
+        fence = get_fence(db, store.store_id) if store.has_geofence else None
+        if fence is not None:
+            out[i] = polygon_decision(fence, lats[i], lngs[i], accuracy)
+        elif store.ready:
+            if settings.GEOFENCE_FAST_TIER:
+                out[i] = fast_decision(store, lats[i], lngs[i], accuracy)
+            if out[i] is None:
+                exact.append(i)
+    distances = get_distance_backend(backend)(
+        db, [stores[i] for i in exact], [lats[i] for i in exact], [lngs[i] for i in exact]
+    ) if exact else []
+    for i, distance in zip(exact, distances):
+        if distance is not None:
+            out[i] = make_decision(distance - stores[i].radius_m, distance, accuracies[i] or 0.0, "exact")
+    return out
+
+
+async def adecide(db: AsyncSession, store: StoreGeofence, lat: float, lng: float,
+                  accuracy: float | None = None, backend: str | None = None) -> Decision | None:
+    accuracy = accuracy or 0.0
+    fence = await aget_fence(db, store.store_id) if store.has_geofence else None
+    if fence is not None:
+        return polygon_decision(fence, lat, lng, accuracy)
+    if not store.ready:
+        return None
+    if settings.GEOFENCE_FAST_TIER:
+        decision = fast_decision(store, lat, lng, accuracy)
+        if decision is not None:
+            return decision
+    distance = await ageofence_distance(db, store, lat, lng, backend)
+    return None if distance is None else make_decision(distance - store.radius_m, distance, accuracy, "exact")
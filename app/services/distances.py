@@ -1,25 +1,28 @@
+from typing import Callable, Sequence
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.services.geodesy import haversine_many_m, vincenty_m
+from app.services.store_cache import StoreGeofence
 
 def within_radius_and_distance(db: Session, store_id: int, lat: float, lng: float, radius_m: int):
+    # Stores with a geofence polygon: inside-or-on-the-edge and the distance to the edge.
+    # Others: within radius_m of the store location and the distance to it.
     sql = text('''
         SELECT
             CASE
+              WHEN s.geofence IS NOT NULL THEN ST_Covers(s.geofence, p.pt)
               WHEN s.location IS NULL THEN NULL
-              ELSE ST_DWithin(
-                    s.location,
-                    ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography,
-                    :radius
-                  )
+              ELSE ST_DWithin(s.location, p.pt, :radius)
             END AS within,
             CASE
+              WHEN s.geofence IS NOT NULL THEN ST_Distance(ST_Boundary(s.geofence::geometry)::geography, p.pt)
               WHEN s.location IS NULL THEN NULL
-              ELSE ST_Distance(
-                    s.location,
-                    ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography
-                  )
+              ELSE ST_Distance(s.location, p.pt)
             END AS distance_m
         FROM stores s
+        CROSS JOIN (SELECT ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography AS pt) p
         WHERE s.id = :store_id
         LIMIT 1;
     ''')
@@ -30,3 +33,128 @@ def within_radius_and_distance(db: Session, store_id: int, lat: float, lng: floa
         return (False, None)
     return (bool(row["within"]), float(row["distance_m"]))
 
+
+# KNN (<->) walks the GiST index on stores.location nearest-first and stops at :limit;
+# ST_DWithin bounds the search. <-> is the sphere distance, so the final order uses
+# the spheroid ST_Distance.
+NEARBY_STORES_SQL = text('''
+    SELECT * FROM (
+        SELECT
+            s.id AS id,
+            s.company_id AS company_id,
+            s.name AS name,
+            ST_Distance(s.location, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography) AS distance_m,
+            COALESCE(NULLIF(s.custom_radius_m, 0), c.geofence_radius_m) AS radius_m,
+            CASE WHEN s.geofence IS NULL THEN NULL
+                 ELSE ST_Covers(s.geofence, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography) END AS in_geofence
+        FROM stores s
+        JOIN companies c ON c.id = s.company_id
+        WHERE s.geocode_status = 'success'
+          AND ST_DWithin(s.location, ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography, :radius)
+        ORDER BY s.location <-> ST_SetSRID(ST_MakePoint(:lng, :lat), 4326)::geography
+        LIMIT :limit
+    ) nearest
+    ORDER BY distance_m;
+''')
+
+
+def nearby_stores(db: Session, lat: float, lng: float, radius_m: float, limit: int) -> list[dict]:
+    rows = db.execute(NEARBY_STORES_SQL, {"lat": lat, "lng": lng, "radius": radius_m, "limit": limit}).mappings()
+    out = []
+    for row in rows:
+        distance = float(row["distance_m"])
+        out.append({
+            "id": row["id"],
+            "company_id": row["company_id"],
+            "name": row["name"],
+            "distance_m": distance,
+            "radius_m": int(row["radius_m"]),
+            "within": distance <= row["radius_m"] if row.get("in_geofence") is None else bool(row["in_geofence"]),
+        })
+    return out
+
+
+# --- Pluggable distance backends -------------------------------------------------
+# Every backend maps (stores[i], lats[i], lngs[i]) to a distance in metres, or None
+# when the store has no location. The geofence decision is `distance <= radius_m`
+# in all cases, which is exactly what ST_DWithin does on geography.
+#
+#   postgis   - ST_Distance on the WGS84 spheroid in one set-based query (reference)
+#   geodesic  - Vincenty on WGS84 in Python; within 1 mm of postgis
+#   haversine - vectorized NumPy on the mean sphere; within 0.56% of postgis
+
+DistanceBackend = Callable[[Session, Sequence[StoreGeofence], Sequence[float], Sequence[float]], list]
+
+POSTGIS_DISTANCES_SQL = text('''
+    SELECT
+        p.ord AS ord,
+        ST_Distance(
+            s.location,
+            ST_SetSRID(ST_MakePoint(p.lng, p.lat), 4326)::geography
+        ) AS distance_m
+    FROM unnest(CAST(:store_ids AS integer[]), CAST(:lats AS float8[]), CAST(:lngs AS float8[]))
+         WITH ORDINALITY AS p(store_id, lat, lng, ord)
+    JOIN stores s ON s.id = p.store_id
+    WHERE s.location IS NOT NULL;
+''')
+
+
+def postgis_distances(db: Session, stores, lats, lngs) -> list:
+    if not stores:
+        return []
+    params = {"store_ids": [s.store_id for s in stores], "lats": list(lats), "lngs": list(lngs)}
+    out = [None] * len(stores)
+    for row in db.execute(POSTGIS_DISTANCES_SQL, params).mappings():
+        out[int(row["ord"]) - 1] = float(row["distance_m"])
+    return out
+
+
+def geodesic_distances(db: Session, stores, lats, lngs) -> list:
+    return [
+        vincenty_m(s.lat, s.lng, lat, lng) if s.ready else None
+        for s, lat, lng in zip(stores, lats, lngs)
+    ]
+
+
+def haversine_distances(db: Session, stores, lats, lngs) -> list:
+    ready = [i for i, s in enumerate(stores) if s.ready]
+    out = [None] * len(stores)
+    if not ready:
+        return out
+    d = haversine_many_m(
+        [stores[i].lat for i in ready],
+        [stores[i].lng for i in ready],
+        [lats[i] for i in ready],
+        [lngs[i] for i in ready],
+    )
+    for i, dist in zip(ready, d.tolist()):
+        out[i] = dist
+    return out
+
+
+DISTANCE_BACKENDS: dict[str, DistanceBackend] = {
+    "postgis": postgis_distances,
+    "geodesic": geodesic_distances,
+    "haversine": haversine_distances,
+}
+
+
+def get_distance_backend(name: str | None = None) -> DistanceBackend:
+    name = name or settings.DISTANCE_BACKEND
+    try:
+        return DISTANCE_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown DISTANCE_BACKEND {name!r}; expected one of {sorted(DISTANCE_BACKENDS)}")
+
+
+def geofence_distance(db: Session, store: StoreGeofence, lat: float, lng: float, backend: str | None = None) -> float | None:
+    return get_distance_backend(backend)(db, [store], [lat], [lng])[0]
+
+
+async def ageofence_distance(db: AsyncSession, store: StoreGeofence, lat: float, lng: float, backend: str | None = None) -> float | None:
+    fn = get_distance_backend(backend)
+    if fn is postgis_distances:
+        return (await db.run_sync(fn, [store], [lat], [lng]))[0]
+    # local backends never touch the session
+    return fn(None, [store], [lat], [lng])[0]
+
@@ -0,0 +1,171 @@
+"""Offline gazetteer for the "local" geocode provider.
+
+A compiled gazetteer is one file: a HEADER record, then fixed-width records sorted by key:
+
+    blake2b-128 of the key (16 bytes) | lat (float64) | lng (float64)
+
+Keys are `addr|<country>|<address, city>`, `postal|<country>|<postal code>` and
+`city|<country>|<city>`, each part passed through `normalize_address`. Hashing keeps
+every key whole whatever its length (a truncated key would let two long addresses
+that differ only in the city collide); the build fails if two keys share a digest.
+The file is memory-mapped and searched with a binary search, so opening it costs
+nothing, lookups touch a handful of pages and the OS page cache is shared by every
+worker process.
+
+Build one with `scripts/build_gazetteer.py` from a CSV (country, postal_code, city,
+address, lat, lng) or a GeoNames postal-code dump. The country must be spelled the same
+way in the gazetteer and on stores (GeoNames uses ISO 3166 alpha-2 codes).
+"""
+from __future__ import annotations
+import csv
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+from typing import Iterable, Iterator, NamedTuple
+from app.services.addresses import normalize_address
+
+RECORD = struct.Struct("<16sdd")
+KEY_BYTES = 16
+# first record of the file; older (truncated-key) gazetteers have to be rebuilt
+HEADER = b"gazetteer-v2".ljust(RECORD.size, b"\0")
+PRECISIONS = ("address", "postal_code", "locality")
+
+
+class GazetteerRow(NamedTuple):
+    country: str
+    postal_code: str | None
+    city: str | None
+    lat: float
+    lng: float
+    address: str | None = None
+
+
+def full_key(kind: str, country: str, value: str) -> str:
+    return f"{kind}|{normalize_address(country)}|{normalize_address(value)}"
+
+
+def digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=KEY_BYTES).digest()
+
+
+def make_key(kind: str, country: str, value: str) -> bytes:
+    return digest(full_key(kind, country, value))
+
+
+def build(rows: Iterable[GazetteerRow], path: str) -> int:
+    """Compile rows into a gazetteer file (atomically replaced); returns the record count.
+
+    Rows sharing a postal code or city are averaged into one centroid per key; an
+    address listed twice keeps its first row. Raises ValueError if two different keys
+    hash to the same digest.
+    """
+    sums: dict[str, list[float]] = {}
+    exact: dict[str, tuple[float, float]] = {}
+    for row in rows:
+        if row.address and row.city:
+            exact.setdefault(full_key("addr", row.country, f"{row.address}, {row.city}"), (row.lat, row.lng))
+        for kind, value in (("postal", row.postal_code), ("city", row.city)):
+            if value:
+                acc = sums.setdefault(full_key(kind, row.country, value), [0.0, 0.0, 0])
+                acc[0] += row.lat
+                acc[1] += row.lng
+                acc[2] += 1
+    keyed = {key: (lat / n, lng / n) for key, (lat, lng, n) in sums.items()}
+    keyed.update(exact)
+    records: dict[bytes, tuple[float, float]] = {}
+    owners: dict[bytes, str] = {}
+    for key, coords in keyed.items():
+        hashed = digest(key)
+        if hashed in owners:
+            raise ValueError(f"Gazetteer keys {owners[hashed]!r} and {key!r} share a digest")
+        owners[hashed] = key
+        records[hashed] = coords
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(HEADER)
+        for key in sorted(records):
+            lat, lng = records[key]
+            f.write(RECORD.pack(key, lat, lng))
+    os.replace(tmp, path)
+    return len(records)
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[GazetteerRow]:
+    """CSV with a header: country, lat, lng and any of postal_code, city, address."""
+    for raw in csv.DictReader(lines):
+        yield GazetteerRow(
+            country=raw["country"].strip(),
+            postal_code=(raw.get("postal_code") or "").strip() or None,
+            city=(raw.get("city") or "").strip() or None,
+            lat=float(raw["lat"]),
+            lng=float(raw["lng"]),
+            address=(raw.get("address") or "").strip() or None,
+        )
+
+
+def read_geonames(lines: Iterable[str]) -> Iterator[GazetteerRow]:
+    """GeoNames postal-code dump (download.geonames.org/export/zip): tab-separated, no header."""
+    for line in lines:
+        cols = line.rstrip("\n").split("\t")
+        if len(cols) < 11 or not cols[9] or not cols[10]:
+            continue
+        yield GazetteerRow(cols[0], cols[1] or None, cols[2] or None, float(cols[9]), float(cols[10]))
+
+
+class Gazetteer:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(HEADER)) != HEADER:
+                raise ValueError(f"{path} is not a current gazetteer; rebuild it with scripts/build_gazetteer.py")
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.count = size // RECORD.size - 1
+
+    def get(self, key: bytes) -> tuple[float, float] | None:
+        # record 0 is the header
+        lo, hi = 1, self.count + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = mid * RECORD.size
+            probe = self._mm[offset:offset + KEY_BYTES]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                _, lat, lng = RECORD.unpack_from(self._mm, offset)
+                return lat, lng
+        return None
+
+    def lookup(
+        self, country: str | None, postal_code: str | None, city: str | None, address: str | None = None,
+        precisions: tuple[str, ...] = PRECISIONS,
+    ) -> tuple[float, float, str] | None:
+        """Most precise match first: exact address, then postal code, then city centroid.
+
+        Returns (lat, lng, precision) with precision "address", "postal_code" or "locality";
+        only the `precisions` listed are tried.
+        """
+        if not country:
+            return None
+        candidates = []
+        if address and city:
+            candidates.append(("address", make_key("addr", country, f"{address}, {city}")))
+        if postal_code:
+            candidates.append(("postal_code", make_key("postal", country, postal_code)))
+        if city:
+            candidates.append(("locality", make_key("city", country, city)))
+        for precision, key in candidates:
+            if precision not in precisions:
+                continue
+            hit = self.get(key)
+            if hit:
+                return hit[0], hit[1], precision
+        return None
+
+    def close(self) -> None:
+        self._mm.close()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import json
+import redis
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import GEOCODE_CACHE_LOOKUPS
+from app.services.geocoding import GeocodeResult
+
+try:
+    _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+except Exception:
+    _redis = None
+
+SELECT_SQL = text('''
+    SELECT lat, lng, provider, precision FROM geocode_cache
+    WHERE address_key = :key AND created_at > NOW() - make_interval(days => :max_age_days)
+''')
+UPSERT_SQL = text('''
+    INSERT INTO geocode_cache (address_key, lat, lng, provider, precision, created_at)
+    VALUES (:key, :lat, :lng, :provider, :precision, NOW())
+    ON CONFLICT (address_key) DO UPDATE
+    SET lat = EXCLUDED.lat, lng = EXCLUDED.lng, provider = EXCLUDED.provider,
+        precision = EXCLUDED.precision, created_at = EXCLUDED.created_at
+''')
+
+
+def _redis_key(key: str) -> str:
+    return f"geocode:{key}"
+
+
+def _redis_get(key: str) -> GeocodeResult | None:
+    if _redis is None:
+        return None
+    try:
+        raw = _redis.get(_redis_key(key))
+    except redis.RedisError:
+        return None
+    return GeocodeResult(**json.loads(raw)) if raw else None
+
+
+def _redis_set(key: str, result: GeocodeResult) -> None:
+    if _redis is None:
+        return
+    try:
+        _redis.set(_redis_key(key), json.dumps(result._asdict()), ex=settings.GEOCODE_CACHE_TTL_SEC)
+    except redis.RedisError:
+        pass
+
+
+def cached_lookup(db: Session, key: str) -> tuple[GeocodeResult | None, str]:
+    """Look a normalized key up in Redis, then the geocode_cache table.
+
+    Returns (result, source); a miss is (None, "provider"): the caller fetches and `cache_store`s.
+    """
+    result = _redis_get(key)
+    if result is not None:
+        GEOCODE_CACHE_LOOKUPS.labels("redis").inc()
+        return result, "redis"
+
+    row = db.execute(SELECT_SQL, {"key": key, "max_age_days": settings.GEOCODE_CACHE_MAX_AGE_DAYS}).mappings().first()
+    if row:
+        result = GeocodeResult(row["lat"], row["lng"], row["provider"], row["precision"])
+        _redis_set(key, result)
+        GEOCODE_CACHE_LOOKUPS.labels("db").inc()
+        return result, "db"
+
+    GEOCODE_CACHE_LOOKUPS.labels("provider").inc()
+    return None, "provider"
+
+
+def cache_store(db: Session, key: str, result: GeocodeResult) -> None:
+    """Write a provider result to both tiers (the Postgres row joins the caller's transaction)."""
+    db.execute(UPSERT_SQL, {"key": key, **result._asdict()})
+    _redis_set(key, result)
+
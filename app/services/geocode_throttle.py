@@ -0,0 +1,57 @@
+"""Cluster-wide request rate per geocode provider.
+
+Every worker process draws from one Redis token bucket per provider (the same GCRA
+script as the API rate limiter), sized from GEOCODE_PROVIDER_QPS, so adding workers or
+raising GEOCODE_CONCURRENCY never pushes the fleet past the provider's quota. Providers
+without a configured rate, and the offline "local" provider, are not throttled.
+"""
+from __future__ import annotations
+import asyncio
+import logging
+import random
+import redis
+from app.core.config import settings
+from app.core.ratelimit import run_gcra
+
+logger = logging.getLogger(__name__)
+
+try:
+    _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+except Exception:
+    _redis = None
+
+
+def provider_qps(spec: str | None = None) -> dict[str, int]:
+    """Parse "google=50,nominatim=1" into {"google": 50, "nominatim": 1}."""
+    rates = {}
+    for item in (settings.GEOCODE_PROVIDER_QPS if spec is None else spec).split(","):
+        if not item.strip():
+            continue
+        name, _, qps = item.partition("=")
+        rates[name.strip()] = int(qps)
+    return rates
+
+
+async def acquire(provider: str) -> float:
+    """Wait for a token for one request to `provider`; returns the seconds spent waiting.
+
+    Redis errors let the request through: the provider's own 429s still end in a retry.
+    """
+    qps = provider_qps().get(provider)
+    if not qps or _redis is None:
+        return 0.0
+    waited = 0.0
+    while True:
+        try:
+            # the sync client in a worker thread: the Redis round trip must not block the
+            # loop, where the other GEOCODE_CONCURRENCY fetches are in flight
+            allowed, retry_after_ms = await asyncio.to_thread(run_gcra, _redis, f"geocode:qps:{provider}", qps, 1000)
+        except redis.RedisError as e:
+            logger.warning("geocode throttle unavailable, not throttling %s: %s", provider, e)
+            return waited
+        if allowed:
+            return waited
+        # a little jitter so waiters woken together don't all retry in the same millisecond
+        delay = retry_after_ms / 1000 * (1 + random.random() * 0.1)
+        await asyncio.sleep(delay)
+        waited += delay
@@ -1,17 +1,197 @@
+"""Geocode providers and the order they are tried in.
+
+A provider is `async (GeocodeQuery) -> GeocodeResult | None`: None means "no match, try
+the next one", an exception means the provider itself failed (network, quota). Providers
+are registered in GEOCODE_PROVIDERS and tried in settings.GEOCODE_PROVIDERS order
+(network providers wait for a token from app/services/geocode_throttle.py first):
+
+- local: the memory-mapped offline gazetteer (app/services/gazetteer.py), no network.
+  By default only exact address matches count: a postal-code or city centroid can be
+  kilometres off, useless for a 100 m geofence, so those stores go on to the next
+  provider. GEOCODE_LOCAL_PRECISIONS opts into centroids (needed for a GeoNames build);
+- google: Google Geocoding API (skipped without GOOGLE_MAPS_API_KEY);
+- nominatim: any Nominatim-compatible /search endpoint (OSM or self-hosted).
+"""
+import asyncio
+import threading
+from typing import Awaitable, Callable, NamedTuple
 import httpx
 from app.core.config import settings
+from app.services import geocode_throttle
+from app.services.gazetteer import PRECISIONS, Gazetteer
+
+class GeocodeResult(NamedTuple):
+    lat: float
+    lng: float
+    provider: str
+    precision: str | None = None
+
+class GeocodeQuery(NamedTuple):
+    address_lines: str | None
+    city: str | None = None
+    state: str | None = None
+    country: str | None = None
+    postal_code: str | None = None
+
+    @property
+    def text(self) -> str:
+        """One-line address: what remote providers are sent and what the cache is keyed on."""
+        return ", ".join(p for p in self if p)
+
+    @classmethod
+    def for_store(cls, store) -> "GeocodeQuery":
+        return cls(store.address_lines, store.city, store.state, store.country, store.postal_code)
+
+# One keep-alive (HTTP/2 where the server offers it) client per event loop: httpx
+# connections belong to the loop that opened them, so a client is never shared across loops.
+_clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        for stale in [lp for lp in _clients if lp.is_closed()]:
+            del _clients[stale]
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=settings.GEOCODE_HTTP_TIMEOUT_SEC,
+            limits=httpx.Limits(
+                max_connections=settings.GEOCODE_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GEOCODE_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def close_http_client() -> None:
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+_gazetteer: Gazetteer | None = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer | None:
+    """The configured gazetteer, mapped on first use (None when GEOCODE_GAZETTEER_PATH is unset)."""
+    global _gazetteer
+    path = settings.GEOCODE_GAZETTEER_PATH
+    if not path:
+        return None
+    with _gazetteer_lock:
+        if _gazetteer is None or _gazetteer.path != path:
+            _gazetteer = Gazetteer(path)
+        return _gazetteer
+
+
+def local_precisions(names: str | None = None) -> tuple[str, ...]:
+    """Gazetteer precisions good enough to place a store (settings.GEOCODE_LOCAL_PRECISIONS)."""
+    chosen = [n.strip() for n in (settings.GEOCODE_LOCAL_PRECISIONS if names is None else names).split(",") if n.strip()]
+    unknown = [n for n in chosen if n not in PRECISIONS]
+    if unknown:
+        raise ValueError(f"Unknown gazetteer precision(s) {unknown}; expected some of {list(PRECISIONS)}")
+    return tuple(chosen)
+
+
+def local_lookup(query: GeocodeQuery) -> GeocodeResult | None:
+    """Sync gazetteer lookup; cheap enough to call inline, ahead of the geocode cache."""
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    hit = gazetteer.lookup(query.country, query.postal_code, query.city, query.address_lines, local_precisions())
+    return GeocodeResult(hit[0], hit[1], "local", hit[2]) if hit else None
 
-GOOGLE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
-
-async def geocode_address(address: str) -> tuple[float, float] | None:
-    params = {"address": address, "key": settings.GOOGLE_MAPS_API_KEY}
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(GOOGLE_URL, params=params)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("status") == "OK" and data.get("results"):
-            res = data["results"][0]
-            loc = res["geometry"]["location"]
-            return (loc["lat"], loc["lng"])
+
+async def local_geocode(query: GeocodeQuery) -> GeocodeResult | None:
+    return local_lookup(query)
+
+
+async def google_geocode(query: GeocodeQuery) -> GeocodeResult | None:
+    if not settings.GOOGLE_MAPS_API_KEY:
+        return None
+    params = {"address": query.text, "key": settings.GOOGLE_MAPS_API_KEY}
+    await geocode_throttle.acquire("google")
+    r = await get_http_client().get(settings.GOOGLE_GEOCODE_URL, params=params)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("status") == "OK" and data.get("results"):
+        res = data["results"][0]
+        loc = res["geometry"]["location"]
+        return GeocodeResult(loc["lat"], loc["lng"], "google", res["geometry"].get("location_type"))
+    return None
+
+
+async def nominatim_geocode(query: GeocodeQuery) -> GeocodeResult | None:
+    # structured search; Nominatim's usage policy requires an identifying User-Agent
+    params = {"format": "jsonv2", "limit": 1}
+    for name, value in (("street", query.address_lines), ("city", query.city), ("state", query.state),
+                        ("country", query.country), ("postalcode", query.postal_code)):
+        if value:
+            params[name] = value
+    await geocode_throttle.acquire("nominatim")
+    r = await get_http_client().get(
+        settings.NOMINATIM_URL.rstrip("/") + "/search",
+        params=params,
+        headers={"User-Agent": settings.NOMINATIM_USER_AGENT},
+    )
+    r.raise_for_status()
+    data = r.json()
+    if data:
+        res = data[0]
+        return GeocodeResult(float(res["lat"]), float(res["lon"]), "nominatim", res.get("addresstype") or res.get("type"))
+    return None
+
+
+GEOCODE_PROVIDERS: dict[str, Callable[[GeocodeQuery], Awaitable[GeocodeResult | None]]] = {
+    "local": local_geocode,
+    "google": google_geocode,
+    "nominatim": nominatim_geocode,
+}
+
+
+def provider_order(names: str | None = None) -> list[str]:
+    order = [n.strip() for n in (settings.GEOCODE_PROVIDERS if names is None else names).split(",") if n.strip()]
+    unknown = [n for n in order if n not in GEOCODE_PROVIDERS]
+    if unknown:
+        raise ValueError(f"Unknown geocode provider(s) {unknown}; expected some of {sorted(GEOCODE_PROVIDERS)}")
+    return order
+
+
+async def geocode(query: GeocodeQuery, providers: list[str] | None = None) -> GeocodeResult | None:
+    """First result from `providers` (default: settings.GEOCODE_PROVIDERS) in order.
+
+    A provider that fails is skipped; if no provider produced a result and one failed,
+    the first error is re-raised so the caller's retry policy applies.
+    """
+    error: Exception | None = None
+    for name in provider_order() if providers is None else providers:
+        try:
+            result = await GEOCODE_PROVIDERS[name](query)
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            error = error or e
+            continue
+        if result is not None:
+            return result
+    if error is not None:
+        raise error
     return None
 
+
+async def geocode_many(
+    queries: list[GeocodeQuery], concurrency: int | None = None, providers: list[str] | None = None
+) -> list[GeocodeResult | BaseException | None]:
+    """Geocode queries concurrently, at most `concurrency` requests in flight.
+
+    Results line up with `queries`; a failed query yields its exception instead of
+    cancelling the rest.
+    """
+    sem = asyncio.Semaphore(concurrency or settings.GEOCODE_CONCURRENCY)
+
+    async def one(query: GeocodeQuery):
+        async with sem:
+            return await geocode(query, providers)
+
+    return await asyncio.gather(*(one(q) for q in queries), return_exceptions=True)
@@ -0,0 +1,107 @@
+"""Monthly partitions of task_runs (see migration 0007).
+
+Partitions are named task_runs_pYYYYMM and cover one UTC month each. `ensure_partitions`
+creates the current month and `ahead` more; `retire_partitions` detaches months older
+than the retention window, optionally moving them to an archive schema or dropping them.
+Rows that landed in task_runs_default because a month was missing are moved into the
+new partition when it is created.
+"""
+from __future__ import annotations
+import re
+from datetime import datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+PARENT = "task_runs"
+DEFAULT_PARTITION = "task_runs_default"
+ARCHIVE_SCHEMA = "task_runs_archive"
+RETIRE_MODES = ("detach", "archive", "drop")
+_NAME = re.compile(r"^task_runs_p(\d{4})(\d{2})$")
+
+LIST_PARTITIONS_SQL = text('''
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'task_runs'::regclass ORDER BY c.relname
+''')
+COUNT_DEFAULT_SQL = text('''
+    SELECT COUNT(*) FROM task_runs_default WHERE created_at >= :start AND created_at < :end
+''')
+
+
+def month_start(dt: datetime) -> datetime:
+    return dt.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> datetime | None:
+    m = _NAME.match(name)
+    return datetime(int(m[1]), int(m[2]), 1, tzinfo=timezone.utc) if m else None
+
+
+def list_partitions(db: Session) -> list[str]:
+    return list(db.execute(LIST_PARTITIONS_SQL).scalars())
+
+
+def create_partition(db: Session, month: datetime) -> str:
+    name = partition_name(month)
+    bounds = {"start": month, "end": add_months(month, 1)}
+    values = f"FROM ('{bounds['start'].isoformat()}') TO ('{bounds['end'].isoformat()}')"
+    if not db.execute(COUNT_DEFAULT_SQL, bounds).scalar():
+        db.execute(text(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {values}"))
+        return name
+    # Postgres refuses a partition whose range has rows in the default partition: build it
+    # standalone, move the rows over, then attach.
+    db.execute(text(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    db.execute(text(f'''
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    '''), bounds)
+    db.execute(text(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {values}"))
+    return name
+
+
+def ensure_partitions(db: Session, ahead: int, now: datetime | None = None) -> list[str]:
+    """Create missing partitions for this month and the next `ahead`; returns the new names."""
+    existing = set(list_partitions(db))
+    current = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for n in range(ahead + 1):
+        month = add_months(current, n)
+        if partition_name(month) not in existing:
+            created.append(create_partition(db, month))
+    db.commit()
+    return created
+
+
+def retire_partitions(db: Session, retain_months: int, mode: str = "detach", now: datetime | None = None) -> list[str]:
+    """Detach partitions entirely older than `retain_months` full months before this one.
+
+    mode "detach" leaves them as standalone tables, "archive" also moves them to the
+    task_runs_archive schema, "drop" deletes them. Returns the retired partition names.
+    """
+    if mode not in RETIRE_MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {RETIRE_MODES}")
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retain_months)
+    retired = []
+    for name in list_partitions(db):
+        month = partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+        db.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+        if mode == "archive":
+            db.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+            db.execute(text(f"ALTER TABLE {name} SET SCHEMA {ARCHIVE_SCHEMA}"))
+        elif mode == "drop":
+            db.execute(text(f"DROP TABLE {name}"))
+        retired.append(name)
+    db.commit()
+    return retired
@@ -0,0 +1,136 @@
+"""Geofence presence of a worker streaming location pings (WS /tasks/pings).
+
+A connection names its tasks once and then sends pings. Each ping is decided against
+every task's store like a check-in (app/services/decision.py), but only changes of
+presence are sent back and written to task_runs, with `event` set:
+
+- enter: the first allowed ping of a visit (also right after connecting inside),
+- exit: the first denied ping after being inside,
+- dwell: once per visit, PING_DWELL_SEC after the enter.
+
+Pings that come out uncertain (the accuracy circle straddles the edge) leave the
+presence as it was, so a worker standing at the edge does not flap between enter and
+exit. The pings in between transitions are not stored: a worker pinging every few
+seconds for an hour writes a handful of rows instead of one per ping.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, NamedTuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import PRESENCE_EVENTS
+from app.services.decision import Decision, adecide
+from app.services.store_cache import aget_store_geofence
+
+EVENTS = ("enter", "exit", "dwell")
+
+
+class Transition(NamedTuple):
+    task_id: int
+    event: str                     # enter | exit | dwell
+    lat: float
+    lng: float
+    distance_m: float
+    allowed: bool                  # inside after the transition
+    decision: str                  # status of the ping's decision
+    client_ts: datetime | None
+
+    def to_json(self) -> dict:
+        return {
+            "task_id": self.task_id, "event": self.event, "allowed": self.allowed,
+            "distance_m": self.distance_m, "decision": self.decision,
+        }
+
+
+@dataclass
+class Presence:
+    inside: bool | None = None     # None until the first allowed or denied ping
+    entered_at: float = 0.0        # ping time of the enter
+    dwelled: bool = False
+
+
+class PresenceTracker:
+    """Per-connection presence state of one worker for a fixed set of tasks.
+
+    `at` is the server's receipt time of a ping (monotonic seconds), so dwell does not
+    depend on device clocks.
+    """
+
+    def __init__(self, task_ids: Iterable[int], dwell_sec: float | None = None):
+        self.states = {task_id: Presence() for task_id in task_ids}
+        self.dwell_sec = settings.PING_DWELL_SEC if dwell_sec is None else dwell_sec
+
+    @property
+    def task_ids(self) -> list[int]:
+        return list(self.states)
+
+    def event(self, task_id: int, decision: Decision, at: float) -> str | None:
+        """Advance the presence at one task by a ping's decision; the transition, if any."""
+        state = self.states[task_id]
+        if decision.status != "uncertain":
+            inside = decision.status == "allowed"
+            if inside and not state.inside:
+                state.inside, state.entered_at, state.dwelled = True, at, False
+                return "enter"
+            if not inside and state.inside:
+                state.inside = False
+                return "exit"
+            state.inside = inside
+        if state.inside and not state.dwelled and at - state.entered_at >= self.dwell_sec:
+            state.dwelled = True
+            return "dwell"
+        return None
+
+
+async def process_ping(db: AsyncSession, tracker: PresenceTracker, lat: float, lng: float,
+                       accuracy: float | None, client_ts: datetime | None, at: float) -> list[Transition]:
+    """The transitions one ping causes across the tracked tasks.
+
+    Stores come from the geofence cache, so a ping usually needs no database round trip;
+    tasks that were deactivated or lost their location since the connection started are
+    skipped until they are checkable again.
+    """
+    PRESENCE_EVENTS.labels("ping").inc()
+    out = []
+    for task_id in tracker.task_ids:
+        geo = await aget_store_geofence(db, task_id)
+        if not geo or not geo.task_active or not geo.checkable:
+            continue
+        decision = await adecide(db, geo, lat, lng, accuracy)
+        if decision is None:
+            continue
+        event = tracker.event(task_id, decision, at)
+        if event is not None:
+            PRESENCE_EVENTS.labels(event).inc()
+            out.append(Transition(task_id, event, lat, lng, decision.distance_m,
+                                  tracker.states[task_id].inside, decision.status, client_ts))
+    return out
+
+
+RECORD_SQL = text(
+    "INSERT INTO task_runs (task_id, worker_id, client_location, distance_m, allowed, client_ts, event) "
+    "SELECT r.task_id, :worker_id, ST_SetSRID(ST_MakePoint(r.lng, r.lat), 4326)::geography, r.distance_m, "
+    "r.allowed, r.client_ts, r.event "
+    "FROM unnest(CAST(:task_ids AS integer[]), CAST(:lats AS float8[]), CAST(:lngs AS float8[]), "
+    "CAST(:distances AS float8[]), CAST(:allowed AS boolean[]), CAST(:client_ts AS timestamptz[]), "
+    "CAST(:events AS varchar[])) "
+    "AS r(task_id, lat, lng, distance_m, allowed, client_ts, event)"
+)
+
+
+async def record_transitions(db: AsyncSession, worker_id: str, transitions: list[Transition]) -> None:
+    if not transitions:
+        return
+    await db.execute(RECORD_SQL, {
+        "worker_id": worker_id,
+        "task_ids": [t.task_id for t in transitions],
+        "lats": [t.lat for t in transitions],
+        "lngs": [t.lng for t in transitions],
+        "distances": [t.distance_m for t in transitions],
+        "allowed": [t.allowed for t in transitions],
+        "client_ts": [t.client_ts for t in transitions],
+        "events": [t.event for t in transitions],
+    })
+    await db.commit()
@@ -0,0 +1,431 @@
+"""Write-behind buffer for task_runs (TASK_RUN_WRITE_MODE = redis | memory).
+
+`POST /tasks/{id}/run` answers as soon as the geofence decision is made and appends a
+RunRecord to the buffer; a background flusher drains it in batches of up to
+TASK_RUN_FLUSH_BATCH rows, COPYs each batch into a temp table and moves it into
+task_runs with one INSERT .. ON CONFLICT DO NOTHING.
+
+Delivery is at-least-once. A record keeps its client_run_id and created_at from the
+request, so a batch written twice (flusher crashed before acking, a Redis message
+claimed by a second flusher) is deduplicated by the unique (client_run_id, created_at)
+index. The API also remembers accepted run ids for TASK_RUN_DEDUP_TTL_SEC, so a client
+retrying the same check-in is not buffered twice. Runs written inline (sync mode, the
+batch upload, a buffer that is down) get the same guarantee from `recorded_run_ids`.
+
+- redis: a Redis stream read through a consumer group. Entries are acked only after
+  their batch is committed; entries left pending by a dead flusher are claimed after
+  TASK_RUN_CLAIM_IDLE_MS. Any API process (or scripts/run_writer.py) can flush.
+- memory: an in-process asyncio queue flushed by the same process. Records still
+  buffered when the process dies are lost: for development and single-node setups.
+"""
+from __future__ import annotations
+import asyncio
+import csv
+import io
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import exc, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.metrics import TASK_RUN_BUFFER_FLUSH_SECONDS, TASK_RUN_BUFFER_RECORDS
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODES = ("sync", "redis", "memory")
+CONSUMER_GROUP = "task_run_writers"
+
+
+class RunRecord(NamedTuple):
+    client_run_id: str
+    task_id: int
+    worker_id: str
+    lat: float
+    lng: float
+    distance_m: float
+    allowed: bool
+    client_ts: datetime | None
+    created_at: datetime
+
+    def to_fields(self) -> dict[str, str]:
+        return {
+            "client_run_id": self.client_run_id,
+            "task_id": str(self.task_id),
+            "worker_id": self.worker_id,
+            "lat": repr(self.lat),
+            "lng": repr(self.lng),
+            "distance_m": repr(self.distance_m),
+            "allowed": "1" if self.allowed else "0",
+            "client_ts": self.client_ts.isoformat() if self.client_ts else "",
+            "created_at": self.created_at.isoformat(),
+        }
+
+    @classmethod
+    def from_fields(cls, f: dict[str, str]) -> "RunRecord":
+        return cls(
+            client_run_id=f["client_run_id"],
+            task_id=int(f["task_id"]),
+            worker_id=f["worker_id"],
+            lat=float(f["lat"]),
+            lng=float(f["lng"]),
+            distance_m=float(f["distance_m"]),
+            allowed=f["allowed"] == "1",
+            client_ts=datetime.fromisoformat(f["client_ts"]) if f["client_ts"] else None,
+            created_at=datetime.fromisoformat(f["created_at"]),
+        )
+
+
+def new_record(task_id: int, worker_id: str, lat: float, lng: float, distance_m: float, allowed: bool,
+               client_run_id: uuid.UUID | None = None, client_ts: datetime | None = None) -> RunRecord:
+    return RunRecord(
+        client_run_id=str(client_run_id or uuid.uuid4()),
+        task_id=task_id,
+        worker_id=worker_id,
+        lat=lat,
+        lng=lng,
+        distance_m=distance_m,
+        allowed=allowed,
+        client_ts=client_ts,
+        created_at=datetime.now(timezone.utc),
+    )
+
+
+# --- writing -------------------------------------------------------------------------
+
+STAGE_COLUMNS = "client_run_id, task_id, worker_id, client_location, distance_m, allowed, client_ts, created_at"
+CREATE_STAGE_SQL = text('''
+    CREATE TEMP TABLE IF NOT EXISTS task_runs_stage (
+        client_run_id uuid, task_id integer, worker_id varchar(120), client_location geography(POINT, 4326),
+        distance_m double precision, allowed boolean, client_ts timestamptz, created_at timestamptz
+    ) ON COMMIT DELETE ROWS
+''')
+COPY_STAGE_SQL = f"COPY task_runs_stage ({STAGE_COLUMNS}) FROM STDIN WITH (FORMAT csv)"
+MERGE_STAGE_SQL = text(f'''
+    INSERT INTO task_runs ({STAGE_COLUMNS})
+    SELECT {STAGE_COLUMNS} FROM task_runs_stage
+    ON CONFLICT (client_run_id, created_at) DO NOTHING
+''')
+
+
+def to_csv(records: list[RunRecord]) -> io.StringIO:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in records:
+        w.writerow([
+            r.client_run_id, r.task_id, r.worker_id, f"SRID=4326;POINT({r.lng!r} {r.lat!r})",
+            repr(r.distance_m), "t" if r.allowed else "f",
+            r.client_ts.isoformat() if r.client_ts else None, r.created_at.isoformat(),
+        ])
+    buf.seek(0)
+    return buf
+
+
+def write_runs(engine: Engine, records: list[RunRecord]) -> int:
+    """COPY a batch into task_runs in one transaction; returns rows inserted (duplicates skipped)."""
+    with engine.begin() as conn:
+        conn.execute(CREATE_STAGE_SQL)
+        cur = conn.connection.driver_connection.cursor()
+        try:
+            cur.copy_expert(COPY_STAGE_SQL, to_csv(records))
+        finally:
+            cur.close()
+        return conn.execute(MERGE_STAGE_SQL).rowcount
+
+
+def write_isolating_bad_rows(engine: Engine, records: list[RunRecord]) -> tuple[int, int]:
+    """Write a batch; if it is rejected for its data, write row by row and drop the bad rows.
+
+    Returns (inserted, dropped). Connection errors propagate so the batch is retried.
+    """
+    try:
+        return write_runs(engine, records), 0
+    except exc.OperationalError:
+        raise
+    except exc.DBAPIError:
+        if len(records) == 1:
+            logger.exception("dropping task run %s", records[0].client_run_id)
+            return 0, 1
+    inserted = dropped = 0
+    for record in records:
+        i, d = write_isolating_bad_rows(engine, [record])
+        inserted += i
+        dropped += d
+    return inserted, dropped
+
+
+# --- inline writes -------------------------------------------------------------------
+# The unique index cannot catch a retry written inline: its created_at is a new NOW().
+# So the ids are looked up within TASK_RUN_DEDUP_TTL_SEC (which prunes older partitions),
+# under a transaction-scoped advisory lock per id so concurrent retries cannot both insert.
+
+LOCK_RUN_IDS_SQL = text('''
+    SELECT pg_advisory_xact_lock(k) FROM (
+        SELECT DISTINCT hashtextextended(id, 0) AS k FROM unnest(CAST(:ids AS text[])) AS id ORDER BY k
+    ) AS keys
+''')
+RECORDED_RUN_IDS_SQL = text('''
+    SELECT client_run_id::text FROM task_runs
+    WHERE client_run_id = ANY(CAST(:ids AS uuid[])) AND created_at >= NOW() - make_interval(secs => :ttl)
+''')
+
+
+def recorded_run_ids(db: Session, ids: list[str]) -> set[str]:
+    """The client_run_ids among `ids` already in task_runs. Holds their locks until the
+    caller's transaction ends, so insert the others before committing."""
+    if not ids:
+        return set()
+    db.execute(LOCK_RUN_IDS_SQL, {"ids": ids})
+    return set(db.execute(RECORDED_RUN_IDS_SQL, {"ids": ids, "ttl": float(settings.TASK_RUN_DEDUP_TTL_SEC)}).scalars())
+
+
+async def arecorded_run_ids(db: AsyncSession, ids: list[str]) -> set[str]:
+    if not ids:
+        return set()
+    await db.execute(LOCK_RUN_IDS_SQL, {"ids": ids})
+    res = await db.execute(RECORDED_RUN_IDS_SQL, {"ids": ids, "ttl": float(settings.TASK_RUN_DEDUP_TTL_SEC)})
+    return set(res.scalars())
+
+
+# --- buffers -------------------------------------------------------------------------
+
+class MemoryRunBuffer:
+    def __init__(self, max_size: int, dedup_size: int = 100_000):
+        self.queue: asyncio.Queue[RunRecord] = asyncio.Queue(max_size)
+        self._retry: list[RunRecord] = []
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._dedup_size = dedup_size
+
+    async def first_seen(self, client_run_id: str) -> bool:
+        if client_run_id in self._seen:
+            return False
+        self._seen[client_run_id] = None
+        if len(self._seen) > self._dedup_size:
+            self._seen.popitem(last=False)
+        return True
+
+    async def forget(self, client_run_id: str) -> None:
+        self._seen.pop(client_run_id, None)
+
+    async def append(self, record: RunRecord) -> bool:
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def read(self, count: int, block_ms: int) -> list[tuple[str, RunRecord]]:
+        batch, self._retry = self._retry[:count], self._retry[count:]
+        if not batch:
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), block_ms / 1000))
+            except asyncio.TimeoutError:
+                return []
+        while len(batch) < count and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return [("", r) for r in batch]
+
+    async def ack(self, ids: list[str]) -> None:
+        return None
+
+    async def requeue(self, entries: list[tuple[str, RunRecord]]) -> None:
+        self._retry = [r for _, r in entries] + self._retry
+
+
+class RedisRunBuffer:
+    def __init__(self, client: aioredis.Redis, stream: str, consumer: str | None = None):
+        self.client = client
+        self.stream = stream
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._group_ready = False
+        self._own_pending = True  # re-read our own unacked entries first after a (re)start
+        self._next_claim = 0.0
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.client.xgroup_create(self.stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def first_seen(self, client_run_id: str) -> bool:
+        return bool(await self.client.set(f"task_run:{client_run_id}", 1, nx=True, ex=settings.TASK_RUN_DEDUP_TTL_SEC))
+
+    async def forget(self, client_run_id: str) -> None:
+        try:
+            await self.client.delete(f"task_run:{client_run_id}")
+        except (redis.RedisError, OSError) as e:
+            # the marker expires after TASK_RUN_DEDUP_TTL_SEC; until then retries are acknowledged
+            logger.warning("could not clear dedup marker for task run %s: %s", client_run_id, e)
+
+    async def append(self, record: RunRecord) -> bool:
+        await self.client.xadd(self.stream, record.to_fields(), maxlen=settings.TASK_RUN_STREAM_MAXLEN, approximate=True)
+        return True
+
+    async def read(self, count: int, block_ms: int) -> list[tuple[str, RunRecord]]:
+        await self._ensure_group()
+        if self._own_pending:
+            entries = await self._xread("0", count, None)
+            if entries:
+                return entries
+            self._own_pending = False
+        # entries another flusher read but never acked (it died mid-batch)
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + settings.TASK_RUN_CLAIM_IDLE_MS / 2000
+            claimed = await self.client.xautoclaim(
+                self.stream, CONSUMER_GROUP, self.consumer, settings.TASK_RUN_CLAIM_IDLE_MS, "0-0", count=count
+            )
+            if claimed[1]:
+                return self._decode(claimed[1])
+        return await self._xread(">", count, block_ms)
+
+    async def _xread(self, start: str, count: int, block_ms: int | None) -> list[tuple[str, RunRecord]]:
+        resp = await self.client.xreadgroup(CONSUMER_GROUP, self.consumer, {self.stream: start}, count=count, block=block_ms)
+        return self._decode(resp[0][1]) if resp else []
+
+    def _decode(self, messages) -> list[tuple[str, RunRecord]]:
+        out = []
+        for msg_id, fields in messages:
+            if not fields:  # trimmed away by MAXLEN while pending
+                continue
+            out.append((msg_id, RunRecord.from_fields(fields)))
+        return out
+
+    async def ack(self, ids: list[str]) -> None:
+        if ids:
+            await self.client.xack(self.stream, CONSUMER_GROUP, *ids)
+
+    async def requeue(self, entries: list[tuple[str, RunRecord]]) -> None:
+        # unacked entries stay pending for this consumer; read them again first
+        self._own_pending = True
+
+
+_buffer: MemoryRunBuffer | RedisRunBuffer | None = None
+_redis: aioredis.Redis | None = None
+
+
+def get_run_buffer() -> MemoryRunBuffer | RedisRunBuffer | None:
+    """The buffer for TASK_RUN_WRITE_MODE, or None in "sync" mode. Call from the event loop."""
+    global _buffer, _redis
+    mode = settings.TASK_RUN_WRITE_MODE
+    if mode not in WRITE_MODES:
+        raise ValueError(f"Unknown TASK_RUN_WRITE_MODE {mode!r}; expected one of {WRITE_MODES}")
+    if mode == "sync":
+        return None
+    if _buffer is None:
+        if mode == "memory":
+            _buffer = MemoryRunBuffer(settings.TASK_RUN_BUFFER_MAX)
+        else:
+            _redis = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+            _buffer = RedisRunBuffer(_redis, settings.TASK_RUN_STREAM)
+    return _buffer
+
+
+async def accept_run(record: RunRecord, dedup: bool = True) -> bool:
+    """Buffer a run; False means the caller has to write it inline.
+
+    With `dedup`, a client_run_id accepted before is acknowledged without buffering it
+    again. Redis errors and a full memory queue return False, so the run is written
+    synchronously instead of being lost. The id's dedup marker is then cleared again: the
+    inline write may fail too, and the client's retry must not be taken for a duplicate.
+    """
+    buf = get_run_buffer()
+    marked = False
+    try:
+        if dedup:
+            if not await buf.first_seen(record.client_run_id):
+                TASK_RUN_BUFFER_RECORDS.labels("duplicate").inc()
+                return True
+            marked = True
+        if await buf.append(record):
+            TASK_RUN_BUFFER_RECORDS.labels("buffered").inc()
+            return True
+    except (redis.RedisError, OSError) as e:
+        logger.warning("task run buffer unavailable, writing inline: %s", e)
+    if marked:
+        await buf.forget(record.client_run_id)
+    TASK_RUN_BUFFER_RECORDS.labels("inline").inc()
+    return False
+
+
+class RunFlusher:
+    """Background task draining a buffer into task_runs."""
+
+    def __init__(self, buffer, engine: Engine, batch: int | None = None, block_ms: int | None = None):
+        self.buffer = buffer
+        self.engine = engine
+        self.batch = batch or settings.TASK_RUN_FLUSH_BATCH
+        self.block_ms = block_ms or settings.TASK_RUN_FLUSH_INTERVAL_MS
+        self._task: asyncio.Task | None = None
+        self._stopping = False
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self, drain: bool = True) -> None:
+        self._stopping = True
+        if self._task:
+            await self._task
+        if drain:
+            while await self.flush_once():
+                pass
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await self.flush_once()
+            except Exception:
+                logger.exception("task run flush failed; retrying")
+                await asyncio.sleep(1)
+
+    async def flush_once(self) -> int:
+        entries = await self.buffer.read(self.batch, self.block_ms)
+        if not entries:
+            return 0
+        started = time.perf_counter()
+        try:
+            inserted, dropped = await run_in_threadpool(write_isolating_bad_rows, self.engine, [r for _, r in entries])
+        except Exception:
+            await self.buffer.requeue(entries)
+            raise
+        await self.buffer.ack([msg_id for msg_id, _ in entries])
+        TASK_RUN_BUFFER_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        TASK_RUN_BUFFER_RECORDS.labels("written").inc(inserted)
+        TASK_RUN_BUFFER_RECORDS.labels("dropped").inc(dropped)
+        TASK_RUN_BUFFER_RECORDS.labels("redelivered").inc(len(entries) - inserted - dropped)
+        return len(entries)
+
+
+_flusher: RunFlusher | None = None
+
+
+async def start_flusher(engine: Engine) -> RunFlusher | None:
+    global _flusher
+    buf = get_run_buffer()
+    if buf is None or _flusher is not None:
+        return _flusher
+    _flusher = RunFlusher(buf, engine)
+    _flusher.start()
+    return _flusher
+
+
+async def stop_flusher() -> None:
+    global _flusher, _buffer, _redis
+    if _flusher is not None:
+        await _flusher.stop()
+        _flusher = None
+    if _redis is not None:
+        await _redis.aclose()
+    _buffer = _redis = None
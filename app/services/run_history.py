@@ -0,0 +1,137 @@
+"""Read task_runs back, newest first, with keyset pagination on (created_at, id).
+
+A page is requested with an opaque cursor (the last row's created_at and id) instead of
+an OFFSET. For task and worker runs page N costs the same as page 1: the
+(task_id, created_at) and (worker_id, created_at) indexes are walked from the cursor
+down, and the cursor, since and until all bound created_at so that whole monthly
+partitions are pruned.
+
+task_runs has no store_id, so store runs are the runs of all the store's tasks merged
+and sorted. To keep that bounded, a store page always covers a time window: since
+defaults to STORE_WINDOW before until (or now), and the window may span at most
+STORE_MAX_WINDOW. A page then reads at most the store's runs in that window, from a
+few partitions. Pages are streamed as JSON from a server-side cursor; the body is
+written row by row and `next_cursor` comes last.
+"""
+from __future__ import annotations
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+from sqlalchemy import text
+from app.core.db import async_session
+
+# scope -> predicate on the run; store runs go through their tasks
+SCOPES = {
+    "task": "r.task_id = :key",
+    "store": "t.store_id = :key",
+    "worker": "r.worker_id = :key",
+}
+
+# store scope: default and longest since..until window (see the module docstring)
+STORE_WINDOW = timedelta(days=30)
+STORE_MAX_WINDOW = timedelta(days=92)
+
+_RUNS_SELECT = '''
+    SELECT r.id, r.task_id, t.store_id, r.worker_id, r.client_run_id,
+           ST_Y(r.client_location::geometry) AS lat, ST_X(r.client_location::geometry) AS lng,
+           r.distance_m, r.allowed, r.client_ts, r.event, r.created_at
+    FROM task_runs r
+    JOIN tasks t ON t.id = r.task_id
+'''
+
+
+def encode_cursor(created_at: datetime, run_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{run_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Inverse of encode_cursor; ValueError for anything that is not one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, run_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(run_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def runs_query(scope: str, cursor: str | None = None, since: datetime | None = None,
+               until: datetime | None = None) -> tuple[str, dict]:
+    """SQL and bind params (without :key and :limit) for one page of a scope."""
+    where = [SCOPES[scope]]
+    params: dict = {}
+    if scope == "store":
+        since = store_window(since, until)
+    if cursor:
+        params["after_ts"], params["after_id"] = decode_cursor(cursor)
+        # the plain bound lets the planner prune partitions, the row comparison does not
+        where.append("r.created_at <= :after_ts AND (r.created_at, r.id) < (:after_ts, :after_id)")
+    if since:
+        where.append("r.created_at >= :since")
+        params["since"] = since
+    if until:
+        where.append("r.created_at < :until")
+        params["until"] = until
+    sql = _RUNS_SELECT + "WHERE " + " AND ".join(where) + " ORDER BY r.created_at DESC, r.id DESC LIMIT :limit"
+    return sql, params
+
+
+def store_window(since: datetime | None, until: datetime | None) -> datetime:
+    """`since` for a store page: defaulted, and ValueError if the window is too wide."""
+    end = _utc(until) if until else datetime.now(timezone.utc)
+    start = _utc(since) if since else end - STORE_WINDOW
+    if end - start > STORE_MAX_WINDOW:
+        raise ValueError(f"since and until may be at most {STORE_MAX_WINDOW.days} days apart for store runs")
+    return start
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def run_to_json(row) -> str:
+    return json.dumps({
+        "id": row["id"],
+        "task_id": row["task_id"],
+        "store_id": row["store_id"],
+        "worker_id": row["worker_id"],
+        "client_run_id": str(row["client_run_id"]) if row["client_run_id"] else None,
+        "lat": row["lat"],
+        "lng": row["lng"],
+        "distance_m": float(row["distance_m"]),
+        "allowed": row["allowed"],
+        "client_ts": row["client_ts"].isoformat() if row["client_ts"] else None,
+        "event": row["event"],
+        "created_at": row["created_at"].isoformat(),
+    })
+
+
+def stream_runs(scope: str, key, limit: int, cursor: str | None = None, since: datetime | None = None,
+                until: datetime | None = None) -> AsyncIterator[str]:
+    """One page as chunks of `{"items": [...], "next_cursor": ...}`.
+
+    The cursor is checked here (ValueError), before the response starts.
+    """
+    sql, params = runs_query(scope, cursor, since, until)
+    params.update(key=key, limit=limit + 1)
+    return _stream_page(sql, params, limit)
+
+
+async def _stream_page(sql: str, params: dict, limit: int) -> AsyncIterator[str]:
+    # One extra row tells whether there is a next page. The session is opened here because
+    # a streamed body is sent after the request's dependencies have been closed.
+    yield '{"items": ['
+    sent = 0
+    last = None
+    async with async_session() as db:
+        result = await db.stream(text(sql), params)
+        async for row in result.mappings():
+            if sent == limit:
+                break
+            yield ("," if sent else "") + run_to_json(row)
+            sent += 1
+            last = row
+        else:
+            last = None  # no extra row: this was the last page
+    next_cursor = encode_cursor(last["created_at"], last["id"]) if last is not None else None
+    yield '], "next_cursor": ' + json.dumps(next_cursor) + "}"
@@ -0,0 +1,83 @@
+"""Per store, per UTC day rollup of task_runs (table task_run_daily, migration 0009).
+
+Dashboards read the rollup instead of scanning task_runs. `refresh_daily` recomputes
+whole days from `since` on and upserts them, so it can be re-run at any time: the
+periodic Celery task refreshes the last TASK_RUN_ROLLUP_LOOKBACK_DAYS days (late
+write-behind flushes and offline batches land there), scripts/task_runs_rollup.py
+backfills older days. Recomputing a day rather than adding deltas keeps the percentiles
+exact. Rollup rows outlive retired task_runs partitions.
+"""
+from __future__ import annotations
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+# upper bounds (metres) of the distance histogram buckets; the last bucket is open-ended
+DISTANCE_BUCKETS_M = (10, 25, 50, 100, 250, 500, 1000, 5000)
+
+_BUCKET = "width_bucket(r.distance_m, ARRAY[{}]::float8[])".format(", ".join(str(b) for b in DISTANCE_BUCKETS_M))
+_HISTOGRAM = "ARRAY[" + ", ".join(
+    f"count(*) FILTER (WHERE {_BUCKET} = {i})" for i in range(len(DISTANCE_BUCKETS_M) + 1)
+) + "]"
+
+REFRESH_DAILY_SQL = text(f'''
+    INSERT INTO task_run_daily (store_id, day, runs, allowed, distance_p50, distance_p90, distance_p99,
+                                distance_histogram, refreshed_at)
+    SELECT t.store_id, (r.created_at AT TIME ZONE 'UTC')::date, count(*), count(*) FILTER (WHERE r.allowed),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY r.distance_m),
+           percentile_cont(0.9) WITHIN GROUP (ORDER BY r.distance_m),
+           percentile_cont(0.99) WITHIN GROUP (ORDER BY r.distance_m),
+           {_HISTOGRAM}, NOW()
+    FROM task_runs r
+    JOIN tasks t ON t.id = r.task_id
+    WHERE r.created_at >= :start AND r.created_at < :end
+      -- a streamed visit counts once, by its enter; exit and dwell are the same visit
+      AND (r.event IS NULL OR r.event = 'enter')
+    GROUP BY 1, 2
+    ON CONFLICT (store_id, day) DO UPDATE SET
+        runs = EXCLUDED.runs, allowed = EXCLUDED.allowed,
+        distance_p50 = EXCLUDED.distance_p50, distance_p90 = EXCLUDED.distance_p90,
+        distance_p99 = EXCLUDED.distance_p99, distance_histogram = EXCLUDED.distance_histogram,
+        refreshed_at = EXCLUDED.refreshed_at
+''')
+DAILY_SQL = text('''
+    SELECT day, runs, allowed, distance_p50, distance_p90, distance_p99, distance_histogram
+    FROM task_run_daily
+    WHERE store_id = :store_id AND day >= :start AND day <= :end
+    ORDER BY day
+''')
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def refresh_daily(db: Session, since: date, until: date | None = None) -> int:
+    """Recompute the rollup for days since..until (inclusive, default today); returns rows upserted."""
+    until = until or datetime.now(timezone.utc).date()
+    res = db.execute(REFRESH_DAILY_SQL, {"start": day_start(since), "end": day_start(until + timedelta(days=1))})
+    db.commit()
+    return res.rowcount
+
+
+def daily_to_out(row) -> dict:
+    runs, allowed = row["runs"], row["allowed"]
+    bounds = [*DISTANCE_BUCKETS_M, None]
+    return {
+        "day": row["day"],
+        "runs": runs,
+        "allowed": allowed,
+        "denied": runs - allowed,
+        "allow_rate": allowed / runs if runs else 0.0,
+        "deny_rate": (runs - allowed) / runs if runs else 0.0,
+        "distance_p50": row["distance_p50"],
+        "distance_p90": row["distance_p90"],
+        "distance_p99": row["distance_p99"],
+        "distance_histogram": [{"lt_m": b, "count": c} for b, c in zip(bounds, row["distance_histogram"])],
+    }
+
+
+async def store_daily(db: AsyncSession, store_id: int, start: date, end: date) -> list[dict]:
+    res = await db.execute(DAILY_SQL, {"store_id": store_id, "start": start, "end": end})
+    return [daily_to_out(row) for row in res.mappings()]
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class StoreGeofence:
+    task_id: int
+    task_active: bool
+    store_id: int
+    company_id: int
+    geocode_status: str
+    lat: float | None
+    lng: float | None
+    radius_m: int
+    # matched by containment in stores.geofence instead of by radius (app/services/polygons.py)
+    has_geofence: bool = False
+
+    @property
+    def ready(self) -> bool:
+        return self.geocode_status == "success" and self.lat is not None and self.lng is not None
+
+    @property
+    def checkable(self) -> bool:
+        # a polygon fence does not need the geocoded location
+        return self.has_geofence or self.ready
+
+
+# One round trip instead of db.get(Task) + db.get(Store) + db.get(Company).
+# NULLIF keeps the `custom_radius_m or geofence_radius_m` semantics of the ORM path.
+_LOOKUP_SELECT = '''
+    SELECT
+        t.id AS task_id,
+        t.active AS task_active,
+        s.id AS store_id,
+        s.company_id AS company_id,
+        s.geocode_status AS geocode_status,
+        ST_Y(s.location::geometry) AS lat,
+        ST_X(s.location::geometry) AS lng,
+        COALESCE(NULLIF(s.custom_radius_m, 0), c.geofence_radius_m) AS radius_m,
+        s.geofence IS NOT NULL AS has_geofence
+    FROM tasks t
+    JOIN stores s ON s.id = t.store_id
+    JOIN companies c ON c.id = s.company_id
+'''
+LOOKUP_SQL = text(_LOOKUP_SELECT + "WHERE t.id = :task_id LIMIT 1;")
+LOOKUP_MANY_SQL = text(_LOOKUP_SELECT + "WHERE t.id = ANY(CAST(:task_ids AS integer[]));")
+
+
+def row_to_geofence(row) -> StoreGeofence:
+    return StoreGeofence(
+        task_id=int(row["task_id"]),
+        task_active=bool(row["task_active"]),
+        store_id=int(row["store_id"]),
+        company_id=int(row["company_id"]),
+        geocode_status=row["geocode_status"],
+        lat=float(row["lat"]) if row["lat"] is not None else None,
+        lng=float(row["lng"]) if row["lng"] is not None else None,
+        radius_m=int(row["radius_m"]),
+        has_geofence=bool(row.get("has_geofence")),
+    )
+
+
+class StoreGeofenceCache:
+    """Bounded LRU of task_id -> StoreGeofence with a TTL.
+
+    Only checkable (geocoded or fenced) stores are cached, so a store that finishes geocoding
+    is picked up on the next check-in without waiting for the TTL.
+    """
+
+    def __init__(self, max_entries: int, ttl_sec: int):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[int, tuple[float, StoreGeofence]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, task_id: int) -> StoreGeofence | None:
+        with self._lock:
+            item = self._entries.get(task_id)
+            if item is None:
+                return None
+            expires_at, geo = item
+            if expires_at < time.monotonic():
+                del self._entries[task_id]
+                return None
+            self._entries.move_to_end(task_id)
+            return geo
+
+    def put(self, geo: StoreGeofence) -> None:
+        if self.max_entries <= 0 or not geo.checkable:
+            return
+        with self._lock:
+            self._entries[geo.task_id] = (time.monotonic() + self.ttl_sec, geo)
+            self._entries.move_to_end(geo.task_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_store(self, store_id: int) -> None:
+        with self._lock:
+            for task_id in [k for k, (_, g) in self._entries.items() if g.store_id == store_id]:
+                del self._entries[task_id]
+
+    def invalidate_company(self, company_id: int) -> None:
+        with self._lock:
+            for task_id in [k for k, (_, g) in self._entries.items() if g.company_id == company_id]:
+                del self._entries[task_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+store_geofences = StoreGeofenceCache(settings.STORE_CACHE_MAX_ENTRIES, settings.STORE_CACHE_TTL_SEC)
+
+
+def get_store_geofence(db: Session, task_id: int) -> StoreGeofence | None:
+    geo = store_geofences.get(task_id)
+    if geo is not None:
+        return geo
+    row = db.execute(LOOKUP_SQL, {"task_id": task_id}).mappings().first()
+    if not row:
+        return None
+    geo = row_to_geofence(row)
+    store_geofences.put(geo)
+    return geo
+
+
+async def aget_store_geofence(db: AsyncSession, task_id: int) -> StoreGeofence | None:
+    geo = store_geofences.get(task_id)
+    if geo is not None:
+        return geo
+    row = (await db.execute(LOOKUP_SQL, {"task_id": task_id})).mappings().first()
+    if not row:
+        return None
+    geo = row_to_geofence(row)
+    store_geofences.put(geo)
+    return geo
+
+
+def get_store_geofences(db: Session, task_ids) -> dict[int, StoreGeofence]:
+    """Resolve many tasks at once: cache hits first, then one query for the rest."""
+    found: dict[int, StoreGeofence] = {}
+    missing = []
+    for task_id in set(task_ids):
+        geo = store_geofences.get(task_id)
+        if geo is not None:
+            found[task_id] = geo
+        else:
+            missing.append(task_id)
+    if missing:
+        for row in db.execute(LOOKUP_MANY_SQL, {"task_ids": missing}).mappings():
+            geo = row_to_geofence(row)
+            store_geofences.put(geo)
+            found[geo.task_id] = geo
+    return found
+
+
+def invalidate_store(store_id: int) -> None:
+    store_geofences.invalidate_store(store_id)
+
+
+def invalidate_company(company_id: int) -> None:
+    store_geofences.invalidate_company(company_id)
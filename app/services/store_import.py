@@ -0,0 +1,169 @@
+from __future__ import annotations
+import csv
+import json
+from typing import Callable, Iterable, Iterator
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.models import StoreImport
+
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+MAX_ERRORS_KEPT = 20
+
+# One statement per chunk for stores, one for their geocode_jobs rows.
+INSERT_STORES_SQL = text('''
+    INSERT INTO stores (company_id, import_id, name, address_lines, city, state, country, postal_code, geocode_status)
+    SELECT :company_id, :import_id, r.name, r.address_lines, r.city, r.state, r.country, r.postal_code, 'pending'
+    FROM unnest(
+        CAST(:names AS text[]), CAST(:address_lines AS text[]), CAST(:cities AS text[]),
+        CAST(:states AS text[]), CAST(:countries AS text[]), CAST(:postal_codes AS text[])
+    ) AS r(name, address_lines, city, state, country, postal_code)
+    RETURNING id;
+''')
+INSERT_GEOCODE_JOBS_SQL = text('''
+    INSERT INTO geocode_jobs (store_id, status)
+    SELECT store_id, 'queued' FROM unnest(CAST(:store_ids AS integer[])) AS store_id;
+''')
+
+
+def format_for(content_type: str | None, filename: str | None = None) -> str | None:
+    if content_type:
+        fmt = CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+        if fmt:
+            return fmt
+    if filename:
+        if filename.endswith(".csv"):
+            return "csv"
+        if filename.endswith((".ndjson", ".jsonl")):
+            return "ndjson"
+    return None
+
+
+def normalize_row(raw: dict) -> dict:
+    """Same shape and required fields as StoreCreate; address_lines may be a list or a string."""
+    row = {k: (str(v).strip() if v is not None and not isinstance(v, list) else v) for k, v in raw.items()}
+    for field in ("name", "city", "country"):
+        if not row.get(field):
+            raise ValueError(f"missing {field}")
+    address = row.get("address_lines")
+    if isinstance(address, list):
+        address = "; ".join(str(a) for a in address)
+    if not address:
+        raise ValueError("missing address_lines")
+    return {
+        "name": row["name"],
+        "address_lines": address,
+        "city": row["city"],
+        "state": row.get("state") or None,
+        "country": row["country"],
+        "postal_code": row.get("postal_code") or None,
+    }
+
+
+def parse_rows(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """Yield (row_number, row, error) one line at a time, so input size never matters."""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for n, raw in enumerate(reader, start=1):
+            try:
+                yield n, normalize_row(raw), None
+            except ValueError as e:
+                yield n, None, str(e)
+    elif fmt == "ndjson":
+        n = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            n += 1
+            try:
+                raw = json.loads(line)
+                if not isinstance(raw, dict):
+                    raise ValueError("not a JSON object")
+                yield n, normalize_row(raw), None
+            except ValueError as e:
+                yield n, None, str(e)
+    else:
+        raise ValueError(f"Unsupported format {fmt!r}")
+
+
+def _insert_chunk(db: Session, imp: StoreImport, rows: list[dict]) -> list[int]:
+    store_ids = list(db.execute(INSERT_STORES_SQL, {
+        "company_id": imp.company_id,
+        "import_id": imp.id,
+        "names": [r["name"] for r in rows],
+        "address_lines": [r["address_lines"] for r in rows],
+        "cities": [r["city"] for r in rows],
+        "states": [r["state"] for r in rows],
+        "countries": [r["country"] for r in rows],
+        "postal_codes": [r["postal_code"] for r in rows],
+    }).scalars())
+    db.execute(INSERT_GEOCODE_JOBS_SQL, {"store_ids": store_ids})
+    return store_ids
+
+
+def run_import(
+    db: Session,
+    import_id: int,
+    lines: Iterable[str],
+    enqueue: Callable[[list[int]], None],
+    chunk_size: int | None = None,
+    on_progress: Callable[[StoreImport], None] | None = None,
+) -> StoreImport:
+    """Stream rows into stores chunk by chunk: one INSERT + one commit per chunk, then
+    hand the new store ids to `enqueue` for geocoding."""
+    chunk_size = chunk_size or settings.STORE_IMPORT_CHUNK_SIZE
+    imp = db.get(StoreImport, import_id)
+    imp.status = "running"
+    db.commit()
+
+    errors: list[str] = []
+    chunk: list[dict] = []
+
+    def flush():
+        if chunk:
+            store_ids = _insert_chunk(db, imp, chunk)
+            imp.inserted += len(store_ids)
+        imp.error_msg = "\n".join(errors) or None
+        db.commit()
+        if chunk:
+            enqueue(store_ids)
+            chunk.clear()
+        if on_progress:
+            on_progress(imp)
+
+    try:
+        for n, row, error in parse_rows(lines, imp.source):
+            imp.total_rows += 1
+            if error:
+                imp.failed += 1
+                if len(errors) < MAX_ERRORS_KEPT:
+                    errors.append(f"row {n}: {error}")
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+        imp.status = "done"
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        imp.status = "failed"
+        imp.error_msg = "\n".join(errors + [f"aborted: {e}"])
+        db.commit()
+        raise
+    return imp
+
+
+def geocode_progress(db: Session, import_id: int) -> dict[str, int]:
+    rows = db.execute(
+        text("SELECT geocode_status, COUNT(*) AS n FROM stores WHERE import_id = :id GROUP BY geocode_status"),
+        {"id": import_id},
+    ).mappings()
+    return {row["geocode_status"]: int(row["n"]) for row in rows}
@@ -0,0 +1,50 @@
+"""One long-lived event loop per worker process for the async parts of sync Celery tasks.
+
+The loop runs in a daemon thread and tasks hand it coroutines with `run()`, so it works
+the same under the prefork, threads and solo pools. Keeping one loop for the life of the
+process is what lets the shared geocoder HTTP client keep its connections alive between
+tasks. A forked child never reuses its parent's loop: it is recreated on first use.
+"""
+from __future__ import annotations
+import asyncio
+import os
+import threading
+from typing import Awaitable, TypeVar
+from celery.signals import worker_process_shutdown
+from app.services.geocoding import close_http_client
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_loop: asyncio.AbstractEventLoop | None = None
+_pid: int | None = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _pid
+    with _lock:
+        if _loop is None or _pid != os.getpid() or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="worker-event-loop", daemon=True).start()
+            _loop, _pid = loop, os.getpid()
+        return _loop
+
+
+def run(coro: Awaitable[T], timeout: float | None = None) -> T:
+    """Run a coroutine on the process loop from sync code and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+def shutdown() -> None:
+    global _loop
+    with _lock:
+        loop, _loop = _loop, None
+    if loop is None or _pid != os.getpid():
+        return
+    asyncio.run_coroutine_threadsafe(close_http_client(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+@worker_process_shutdown.connect
+def _close_loop(**_):
+    shutdown()
@@ -2,5 +2,13 @@ from celery import Celery
 from app.core.config import settings
 
 celery_app = Celery("geofence", broker=settings.REDIS_URL, backend=settings.REDIS_URL)
-celery_app.conf.task_routes = {"app.workers.tasks.enqueue_geocode": {"queue": "geocode"}}
-
+celery_app.conf.task_routes = {
+    "app.workers.tasks.enqueue_geocode": {"queue": "geocode"},
+    "app.workers.tasks.geocode_stores": {"queue": "geocode"},
+}
+celery_app.conf.beat_schedule = {
+    "refresh-run-rollup": {
+        "task": "app.workers.tasks.refresh_run_rollup",
+        "schedule": float(settings.TASK_RUN_ROLLUP_INTERVAL_SEC),
+    },
+}
@@ -1,52 +1,325 @@
-from celery import shared_task
+import random
+from datetime import datetime, timedelta, timezone
+import redis
+from celery import group, shared_task
+from celery.utils.log import get_task_logger
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from app.core.config import settings
 from app.core.db import SessionLocal
-from app.models.models import Store, GeocodeJob
-from app.services.geocoding import geocode_address
+from app.core.metrics import GEOCODE_CACHE_LOOKUPS
+from app.models.models import Store
+from app.services.addresses import normalize_address
+from app.services.cell_index import index_company, index_stores
+from app.services.change_feed import company_changed, stores_changed
+from app.services.geocode_cache import cache_store, cached_lookup
+from app.services.geocoding import GeocodeQuery, GeocodeResult, geocode, geocode_many, local_lookup, provider_order
+from app.services.run_rollup import refresh_daily
+from app.workers import aio
 
-@shared_task(name="app.workers.tasks.enqueue_geocode", bind=True, max_retries=5, default_retry_delay=30)
-def enqueue_geocode(self, store_id: int):
-    db: Session = SessionLocal()
+logger = get_task_logger(__name__)
+
+try:
+    _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+except Exception:
+    _redis = None
+
+STORE_ADDRESSES_SQL = text('''
+    SELECT id, address_lines, city, state, country, postal_code
+    FROM stores WHERE id = ANY(CAST(:ids AS integer[]))
+''')
+UPDATE_STORE_LOCATIONS_SQL = text('''
+    UPDATE stores s
+    SET location = CASE WHEN r.lat IS NULL THEN s.location
+                        ELSE ST_SetSRID(ST_MakePoint(r.lng, r.lat), 4326)::geography END,
+        geocode_status = r.status
+    FROM unnest(
+        CAST(:ids AS integer[]), CAST(:lats AS double precision[]),
+        CAST(:lngs AS double precision[]), CAST(:statuses AS text[])
+    ) AS r(id, lat, lng, status)
+    WHERE s.id = r.id
+''')
+# geocode_jobs holds one row per store (unique store_id): queued by the API, started by
+# each attempt (attempts + 1), finished once; retries and manual re-queues reuse it.
+QUEUE_GEOCODE_JOBS_SQL = text('''
+    INSERT INTO geocode_jobs (store_id, status, attempts)
+    SELECT store_id, 'queued', 0 FROM unnest(CAST(:ids AS integer[])) AS store_id
+    ON CONFLICT (store_id) DO UPDATE
+    SET status = 'queued', attempts = 0, error_msg = NULL, updated_at = NOW()
+''')
+START_GEOCODE_JOBS_SQL = text('''
+    INSERT INTO geocode_jobs (store_id, status, attempts)
+    SELECT store_id, 'running', 1 FROM unnest(CAST(:ids AS integer[])) AS store_id
+    ON CONFLICT (store_id) DO UPDATE
+    SET status = 'running', attempts = geocode_jobs.attempts + 1, updated_at = NOW()
+''')
+FINISH_GEOCODE_JOBS_SQL = text('''
+    UPDATE geocode_jobs j
+    SET status = r.status, provider = COALESCE(r.provider, j.provider),
+        error_msg = r.error_msg, updated_at = NOW()
+    FROM unnest(
+        CAST(:ids AS integer[]), CAST(:statuses AS text[]),
+        CAST(:providers AS text[]), CAST(:errors AS text[])
+    ) AS r(store_id, status, provider, error_msg)
+    WHERE j.store_id = r.store_id
+''')
+
+
+def queue_jobs(db: Session, store_ids: list[int]) -> None:
+    db.execute(QUEUE_GEOCODE_JOBS_SQL, {"ids": store_ids})
+
+
+def start_jobs(db: Session, store_ids: list[int]) -> None:
+    db.execute(START_GEOCODE_JOBS_SQL, {"ids": store_ids})
+
+
+def finish_jobs(db: Session, store_ids: list[int], statuses: list[str], providers: list[str | None], errors: list[str | None]) -> None:
+    db.execute(FINISH_GEOCODE_JOBS_SQL, {"ids": store_ids, "statuses": statuses, "providers": providers, "errors": errors})
+
+
+def _pending_key(store_id: int) -> str:
+    return f"geocode:pending:{store_id}"
+
+
+def claim_geocode(store_id: int) -> bool:
+    """Mark a store as having a geocode task pending; False if one already is.
+
+    The marker outlives every retry (GEOCODE_DEDUP_TTL_SEC) and is dropped when the task
+    finishes for good. Without Redis nothing is deduplicated.
+    """
+    if _redis is None:
+        return True
     try:
-        store = db.get(Store, store_id)
-        if not store:
-            return
+        return bool(_redis.set(_pending_key(store_id), 1, nx=True, ex=settings.GEOCODE_DEDUP_TTL_SEC))
+    except redis.RedisError:
+        return True
 
-        job = GeocodeJob(store_id=store_id, status="running")
-        db.add(job)
-        db.commit()
-        db.refresh(job)
 
-        parts = [store.address_lines or "", store.city or "", store.state or "", store.country or "", store.postal_code or ""]
-        address = ", ".join([p for p in parts if p])
+def release_geocode(store_id: int) -> None:
+    if _redis is None:
+        return
+    try:
+        _redis.delete(_pending_key(store_id))
+    except redis.RedisError:
+        pass
+
 
-        import asyncio
-        coords = asyncio.get_event_loop().run_until_complete(geocode_address(address))
+def enqueue_geocode_once(store_id: int) -> bool:
+    """Queue enqueue_geocode for a store unless one is already pending; True if queued."""
+    if not claim_geocode(store_id):
+        return False
+    enqueue_geocode.delay(store_id)
+    return True
 
-        if not coords:
-            job.status = "failed"
-            job.error_msg = "geocoder_no_result"
-            store.geocode_status = "failed"
-            db.commit()
-            return
 
-        lat, lng = coords
-        db.execute(text("UPDATE stores SET location = ST_SetSRID(ST_MakePoint(:lng,:lat),4326)::geography, geocode_status = 'success' WHERE id = :id"),
-                   {"lng": lng, "lat": lat, "id": store_id})
-        job.status = "success"
+def retry_delay(retries: int) -> float:
+    """Exponential backoff with equal jitter: half of base * 2^retries (capped) plus up to as much again."""
+    delay = min(settings.GEOCODE_RETRY_MAX_SEC, settings.GEOCODE_RETRY_BASE_SEC * 2 ** retries)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def split_providers(names: str | None = None) -> tuple[bool, list[str]]:
+    """(consult the gazetteer before the cache, providers to call on a cache miss).
+
+    Only a leading "local" skips the cache; listed later it is just another provider.
+    """
+    order = provider_order(names)
+    if order and order[0] == "local":
+        return True, [p for p in order[1:] if p != "local"]
+    return False, order
+
+
+def lookup(db: Session, key: str, query: GeocodeQuery, local_first: bool, providers: list[str]) -> tuple[GeocodeResult | None, str]:
+    """Gazetteer (when it leads the provider order), then the geocode cache.
+
+    Returns (result, source); (None, "provider") means the providers have to be asked.
+    """
+    if local_first:
+        result = local_lookup(query)
+        if result is not None:
+            GEOCODE_CACHE_LOOKUPS.labels("local").inc()
+            return result, "local"
+        if not providers:
+            return None, "local"
+    if not key:
+        return None, "provider"
+    return cached_lookup(db, key)
+
+
+def geocode_store(db: Session, store_id: int) -> str | None:
+    """Geocode one store; returns where the coordinates came from (local/redis/db/provider).
+
+    Counts an attempt on the store's job row; provider errors propagate to the caller.
+    """
+    store = db.get(Store, store_id)
+    if not store:
+        return None
+
+    start_jobs(db, [store_id])
+    db.commit()
+
+    query = GeocodeQuery.for_store(store)
+    key = normalize_address(query.text)
+    local_first, providers = split_providers()
+    coords, source = lookup(db, key, query, local_first, providers)
+    if coords is None and source == "provider" and key:
+        coords = aio.run(geocode(query, providers))
+        if coords is not None:
+            cache_store(db, key, coords)
+
+    if not coords:
+        store.geocode_status = "failed"
+        finish_jobs(db, [store_id], ["failed"], [None], ["geocoder_no_result"])
         db.commit()
+        stores_changed([store_id])
+        return source
 
+    lat, lng = coords.lat, coords.lng
+    db.execute(text("UPDATE stores SET location = ST_SetSRID(ST_MakePoint(:lng,:lat),4326)::geography, geocode_status = 'success' WHERE id = :id"),
+               {"lng": lng, "lat": lat, "id": store_id})
+    finish_jobs(db, [store_id], ["success"], [coords.provider], [None])
+    index_stores(db, [store_id])
+    db.commit()
+    stores_changed([store_id])
+    return source
+
+@shared_task(name="app.workers.tasks.enqueue_geocode", bind=True, max_retries=settings.GEOCODE_MAX_RETRIES)
+def enqueue_geocode(self, store_id: int):
+    db: Session = SessionLocal()
+    try:
+        source = geocode_store(db, store_id)
+        logger.info("geocoded store %s (source=%s)", store_id, source)
     except Exception as e:
         db.rollback()
-        try:
-            self.retry(exc=e)
-        except Exception:
-            pass
-        finally:
-            fail = GeocodeJob(store_id=store_id, status="failed", error_msg=str(e))
-            db.add(fail)
+        if self.request.retries < self.max_retries:
+            finish_jobs(db, [store_id], ["queued"], [None], [str(e)])
             db.commit()
+            raise self.retry(exc=e, countdown=retry_delay(self.request.retries))
+        finish_jobs(db, [store_id], ["failed"], [None], [str(e)])
+        db.execute(text("UPDATE stores SET geocode_status = 'failed' WHERE id = :id"), {"id": store_id})
+        db.commit()
+        stores_changed([store_id])
+        logger.warning("giving up on store %s after %d attempts: %s", store_id, self.request.retries + 1, e)
     finally:
         db.close()
+    release_geocode(store_id)
+
+def geocode_batch(db: Session, store_ids: list[int], concurrency: int | None = None) -> dict[int, str]:
+    """Geocode a batch of stores with the provider calls in flight concurrently.
 
+    Gazetteer and cache lookups and all writes stay sync on `db`; only misses go to the
+    providers, each distinct address once, through `geocode_many` on the worker's event
+    loop. Stores are updated with one statement, their job rows started and finished with
+    one each, all in a single commit. Returns store_id -> source (local/redis/db/provider, or "error" if every
+    provider call for it raised).
+    """
+    stores = db.execute(STORE_ADDRESSES_SQL, {"ids": store_ids}).all()
+    queries = {s.id: GeocodeQuery.for_store(s) for s in stores}
+    key_of = {sid: normalize_address(q.text) for sid, q in queries.items()}
+    local_first, providers = split_providers()
+    start_jobs(db, list(queries))
+
+    results: dict[str, GeocodeResult | None] = {}
+    sources: dict[str, str] = {}
+    misses: dict[str, GeocodeQuery] = {}  # key -> first query seen with it
+    for sid, query in queries.items():
+        key = key_of[sid]
+        if key in sources or key in misses:
+            continue
+        result, source = lookup(db, key, query, local_first, providers)
+        if result is None and source == "provider" and key:
+            misses[key] = query
+        else:
+            results[key], sources[key] = result, source
+
+    fetched = aio.run(geocode_many(list(misses.values()), concurrency, providers)) if misses else []
+    for key, result in zip(misses, fetched):
+        if isinstance(result, BaseException):
+            logger.warning("geocoder error for %r: %s", misses[key].text, result)
+            sources[key] = "error"
+            continue
+        results[key], sources[key] = result, "provider"
+        if result is not None:
+            cache_store(db, key, result)
+
+    done = [sid for sid, key in key_of.items() if sources[key] != "error"]
+    coords = [results[key_of[sid]] for sid in done]
+    statuses = ["success" if c else "failed" for c in coords]
+    if done:
+        db.execute(UPDATE_STORE_LOCATIONS_SQL, {
+            "ids": done,
+            "lats": [c.lat if c else None for c in coords],
+            "lngs": [c.lng if c else None for c in coords],
+            "statuses": statuses,
+        })
+    # errored stores go back to "queued" for their own enqueue_geocode (see geocode_stores)
+    errored = [sid for sid in key_of if sources[key_of[sid]] == "error"]
+    if key_of:
+        finish_jobs(
+            db,
+            done + errored,
+            statuses + ["queued"] * len(errored),
+            [c.provider if c else None for c in coords] + [None] * len(errored),
+            [None if c else "geocoder_no_result" for c in coords] + ["provider_error"] * len(errored),
+        )
+    index_stores(db, [sid for sid, status in zip(done, statuses) if status == "success"])
+    db.commit()
+    stores_changed(done)
+    return {sid: sources[key] for sid, key in key_of.items()}
+
+@shared_task(name="app.workers.tasks.geocode_stores")
+def geocode_stores(store_ids: list[int]):
+    # Bulk imports: one task per chunk of stores, geocoded concurrently. Stores whose
+    # provider call errored (or the whole batch, if it fails) fall back to enqueue_geocode,
+    # which owns the retry policy.
+    db: Session = SessionLocal()
+    try:
+        by_store = geocode_batch(db, store_ids)
+    except Exception:
+        db.rollback()
+        logger.exception("geocode batch failed, falling back to per-store tasks")
+        by_store = {sid: "error" for sid in store_ids}
+    finally:
+        db.close()
+    sources: dict[str, int] = {}
+    for store_id, source in by_store.items():
+        if source == "error":
+            enqueue_geocode_once(store_id)
+        sources[source] = sources.get(source, 0) + 1
+    looked_up = sum(n for s, n in sources.items() if s != "error")
+    hits = sources.get("redis", 0) + sources.get("db", 0)
+    hit_rate = hits / looked_up if looked_up else 0.0
+    logger.info("geocoded %d stores, cache hit rate %.1f%% %s", len(store_ids), hit_rate * 100, sources)
+    return {"stores": len(store_ids), "sources": sources, "cache_hit_rate": hit_rate}
+
+def enqueue_geocode_batches(store_ids: list[int], batch_size: int | None = None):
+    batch_size = batch_size or settings.GEOCODE_BATCH_SIZE
+    batches = [store_ids[i:i + batch_size] for i in range(0, len(store_ids), batch_size)]
+    if batches:
+        group(geocode_stores.s(batch) for batch in batches).apply_async()
+
+@shared_task(name="app.workers.tasks.index_company_cells")
+def index_company_cells(company_id: int) -> int:
+    # The company radius changed: re-cover every store that uses it.
+    db: Session = SessionLocal()
+    try:
+        rows = index_company(db, company_id)
+        db.commit()
+    finally:
+        db.close()
+    # other processes reload their cell index with the new cover
+    company_changed(company_id)
+    logger.info("re-indexed company %s: %d cells", company_id, rows)
+    return rows
+
+@shared_task(name="app.workers.tasks.refresh_run_rollup")
+def refresh_run_rollup(lookback_days: int | None = None) -> int:
+    # Scheduled by Celery beat; recomputes today and the previous lookback days.
+    days = settings.TASK_RUN_ROLLUP_LOOKBACK_DAYS if lookback_days is None else lookback_days
+    db: Session = SessionLocal()
+    try:
+        rows = refresh_daily(db, datetime.now(timezone.utc).date() - timedelta(days=days))
+    finally:
+        db.close()
+    logger.info("refreshed %d task_run_daily rows", rows)
+    return rows
@@ -0,0 +1,187 @@
+"""Throughput and p50/p95/p99 latency of the API hot paths under a concurrent mixed load.
+
+Needs the PostGIS database and Redis from docker compose with migrations applied:
+
+    python -m benchmarks.bench_api --companies 10 --stores 20 --tasks 5 \\
+        --clients 200 --requests 5000 --mix run=8,get=3,create=1 --output api.json
+
+Seeds `--companies` companies with `--stores` geocoded stores each and `--tasks` tasks per
+store through the ORM models, then `--clients` concurrent clients share `--requests`
+requests drawn from `--mix`:
+
+- run: POST /tasks/{id}/run for a random task, from a point up to ~150 m from its store,
+  so both allowed and denied decisions are exercised (demo-token auth);
+- get: GET /stores/{id} for a random seeded store;
+- create: POST /stores with an admin JWT. Celery runs eagerly, so the geocode job
+  runs inside the request against a local Google-compatible stub answering after
+  `--geocode-latency-ms` (see bench_geocode), the way a worker would.
+
+Everything runs in-process through httpx's ASGI transport. The rate limiter is disabled
+unless `--rate-limit` is given (all clients share one demo user, so it would answer 429
+after the first few runs). Result JSON can be compared with `benchmarks.compare`.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from typing import NamedTuple
+import httpx
+from geoalchemy2.elements import WKTElement
+import app.core.ratelimit as ratelimit
+from app.core.auth import create_access_token
+from app.core.config import settings
+from app.core.db import SessionLocal, dispose_async_engine
+from app.main import app as api_app
+from app.models.models import Company, Store, Task
+from app.services.cell_index import index_stores
+from app.workers.celery_app import celery_app
+from benchmarks.bench_checkins import DEMO_TOKEN, LAT, LNG
+from benchmarks.bench_geocode import start_mock
+from benchmarks.report import latency_stats, write_results
+
+OPERATIONS = ("run", "get", "create")
+# seeded stores are scattered over ~10 km around the centre of Kyiv
+SPREAD_DEG = 0.05
+# run points land up to this far from the task's store (company radius is 100 m)
+RUN_OFFSET_DEG = 0.0015
+
+
+class Seeded(NamedTuple):
+    company_ids: list[int]
+    store_ids: list[int]
+    tasks: list[tuple[int, float, float]]  # (task_id, store lat, store lng)
+
+
+def seed(companies: int, stores: int, tasks: int, rng: random.Random) -> Seeded:
+    tag = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        cos = [Company(name=f"Bench Co {tag}-{i}", geofence_radius_m=100) for i in range(companies)]
+        db.add_all(cos)
+        db.flush()
+        placed = []
+        for co in cos:
+            for j in range(stores):
+                lat, lng = LAT + rng.uniform(-SPREAD_DEG, SPREAD_DEG), LNG + rng.uniform(-SPREAD_DEG, SPREAD_DEG)
+                store = Store(
+                    company_id=co.id, name=f"Bench Store {j}", city="Kyiv", country="UA",
+                    location=WKTElement(f"POINT({lng} {lat})", srid=4326), geocode_status="success",
+                )
+                placed.append((store, lat, lng))
+        db.add_all([s for s, _, _ in placed])
+        db.flush()
+        seeded_tasks = []
+        for store, lat, lng in placed:
+            for k in range(tasks):
+                task = Task(store_id=store.id, title=f"Bench task {k}")
+                db.add(task)
+                seeded_tasks.append((task, lat, lng))
+        db.flush()
+        index_stores(db, [s.id for s, _, _ in placed])
+        db.commit()
+        return Seeded(
+            [co.id for co in cos],
+            [s.id for s, _, _ in placed],
+            [(t.id, lat, lng) for t, lat, lng in seeded_tasks],
+        )
+    finally:
+        db.close()
+
+
+def parse_mix(mix: str) -> tuple[list[str], list[int]]:
+    weights = dict.fromkeys(OPERATIONS, 0)
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in weights:
+            raise SystemExit(f"unknown operation {name!r} in --mix; expected {OPERATIONS}")
+        weights[name.strip()] = int(weight or 1)
+    ops = [op for op in OPERATIONS if weights[op] > 0]
+    if not ops:
+        raise SystemExit("--mix selects no operations")
+    return ops, [weights[op] for op in ops]
+
+
+async def drive(seeded: Seeded, clients: int, requests: int, mix: str, rng: random.Random) -> dict:
+    ops, weights = parse_mix(mix)
+    plan = iter(rng.choices(ops, weights, k=requests))
+    latencies: dict[str, list[float]] = {op: [] for op in ops}
+    statuses: dict[str, Counter] = {op: Counter() for op in ops}
+    worker = {"X-Demo-Token": DEMO_TOKEN}
+    admin = {"Authorization": f"Bearer {create_access_token('bench@admin', 'admin')}"}
+    created = iter(range(requests))
+
+    async def call(client: httpx.AsyncClient, op: str) -> httpx.Response:
+        if op == "run":
+            task_id, lat, lng = rng.choice(seeded.tasks)
+            point = {"lat": lat + rng.uniform(-RUN_OFFSET_DEG, RUN_OFFSET_DEG),
+                     "lng": lng + rng.uniform(-RUN_OFFSET_DEG, RUN_OFFSET_DEG)}
+            return await client.post(f"/tasks/{task_id}/run", headers=worker, json=point)
+        if op == "get":
+            return await client.get(f"/stores/{rng.choice(seeded.store_ids)}")
+        n = next(created)
+        return await client.post("/stores", headers=admin, json={
+            "company_id": rng.choice(seeded.company_ids),
+            "name": f"Bench new store {n}",
+            "address_lines": [f"Bench street {n}"],
+            "city": "Kyiv",
+            "country": "UA",
+        })
+
+    transport = httpx.ASGITransport(app=api_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def client_loop():
+            for op in plan:
+                t0 = time.perf_counter()
+                r = await call(client, op)
+                latencies[op].append(time.perf_counter() - t0)
+                statuses[op][r.status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    results = {"overall": latency_stats([t for op in ops for t in latencies[op]], elapsed)}
+    for op in ops:
+        results[op] = latency_stats(latencies[op], elapsed)
+        results[op]["status"] = {str(code): n for code, n in sorted(statuses[op].items())}
+    return results
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    settings.DEMO_TOKEN = DEMO_TOKEN
+    if not args.rate_limit:
+        ratelimit._redis = None
+    server, url = start_mock(args.geocode_latency_ms / 1000)
+    settings.GOOGLE_GEOCODE_URL = url
+    settings.GOOGLE_MAPS_API_KEY = settings.GOOGLE_MAPS_API_KEY or "bench"
+    settings.GEOCODE_PROVIDERS = "google"
+    celery_app.conf.task_always_eager = True
+    try:
+        seeded = seed(args.companies, args.stores, args.tasks, rng)
+        results = {
+            "seeded": {"companies": len(seeded.company_ids), "stores": len(seeded.store_ids), "tasks": len(seeded.tasks)},
+            **await drive(seeded, args.clients, args.requests, args.mix, rng),
+        }
+    finally:
+        server.should_exit = True
+        await dispose_async_engine()
+    write_results("api", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=10)
+    parser.add_argument("--stores", type=int, default=20, help="stores per company")
+    parser.add_argument("--tasks", type=int, default=5, help="tasks per store")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--mix", default="run=8,get=3,create=1", help="operation weights, e.g. run=8,get=3,create=1")
+    parser.add_argument("--geocode-latency-ms", type=float, default=50)
+    parser.add_argument("--rate-limit", action="store_true", help="keep the Redis rate limiter enabled")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the result JSON to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+"""Check-ins/sec for the sync (threadpool) vs async (asyncpg) run_task path.
+
+Needs the PostGIS database from docker compose with migrations applied:
+
+    python -m benchmarks.bench_checkins --clients 500 --requests 5000
+
+Both variants run in-process through httpx's ASGI transport with the same seeded
+task, demo-token auth and the rate limiter disabled, so the difference is the
+handler/session model only. The sync variant is the pre-async handler: a `def`
+route on a psycopg2 Session, which Starlette runs in its threadpool.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import app.core.ratelimit as ratelimit
+from app.core.config import settings
+from app.core.db import SessionLocal, get_db, dispose_async_engine
+from app.main import app as async_app
+from app.schemas.schemas import TaskRunRequest, TaskRunOut
+from app.services.distances import geofence_distance
+from app.services.store_cache import get_store_geofence
+
+DEMO_TOKEN = "bench-demo-token"
+LAT, LNG = 50.4501, 30.5234
+
+
+def seed_task() -> int:
+    db = SessionLocal()
+    try:
+        company_id = db.execute(
+            text("INSERT INTO companies (name, geofence_radius_m) VALUES (:name, 100) RETURNING id"),
+            {"name": f"Bench Co {uuid.uuid4().hex[:8]}"},
+        ).scalar_one()
+        store_id = db.execute(
+            text(
+                "INSERT INTO stores (company_id, name, location, geocode_status) "
+                "VALUES (:cid, 'Bench Store', ST_SetSRID(ST_MakePoint(:lng,:lat),4326)::geography, 'success') RETURNING id"
+            ),
+            {"cid": company_id, "lat": LAT, "lng": LNG},
+        ).scalar_one()
+        task_id = db.execute(
+            text("INSERT INTO tasks (store_id, title) VALUES (:sid, 'Bench task') RETURNING id"),
+            {"sid": store_id},
+        ).scalar_one()
+        db.commit()
+        return task_id
+    finally:
+        db.close()
+
+
+def build_sync_app() -> FastAPI:
+    sync_app = FastAPI()
+
+    @sync_app.post("/tasks/{task_id}/run", response_model=TaskRunOut)
+    def run_task(task_id: int, payload: TaskRunRequest, db: Session = Depends(get_db)):
+        geo = get_store_geofence(db, task_id)
+        distance = geofence_distance(db, geo, payload.lat, payload.lng)
+        within = distance <= geo.radius_m
+        db.execute(
+            text(
+                "INSERT INTO task_runs (task_id, worker_id, client_location, distance_m, allowed) "
+                "VALUES (:task_id, 'bench', ST_SetSRID(ST_MakePoint(:lng,:lat),4326)::geography, :distance_m, :allowed)"
+            ),
+            {"task_id": task_id, "lat": payload.lat, "lng": payload.lng, "distance_m": distance, "allowed": within},
+        )
+        db.commit()
+        return TaskRunOut(allowed=within, distance_m=distance)
+
+    return sync_app
+
+
+async def drive(asgi_app, task_id: int, clients: int, requests: int) -> dict:
+    latencies: list[float] = []
+    remaining = iter(range(requests))
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"X-Demo-Token": DEMO_TOKEN}) as client:
+
+        async def worker():
+            for _ in remaining:
+                t0 = time.perf_counter()
+                r = await client.post(f"/tasks/{task_id}/run", json={"lat": LAT, "lng": LNG})
+                latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "checkins_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def main(clients: int, requests: int):
+    settings.DEMO_TOKEN = DEMO_TOKEN
+    ratelimit._redis = None
+    task_id = seed_task()
+    results = {
+        "clients": clients,
+        "sync": await drive(build_sync_app(), task_id, clients, requests),
+        "async": await drive(async_app, task_id, clients, requests),
+    }
+    await dispose_async_engine()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.requests))
@@ -0,0 +1,77 @@
+"""Rows/sec and peak memory of the task_runs export for each format and compression.
+
+Needs the PostGIS database from docker compose with migrations applied:
+
+    python -m benchmarks.bench_export --seed 1000000      # add 1M runs to a bench task first
+    python -m benchmarks.bench_export --variants ndjson/none,csv/gzip
+
+Each variant streams the whole of task_runs through `export_chunks` into a byte
+counter (no disk I/O). `peak_rss_mb` is the process's peak RSS after the variant; it
+should stay flat as the table grows, since rows are fetched from a server-side cursor.
+"""
+import argparse
+import json
+import resource
+import time
+from sqlalchemy import text
+from app.core.db import SessionLocal
+from app.services.run_export import COMPRESSIONS, FORMATS, ExportFilter, export_chunks, iter_export_rows
+from benchmarks.bench_checkins import LAT, LNG, seed_task
+
+SEED_SQL = text('''
+    INSERT INTO task_runs (task_id, worker_id, client_location, distance_m, allowed, created_at)
+    SELECT :task_id, 'bench-' || (g % 500), ST_SetSRID(ST_MakePoint(:lng + random() / 1000, :lat + random() / 1000), 4326)::geography,
+           random() * 200, random() < 0.8, NOW() - (g || ' seconds')::interval
+    FROM generate_series(1, :n) AS g
+''')
+
+
+def seed(n: int) -> None:
+    task_id = seed_task()
+    db = SessionLocal()
+    try:
+        db.execute(SEED_SQL, {"task_id": task_id, "n": n, "lat": LAT, "lng": LNG})
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_variant(fmt: str, compression: str, chunk_rows: int | None) -> dict:
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for row in iter_export_rows(ExportFilter(), chunk_rows):
+            rows += 1
+            yield row
+
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in export_chunks(counted(), fmt, compression, chunk_rows))
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(rows / max(elapsed, 1e-6)),
+        "mb": round(size / 1e6, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main(variants: list[str], chunk_rows: int | None, seed_rows: int):
+    if seed_rows:
+        seed(seed_rows)
+    results = {"chunk_rows": chunk_rows}
+    for variant in variants:
+        fmt, compression = variant.split("/")
+        results[variant] = run_variant(fmt, compression, chunk_rows)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    default = [f"{fmt}/{c}" for fmt in FORMATS for c in COMPRESSIONS]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--variants", default=",".join(default), help="comma-separated format/compression pairs")
+    parser.add_argument("--chunk-rows", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0, help="insert this many runs before measuring")
+    args = parser.parse_args()
+    main(args.variants.split(","), args.chunk_rows, args.seed)
@@ -0,0 +1,116 @@
+"""Geocoder throughput (addresses/sec) against a local mock geocoder.
+
+No database or API key needed:
+
+    python -m benchmarks.bench_geocode --addresses 500 --latency-ms 50 --concurrency 10
+
+A Google-compatible mock answers on 127.0.0.1 after `--latency-ms`. Two variants fetch
+the same addresses through the google provider, and a third answers them offline:
+
+- per_call: the pre-pooling path, a fresh AsyncClient (new TCP connection) per address,
+  one address at a time, the way the old worker did it;
+- pooled: the shared keep-alive client on one event loop via `geocode_many`, at most
+  `--concurrency` requests in flight, the way `geocode_stores` does it now;
+- local: memory-mapped gazetteer lookups (one postal code per address), no network.
+
+The mock speaks plain HTTP/1.1, so this measures connection reuse and concurrency;
+HTTP/2 multiplexing only comes into play against the real (TLS) endpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from app.core.config import settings
+from app.services.gazetteer import GazetteerRow, build
+from app.services.geocoding import GeocodeQuery, close_http_client, geocode_many, local_lookup
+
+
+def mock_app(latency: float) -> Starlette:
+    async def geocode(request):
+        await asyncio.sleep(latency)
+        return JSONResponse({
+            "status": "OK",
+            "results": [{"geometry": {"location": {"lat": 50.45, "lng": 30.52}, "location_type": "ROOFTOP"}}],
+        })
+
+    return Starlette(routes=[Route("/maps/api/geocode/json", geocode)])
+
+
+def start_mock(latency: float) -> tuple[uvicorn.Server, str]:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(mock_app(latency), port=port, log_level="warning", backlog=4096))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}/maps/api/geocode/json"
+
+
+async def per_call(addresses: list[str]) -> None:
+    for address in addresses:
+        async with httpx.AsyncClient(timeout=settings.GEOCODE_HTTP_TIMEOUT_SEC) as client:
+            r = await client.get(settings.GOOGLE_GEOCODE_URL, params={"address": address})
+            r.raise_for_status()
+
+
+async def pooled(addresses: list[str], concurrency: int) -> None:
+    results = await geocode_many([GeocodeQuery(a) for a in addresses], concurrency, providers=["google"])
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
+    await close_http_client()
+
+
+async def local(queries: list[GeocodeQuery]) -> None:
+    if any(local_lookup(q) is None for q in queries):
+        raise RuntimeError("gazetteer miss")
+
+
+def timed(coro) -> dict:
+    started = time.perf_counter()
+    asyncio.run(coro)
+    return {"seconds": round(time.perf_counter() - started, 5)}
+
+
+def main(n: int, latency_ms: float, concurrency: int):
+    server, url = start_mock(latency_ms / 1000)
+    settings.GOOGLE_GEOCODE_URL = url
+    settings.GOOGLE_MAPS_API_KEY = settings.GOOGLE_MAPS_API_KEY or "bench"
+    settings.GEOCODE_HTTP_MAX_CONNECTIONS = max(settings.GEOCODE_HTTP_MAX_CONNECTIONS, concurrency)
+    addresses = [f"Test street {i}, Kyiv" for i in range(n)]
+    queries = [GeocodeQuery(a, "Kyiv", None, "UA", f"{i:05d}") for i, a in enumerate(addresses)]
+    tmp = tempfile.mkdtemp()
+    settings.GEOCODE_GAZETTEER_PATH = os.path.join(tmp, "gazetteer.bin")
+    build((GazetteerRow("UA", q.postal_code, "Kyiv", 50.45, 30.52) for q in queries), settings.GEOCODE_GAZETTEER_PATH)
+    try:
+        results = {"addresses": n, "latency_ms": latency_ms, "concurrency": concurrency}
+        variants = (("per_call", per_call(addresses)), ("pooled", pooled(addresses, concurrency)), ("local", local(queries)))
+        for name, coro in variants:
+            res = timed(coro)
+            res["addresses_per_sec"] = round(n / max(res["seconds"], 1e-6), 1)
+            results[name] = res
+        results["speedup"] = round(results["pooled"]["addresses_per_sec"] / results["per_call"]["addresses_per_sec"], 1)
+    finally:
+        server.should_exit = True
+        os.remove(settings.GEOCODE_GAZETTEER_PATH)
+        os.rmdir(tmp)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--addresses", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    main(args.addresses, args.latency_ms, args.concurrency)
@@ -0,0 +1,106 @@
+"""Requests/sec of GET /tasks for a store with many tasks: ORM entities vs lean columns.
+
+Needs the PostGIS database from docker compose with migrations applied:
+
+    python -m benchmarks.bench_list_tasks --tasks 10000 --limit 1000 --clients 20 --requests 2000
+
+Seeds one store with `--tasks` tasks, then `--clients` clients page through them
+(`limit`, `after_id`) in-process through httpx's ASGI transport. Variants:
+
+- orm: the previous handler, full `Task` entities validated through
+  `response_model=list[TaskOut]` (from_attributes) and encoded by FastAPI;
+- lean_json / lean_orjson: the current handler, the TaskOut columns only, returned as
+  plain dicts with JSON_ENCODER=json / orjson.
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from fastapi import Depends, FastAPI, Query
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.db import SessionLocal, dispose_async_engine, get_async_db
+from app.main import app as api_app
+from app.models.models import Task
+from app.schemas.schemas import TaskOut
+from benchmarks.bench_checkins import seed_task
+from benchmarks.report import latency_stats, write_results
+
+
+def seed_store(tasks: int) -> int:
+    db = SessionLocal()
+    try:
+        store_id = db.execute(text("SELECT store_id FROM tasks WHERE id = :id"), {"id": seed_task()}).scalar_one()
+        db.execute(
+            text("INSERT INTO tasks (store_id, title, description, active) "
+                 "SELECT :sid, 'Bench task ' || n, 'Seeded for bench_list_tasks', true FROM generate_series(2, :n) n"),
+            {"sid": store_id, "n": tasks},
+        )
+        db.commit()
+        return store_id
+    finally:
+        db.close()
+
+
+def build_orm_app() -> FastAPI:
+    orm_app = FastAPI()
+
+    @orm_app.get("/tasks", response_model=list[TaskOut])
+    async def list_tasks(store_id: int, limit: int = Query(100, le=1000), after_id: int | None = None,
+                         db: AsyncSession = Depends(get_async_db)):
+        q = select(Task).where(Task.store_id == store_id)
+        if after_id is not None:
+            q = q.where(Task.id > after_id)
+        res = await db.execute(q.order_by(Task.id).limit(limit))
+        return res.scalars().all()
+
+    return orm_app
+
+
+async def drive(asgi_app, store_id: int, limit: int, clients: int, requests: int) -> dict:
+    latencies: list[float] = []
+    remaining = iter(range(requests))
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def pager():
+            after_id = None
+            for _ in remaining:
+                params = {"store_id": store_id, "limit": limit}
+                if after_id is not None:
+                    params["after_id"] = after_id
+                t0 = time.perf_counter()
+                r = await client.get("/tasks", params=params)
+                latencies.append(time.perf_counter() - t0)
+                r.raise_for_status()
+                page = r.json()
+                # start over from the first page after the last one
+                after_id = page[-1]["id"] if len(page) == limit else None
+
+        started = time.perf_counter()
+        await asyncio.gather(*(pager() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latency_stats(latencies, elapsed)
+
+
+async def main(args):
+    store_id = seed_store(args.tasks)
+    results = {"orm": await drive(build_orm_app(), store_id, args.limit, args.clients, args.requests)}
+    for encoder in ("json", "orjson"):
+        settings.JSON_ENCODER = encoder
+        results[f"lean_{encoder}"] = await drive(api_app, store_id, args.limit, args.clients, args.requests)
+    for name in ("lean_json", "lean_orjson"):
+        results[f"{name}_speedup"] = round(results[name]["per_sec"] / results["orm"]["per_sec"], 2)
+    await dispose_async_engine()
+    write_results("list_tasks", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10000, help="tasks in the seeded store")
+    parser.add_argument("--limit", type=int, default=1000, help="page size")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--output", help="also write the result JSON to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+"""Per-call cost of the check-in building blocks: distance checks, JWT auth, rate limiting.
+
+    python -m benchmarks.bench_micro --iterations 20000 --output micro.json
+    python -m benchmarks.bench_micro --no-db --fakeredis      # no docker compose needed
+
+Groups:
+
+- distance: `within_radius_and_distance` (one PostGIS round trip, needs the database;
+  skipped with `--no-db`) next to `decide_many` with the fast tier off on the local
+  geodesic and haversine backends for the same store and point, and the tiered
+  `decide_many` for that point (settled by the fast tier) and for one ~100 m out (the
+  exact tier decides);
+- auth: raw `jwt.decode` of an HS256 token, and the `get_current_user` dependency with a
+  bearer token, with the verified-token cache disabled (every request verifies) and
+  enabled (every request after the first is a hit), and with the demo token;
+- rate_limit: one GCRA EVALSHA (`run_gcra`) against Redis at REDIS_URL, or an in-process
+  fakeredis with `--fakeredis`, and the local blocklist short-circuit for a user Redis
+  already rejected.
+
+Each entry reports ops/sec and per-call p50/p95/p99 in microseconds.
+"""
+import argparse
+import asyncio
+import uuid
+import jwt
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import text
+from app.core.auth import create_access_token, get_current_user, verified_tokens
+from app.core.config import settings
+from app.core.ratelimit import LocalBlocklist, run_gcra
+from app.core.db import SessionLocal
+from app.services.decision import decide_many
+from app.services.distances import within_radius_and_distance
+from app.services.store_cache import StoreGeofence
+from benchmarks.bench_checkins import DEMO_TOKEN, LAT, LNG, seed_task
+from benchmarks.report import measure, write_results
+
+# ~60 m north-east of the store
+POINT = (LAT + 0.0004, LNG + 0.0004)
+
+
+def bench_distance(iterations: int, use_db: bool) -> dict:
+    geo = StoreGeofence(task_id=0, task_active=True, store_id=0, company_id=0,
+                        geocode_status="success", lat=LAT, lng=LNG, radius_m=100)
+    lat, lng = POINT
+    settings.GEOFENCE_FAST_TIER = False
+    out = {
+        backend: measure(lambda b=backend: decide_many(None, [geo], [lat], [lng], [None], backend=b), iterations)
+        for backend in ("geodesic", "haversine")
+    }
+    settings.GEOFENCE_FAST_TIER = True
+    # the edge of the 100 m radius, where the fast estimate cannot decide
+    edge = LAT + 100 / 111_250
+    out["tiered_fast"] = measure(lambda: decide_many(None, [geo], [lat], [lng], [None], backend="geodesic"), iterations)
+    out["tiered_band"] = measure(lambda: decide_many(None, [geo], [edge], [LNG], [None], backend="geodesic"), iterations)
+    if use_db:
+        db = SessionLocal()
+        try:
+            store_id = db.execute(text("SELECT store_id FROM tasks WHERE id = :id"), {"id": seed_task()}).scalar_one()
+            out["postgis_within_radius_and_distance"] = measure(
+                lambda: within_radius_and_distance(db, store_id, lat, lng, 100), iterations,
+            )
+        finally:
+            db.close()
+    return out
+
+
+def bench_auth(iterations: int) -> dict:
+    settings.DEMO_TOKEN = DEMO_TOKEN
+    token = create_access_token("bench@worker", "worker")
+    bearer = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    loop = asyncio.new_event_loop()
+    max_entries = verified_tokens.max_entries
+    try:
+        out = {"jwt_decode": measure(lambda: jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"]), iterations)}
+        # the cache disabled is the per-request cost before it existed
+        verified_tokens.max_entries = 0
+        verified_tokens.clear()
+        out["get_current_user_jwt_uncached"] = measure(lambda: loop.run_until_complete(get_current_user(bearer, None)), iterations)
+        verified_tokens.max_entries = max(max_entries, 1)
+        out["get_current_user_jwt_cached"] = measure(lambda: loop.run_until_complete(get_current_user(bearer, None)), iterations)
+        out["get_current_user_demo"] = measure(lambda: loop.run_until_complete(get_current_user(None, DEMO_TOKEN)), iterations)
+        out["cache_speedup"] = round(
+            out["get_current_user_jwt_cached"]["ops_per_sec"] / out["get_current_user_jwt_uncached"]["ops_per_sec"], 1,
+        )
+        return out
+    finally:
+        verified_tokens.max_entries = max_entries
+        loop.close()
+
+
+def bench_rate_limit(iterations: int, fake: bool) -> dict:
+    if fake:
+        import fakeredis
+        client = fakeredis.FakeRedis(decode_responses=True)
+    else:
+        import redis
+        client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    key = f"rl:bench:{uuid.uuid4().hex[:8]}"
+    blocks = LocalBlocklist()
+    blocks.block(key, 3600)
+    try:
+        # a 1 s emission interval with a burst of 10^7, so every call is allowed and takes
+        # the full write path (sub-millisecond intervals vanish in epoch-ms float math)
+        return {
+            "backend": "fakeredis" if fake else "redis",
+            "gcra": measure(lambda: run_gcra(client, key, 10 ** 7, 10 ** 10), iterations),
+            "local_blocklist_hit": measure(lambda: blocks.retry_after(key), iterations),
+        }
+    finally:
+        client.delete(key)
+
+
+def main(args):
+    results = {
+        "distance": bench_distance(args.iterations, not args.no_db),
+        "auth": bench_auth(args.iterations),
+        "rate_limit": bench_rate_limit(args.iterations, args.fakeredis),
+    }
+    write_results("micro", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--no-db", action="store_true", help="skip the PostGIS distance check")
+    parser.add_argument("--fakeredis", action="store_true", help="rate-limit against in-process fakeredis")
+    parser.add_argument("--output", help="also write the result JSON to this file")
+    main(parser.parse_args())
@@ -0,0 +1,67 @@
+"""Check-ins/sec and tail latency of run_task with synchronous vs write-behind task_runs writes.
+
+Needs the PostGIS database (migrations applied) and, for the redis variant, Redis from
+docker compose:
+
+    python -m benchmarks.bench_write_behind --clients 500 --requests 5000
+
+Each variant drives the async app through httpx's ASGI transport (see bench_checkins)
+with TASK_RUN_WRITE_MODE set to sync, memory or redis. The flusher runs in-process as
+it would in the API; `drain_sec` is how long it took to write what was still buffered
+once the last response had been sent, and `rows` counts the runs that reached task_runs.
+"""
+import argparse
+import asyncio
+import json
+import time
+import redis
+from sqlalchemy import text
+import app.core.ratelimit as ratelimit
+from app.core.config import settings
+from app.core.db import SessionLocal, dispose_async_engine, engine
+from app.main import app as async_app
+from app.services.run_buffer import start_flusher, stop_flusher
+from benchmarks.bench_checkins import DEMO_TOKEN, drive, seed_task
+
+MODES = ("sync", "memory", "redis")
+
+
+def count_runs(task_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.execute(text("SELECT COUNT(*) FROM task_runs WHERE task_id = :t"), {"t": task_id}).scalar_one()
+    finally:
+        db.close()
+
+
+async def run_mode(mode: str, clients: int, requests: int) -> dict:
+    settings.TASK_RUN_WRITE_MODE = mode
+    if mode == "redis":
+        redis.Redis.from_url(settings.REDIS_URL).delete(settings.TASK_RUN_STREAM)
+    task_id = seed_task()
+    await start_flusher(engine)
+    result = await drive(async_app, task_id, clients, requests)
+    started = time.perf_counter()
+    await stop_flusher()
+    result["drain_sec"] = round(time.perf_counter() - started, 3)
+    result["rows"] = count_runs(task_id)
+    return result
+
+
+async def main(clients: int, requests: int, modes: list[str]):
+    settings.DEMO_TOKEN = DEMO_TOKEN
+    ratelimit._redis = None
+    results = {"clients": clients, "flush_batch": settings.TASK_RUN_FLUSH_BATCH}
+    for mode in modes:
+        results[mode] = await run_mode(mode, clients, requests)
+    await dispose_async_engine()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated subset of " + ",".join(MODES))
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.requests, args.modes.split(",")))
@@ -0,0 +1,71 @@
+"""Compare two benchmark result files written with `--output`.
+
+    python -m benchmarks.compare before.json after.json [--fail-over 10]
+
+Prints every numeric result present in both files with its relative change. Latencies
+(`*_ms`, `*_us`) are worse when they go up, throughputs (`*per_sec`) when they go down.
+With `--fail-over PCT` the exit status is 1 if any of them got worse by more than PCT%.
+"""
+import argparse
+import json
+import sys
+
+
+def flatten(node, prefix: str = "") -> dict[str, float]:
+    out: dict[str, float] = {}
+    if isinstance(node, dict):
+        for key, value in node.items():
+            out.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        out[prefix] = float(node)
+    return out
+
+
+def direction(key: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if neither (counts, sizes)."""
+    leaf = key.rsplit(".", 1)[-1]
+    if leaf.endswith("per_sec"):
+        return 1
+    if leaf.endswith(("_ms", "_us")):
+        return -1
+    return 0
+
+
+def compare(before: dict, after: dict) -> list[tuple[str, float, float, float | None, bool]]:
+    """(key, before, after, change in %, worse) for the numeric results both files have."""
+    old, new = flatten(before["results"]), flatten(after["results"])
+    rows = []
+    for key in old.keys() & new.keys():
+        a, b = old[key], new[key]
+        change = (b - a) / a * 100 if a else None
+        worse = change is not None and direction(key) * change < 0
+        rows.append((key, a, b, change, worse))
+    return sorted(rows)
+
+
+def main(args) -> int:
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    if before["meta"]["benchmark"] != after["meta"]["benchmark"]:
+        print(f"warning: comparing {before['meta']['benchmark']!r} with {after['meta']['benchmark']!r}", file=sys.stderr)
+    print(f"{'result':<56} {before['meta'].get('commit') or 'before':>12} {after['meta'].get('commit') or 'after':>12} {'change':>9}")
+    regressed = []
+    for key, a, b, change, worse in compare(before, after):
+        pct = f"{change:+.1f}%" if change is not None else "n/a"
+        print(f"{key:<56} {a:>12g} {b:>12g} {pct:>9}{'  worse' if worse else ''}")
+        if worse and args.fail_over is not None and abs(change) > args.fail_over:
+            regressed.append(key)
+    if regressed:
+        print(f"{len(regressed)} result(s) worse by more than {args.fail_over}%: {', '.join(regressed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-over", type=float, help="exit 1 if a latency/throughput got worse by more than this %%")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Shared helpers for the benchmark scripts: latency summaries and JSON result files.
+
+Every result file carries the same `meta` block (benchmark name, UTC time, git commit,
+Python version and the arguments of the run), so two files can be diffed with
+`python -m benchmarks.compare before.json after.json`.
+"""
+from __future__ import annotations
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def latency_stats(latencies: list[float], elapsed: float | None = None) -> dict:
+    """Count, throughput (when `elapsed` is given) and p50/p95/p99/max in ms of latencies in seconds."""
+    values = sorted(latencies)
+    out: dict = {"requests": len(values)}
+    if elapsed is not None:
+        out["seconds"] = round(elapsed, 3)
+        out["per_sec"] = round(len(values) / max(elapsed, 1e-9), 1)
+    for p in PERCENTILES:
+        out[f"p{p}_ms"] = round(percentile(values, p) * 1000, 3)
+    out["max_ms"] = round(values[-1] * 1000, 3) if values else 0.0
+    return out
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 100) -> dict:
+    """Call `fn` `iterations` times; ops/sec and per-call p50/p95/p99 in microseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        t0 = clock()
+        fn()
+        timings.append(clock() - t0)
+    elapsed = (clock() - started) / 1e9
+    timings.sort()
+    out = {"iterations": iterations, "ops_per_sec": round(iterations / max(elapsed, 1e-9), 1)}
+    for p in PERCENTILES:
+        out[f"p{p}_us"] = round(percentile(timings, p) / 1000, 2)
+    return out
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(name: str, args: dict, results: dict, output: str | None = None) -> dict:
+    """Wrap `results` with run metadata, print it and, with `output`, also write it there."""
+    doc = {
+        "meta": {
+            "benchmark": name,
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": sys.platform,
+            "args": args,
+        },
+        "results": results,
+    }
+    body = json.dumps(doc, indent=2)
+    print(body)
+    if output:
+        with open(output, "w") as f:
+            f.write(body + "\n")
+    return doc
@@ -0,0 +1,14 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_task_run_client_ts'
+down_revision = '0001_init'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # when the check-in happened on the device; differs from created_at for offline uploads
+    op.add_column('task_runs', sa.Column('client_ts', sa.DateTime(timezone=True), nullable=True))
+
+def downgrade():
+    op.drop_column('task_runs', 'client_ts')
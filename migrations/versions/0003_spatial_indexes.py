@@ -0,0 +1,17 @@
+from alembic import op
+
+revision = '0003_spatial_indexes'
+down_revision = '0002_task_run_client_ts'
+branch_labels = None
+depends_on = None
+
+# Names follow geoalchemy2's idx_<table>_<column> so IF NOT EXISTS is a no-op
+# on databases where the indexes were already created alongside the tables.
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS idx_stores_location ON stores USING GIST (location)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_task_runs_client_location ON task_runs USING GIST (client_location)")
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_task_runs_client_location")
+    op.execute("DROP INDEX IF EXISTS idx_stores_location")
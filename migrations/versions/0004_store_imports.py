@@ -0,0 +1,28 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_store_imports'
+down_revision = '0003_spatial_indexes'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('store_imports',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('company_id', sa.Integer, sa.ForeignKey('companies.id'), nullable=False),
+        sa.Column('source', sa.String(length=20), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False, server_default='queued'),
+        sa.Column('total_rows', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('inserted', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('failed', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('error_msg', sa.Text),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'))
+    )
+    op.add_column('stores', sa.Column('import_id', sa.Integer, sa.ForeignKey('store_imports.id'), nullable=True))
+    op.create_index('ix_stores_import_id', 'stores', ['import_id'])
+
+def downgrade():
+    op.drop_index('ix_stores_import_id', table_name='stores')
+    op.drop_column('stores', 'import_id')
+    op.drop_table('store_imports')
@@ -0,0 +1,20 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_geocode_cache'
+down_revision = '0004_store_imports'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('geocode_cache',
+        sa.Column('address_key', sa.Text, primary_key=True),
+        sa.Column('lat', sa.Float(precision=53), nullable=False),
+        sa.Column('lng', sa.Float(precision=53), nullable=False),
+        sa.Column('provider', sa.String(length=40), nullable=False),
+        sa.Column('precision', sa.String(length=40)),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('NOW()'))
+    )
+
+def downgrade():
+    op.drop_table('geocode_cache')
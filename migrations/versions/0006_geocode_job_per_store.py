@@ -0,0 +1,18 @@
+from alembic import op
+
+revision = '0006_geocode_job_per_store'
+down_revision = '0005_geocode_cache'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # one row per store from now on: keep each store's latest job, then enforce it
+    op.execute('''
+        DELETE FROM geocode_jobs j
+        USING geocode_jobs newer
+        WHERE newer.store_id = j.store_id AND newer.id > j.id
+    ''')
+    op.create_unique_constraint('uq_geocode_jobs_store_id', 'geocode_jobs', ['store_id'])
+
+def downgrade():
+    op.drop_constraint('uq_geocode_jobs_store_id', 'geocode_jobs', type_='unique')
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_partition_task_runs'
+down_revision = '0006_geocode_job_per_store'
+branch_labels = None
+depends_on = None
+
+# task_runs becomes RANGE-partitioned by created_at, one partition per UTC month
+# (task_runs_pYYYYMM) plus a DEFAULT partition so inserts never fail if maintenance
+# (scripts/task_runs_partitions.py) falls behind. Existing rows are copied over in the
+# migration's transaction; on a large table schedule it like any table rewrite.
+# distance_m moves from numeric(10,2) to double precision (fixed width, no rounding).
+PARTITIONS_AHEAD = 3
+
+COLUMNS = "id, task_id, worker_id, client_location, distance_m, allowed, client_ts, created_at"
+
+
+def _months(first: datetime, last: datetime):
+    month = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month <= last:
+        nxt = month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+        yield month, nxt
+        month = nxt
+
+
+def upgrade():
+    op.execute("ALTER TABLE task_runs RENAME TO task_runs_legacy")
+    op.execute("ALTER TABLE task_runs_legacy RENAME CONSTRAINT task_runs_pkey TO task_runs_legacy_pkey")
+    op.execute("ALTER INDEX IF EXISTS idx_task_runs_client_location RENAME TO idx_task_runs_legacy_client_location")
+    # keep the id sequence (and its position) for the new table
+    op.execute("ALTER TABLE task_runs_legacy ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE task_runs_id_seq AS bigint OWNED BY NONE")
+
+    op.execute('''
+        CREATE TABLE task_runs (
+            id bigint NOT NULL DEFAULT nextval('task_runs_id_seq'),
+            task_id integer NOT NULL REFERENCES tasks (id),
+            worker_id varchar(120) NOT NULL,
+            client_location geography(POINT, 4326) NOT NULL,
+            distance_m double precision NOT NULL,
+            allowed boolean NOT NULL DEFAULT false,
+            client_ts timestamptz,
+            created_at timestamptz NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    ''')
+    op.execute("ALTER SEQUENCE task_runs_id_seq OWNED BY task_runs.id")
+    op.execute("CREATE INDEX ix_task_runs_task_id_created_at ON task_runs (task_id, created_at)")
+    op.execute("CREATE INDEX ix_task_runs_worker_id_created_at ON task_runs (worker_id, created_at)")
+    op.execute("CREATE INDEX idx_task_runs_client_location ON task_runs USING GIST (client_location)")
+    op.execute("CREATE TABLE task_runs_default PARTITION OF task_runs DEFAULT")
+
+    now = datetime.now(timezone.utc)
+    oldest = op.get_bind().execute(sa.text("SELECT MIN(created_at) FROM task_runs_legacy")).scalar() or now
+    ahead = now.replace(day=1)
+    for _ in range(PARTITIONS_AHEAD):
+        ahead = ahead.replace(year=ahead.year + ahead.month // 12, month=ahead.month % 12 + 1)
+    for start, end in _months(oldest.astimezone(timezone.utc), ahead):
+        op.execute(
+            f"CREATE TABLE task_runs_p{start:%Y%m} PARTITION OF task_runs "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+    op.execute(f'''
+        INSERT INTO task_runs ({COLUMNS})
+        SELECT id, task_id, worker_id, client_location, distance_m, allowed, client_ts, COALESCE(created_at, NOW())
+        FROM task_runs_legacy
+    ''')
+    op.execute("DROP TABLE task_runs_legacy")
+
+
+def downgrade():
+    op.execute("ALTER TABLE task_runs RENAME TO task_runs_partitioned")
+    op.execute("ALTER INDEX idx_task_runs_client_location RENAME TO idx_task_runs_partitioned_client_location")
+    op.execute("ALTER TABLE task_runs_partitioned ALTER COLUMN id DROP DEFAULT")
+    op.execute("ALTER SEQUENCE task_runs_id_seq AS integer OWNED BY NONE")
+    op.execute('''
+        CREATE TABLE task_runs (
+            id integer PRIMARY KEY DEFAULT nextval('task_runs_id_seq'),
+            task_id integer NOT NULL REFERENCES tasks (id),
+            worker_id varchar(120) NOT NULL,
+            client_location geography(POINT, 4326) NOT NULL,
+            distance_m numeric(10, 2) NOT NULL,
+            allowed boolean NOT NULL DEFAULT false,
+            client_ts timestamptz,
+            created_at timestamptz DEFAULT NOW()
+        )
+    ''')
+    op.execute("ALTER SEQUENCE task_runs_id_seq OWNED BY task_runs.id")
+    op.execute("CREATE INDEX idx_task_runs_client_location ON task_runs USING GIST (client_location)")
+    op.execute(f"INSERT INTO task_runs ({COLUMNS}) SELECT {COLUMNS} FROM task_runs_partitioned")
+    op.execute("DROP TABLE task_runs_partitioned CASCADE")
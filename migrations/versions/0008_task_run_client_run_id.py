@@ -0,0 +1,23 @@
+from alembic import op
+
+revision = '0008_task_run_client_run_id'
+down_revision = '0007_partition_task_runs'
+branch_labels = None
+depends_on = None
+
+# client_run_id identifies a check-in across retries and write-behind redelivery
+# (app/services/run_buffer.py). A unique index on a partitioned table has to include the
+# partition key, so uniqueness is per (client_run_id, created_at): the buffered record
+# keeps its created_at, which is what makes a replayed batch collide. NULLs never collide.
+
+
+def upgrade():
+    op.execute("ALTER TABLE task_runs ADD COLUMN client_run_id uuid")
+    op.execute(
+        "CREATE UNIQUE INDEX uq_task_runs_client_run_id_created_at ON task_runs (client_run_id, created_at)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS uq_task_runs_client_run_id_created_at")
+    op.execute("ALTER TABLE task_runs DROP COLUMN client_run_id")
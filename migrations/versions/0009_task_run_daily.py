@@ -0,0 +1,34 @@
+from alembic import op
+
+revision = '0009_task_run_daily'
+down_revision = '0008_task_run_client_run_id'
+branch_labels = None
+depends_on = None
+
+# Per store, per UTC day rollup of task_runs, maintained by app/services/run_rollup.py.
+# distance_histogram[i] counts runs below bound i of run_rollup.DISTANCE_BUCKETS_M and
+# at or above bound i-1 (width_bucket numbering); the last bucket is open-ended.
+
+
+def upgrade():
+    op.execute('''
+        CREATE TABLE task_run_daily (
+            store_id integer NOT NULL REFERENCES stores (id),
+            day date NOT NULL,
+            runs integer NOT NULL,
+            allowed integer NOT NULL,
+            distance_p50 double precision,
+            distance_p90 double precision,
+            distance_p99 double precision,
+            distance_histogram integer[] NOT NULL,
+            refreshed_at timestamptz NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (store_id, day)
+        )
+    ''')
+    # store-scoped run history joins task_runs through the store's tasks
+    op.execute("CREATE INDEX ix_tasks_store_id ON tasks (store_id, id)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_tasks_store_id")
+    op.execute("DROP TABLE task_run_daily")
@@ -0,0 +1,20 @@
+from alembic import op
+
+revision = '0010_store_geofence_polygon'
+down_revision = '0009_task_run_daily'
+branch_labels = None
+depends_on = None
+
+# Optional polygon geofence per store (malls, campuses, warehouses). Polygons are stored
+# as MULTIPOLYGON so one column covers both shapes; when set, check-ins are matched by
+# containment instead of by the store radius.
+
+
+def upgrade():
+    op.execute("ALTER TABLE stores ADD COLUMN geofence geography(MULTIPOLYGON, 4326)")
+    op.execute("CREATE INDEX idx_stores_geofence ON stores USING GIST (geofence)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_stores_geofence")
+    op.execute("ALTER TABLE stores DROP COLUMN geofence")
@@ -0,0 +1,24 @@
+from alembic import op
+
+revision = '0011_store_cells'
+down_revision = '0010_store_geofence_polygon'
+branch_labels = None
+depends_on = None
+
+# Geohash cells covered by each store's geofence, maintained by app/services/cell_index.py.
+# Existing stores are indexed with `python -m scripts.index_store_cells` after upgrading.
+
+
+def upgrade():
+    op.execute('''
+        CREATE TABLE store_cells (
+            cell varchar(12) NOT NULL,
+            store_id integer NOT NULL REFERENCES stores (id) ON DELETE CASCADE,
+            PRIMARY KEY (cell, store_id)
+        )
+    ''')
+    op.execute("CREATE INDEX ix_store_cells_store_id ON store_cells (store_id)")
+
+
+def downgrade():
+    op.execute("DROP TABLE store_cells")
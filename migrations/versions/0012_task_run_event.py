@@ -0,0 +1,21 @@
+from alembic import op
+
+revision = '0012_task_run_event'
+down_revision = '0011_store_cells'
+branch_labels = None
+depends_on = None
+
+# Presence transitions streamed over WS /tasks/pings (app/services/presence.py) are stored
+# as task runs with `event` set; check-ins keep it NULL. Adding a nullable column without
+# a default is a catalog-only change, also on the partitioned table. There is deliberately
+# no CHECK on the values: adding one would scan every partition under an ACCESS EXCLUSIVE
+# lock, and the only writer (presence.record_transitions) already limits them to
+# presence.EVENTS.
+
+
+def upgrade():
+    op.execute("ALTER TABLE task_runs ADD COLUMN event varchar(10)")
+
+
+def downgrade():
+    op.execute("ALTER TABLE task_runs DROP COLUMN event")
@@ -0,0 +1,31 @@
+"""Compile an offline gazetteer for the "local" geocode provider.
+
+    python -m scripts.build_gazetteer places.csv -o data/gazetteer.bin
+    python -m scripts.build_gazetteer --format geonames UA.txt PL.txt -o data/gazetteer.bin
+
+CSV columns: country, lat, lng and any of postal_code, city, address (exact store
+addresses give "address" precision). Point GEOCODE_GAZETTEER_PATH at the output; a
+GeoNames build has no addresses, so also set GEOCODE_LOCAL_PRECISIONS=postal_code,locality.
+"""
+import argparse
+import itertools
+from app.services.gazetteer import build, read_csv, read_geonames
+
+READERS = {"csv": read_csv, "geonames": read_geonames}
+
+def run(paths: list[str], fmt: str, output: str):
+    files = [open(p, encoding="utf-8-sig", newline="") for p in paths]
+    try:
+        count = build(itertools.chain.from_iterable(READERS[fmt](f) for f in files), output)
+    finally:
+        for f in files:
+            f.close()
+    print(f"Wrote {count} gazetteer keys to {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile an offline gazetteer")
+    parser.add_argument("--format", choices=sorted(READERS), default="csv")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    run(args.paths, args.format, args.output)
@@ -0,0 +1,47 @@
+"""Export task_runs (with task and store columns) as NDJSON or CSV, optionally compressed.
+
+    python -m scripts.export_task_runs --since 2025-01-01 --until 2025-07-01 -o runs.ndjson.zst --compression zstd
+    python -m scripts.export_task_runs --format csv --company-id 3 > runs.csv
+
+Rows are streamed from a server-side cursor and written chunk by chunk, so memory use
+does not depend on the size of the export. Without -o the export goes to stdout.
+"""
+import argparse
+import sys
+import time
+from datetime import datetime
+from app.services.run_export import COMPRESSIONS, FORMATS, ExportFilter, export_chunks, iter_export_rows
+
+def run(out, fmt: str, compression: str, f: ExportFilter) -> int:
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for row in iter_export_rows(f):
+            rows += 1
+            yield row
+
+    for chunk in export_chunks(counted(), fmt, compression):
+        out.write(chunk)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export task_runs")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--since", type=datetime.fromisoformat)
+    parser.add_argument("--until", type=datetime.fromisoformat)
+    parser.add_argument("--company-id", type=int)
+    parser.add_argument("--store-id", type=int)
+    parser.add_argument("-o", "--output", help="file to write (default: stdout)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    f = ExportFilter(args.since, args.until, args.company_id, args.store_id)
+    if args.output:
+        with open(args.output, "wb") as out:
+            rows = run(out, args.format, args.compression, f)
+    else:
+        rows = run(sys.stdout.buffer, args.format, args.compression, f)
+    elapsed = time.perf_counter() - started
+    print(f"Exported {rows} run(s) in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):.0f} rows/s)", file=sys.stderr)
@@ -0,0 +1,51 @@
+"""Bulk-import stores for a company from a CSV or NDJSON file (or stdin).
+
+    python -m scripts.import_stores --company-id 1 stores.csv
+    zcat stores.ndjson.gz | python -m scripts.import_stores --company-id 1 --format ndjson -
+
+CSV columns / NDJSON keys: name, address_lines, city, state, country, postal_code.
+"""
+import argparse
+import sys
+from sqlalchemy.orm import Session
+from app.core.db import SessionLocal
+from app.models.models import Company, StoreImport
+from app.services.store_import import FORMATS, format_for, run_import
+from app.workers.tasks import enqueue_geocode_batches
+
+def run(company_id: int, path: str, fmt: str | None, chunk_size: int | None):
+    fmt = fmt or format_for(None, path)
+    if fmt not in FORMATS:
+        sys.exit("Cannot tell the input format; pass --format csv|ndjson")
+    db: Session = SessionLocal()
+    try:
+        if not db.get(Company, company_id):
+            sys.exit(f"Company {company_id} not found")
+        imp = StoreImport(company_id=company_id, source=fmt, status="queued", total_rows=0, inserted=0, failed=0)
+        db.add(imp)
+        db.commit()
+        db.refresh(imp)
+
+        def progress(i: StoreImport):
+            print(f"import {i.id}: {i.inserted} inserted, {i.failed} failed of {i.total_rows} rows", file=sys.stderr)
+
+        f = sys.stdin if path == "-" else open(path, encoding="utf-8-sig", newline="")
+        try:
+            imp = run_import(db, imp.id, f, enqueue=enqueue_geocode_batches, chunk_size=chunk_size, on_progress=progress)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+        print(f"Import {imp.id} {imp.status}: {imp.inserted} stores queued for geocoding, {imp.failed} rows rejected")
+        if imp.error_msg:
+            print(imp.error_msg, file=sys.stderr)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import stores from CSV/NDJSON")
+    parser.add_argument("--company-id", type=int, required=True)
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument("path", help="input file, or - for stdin")
+    args = parser.parse_args()
+    run(args.company_id, args.path, args.format, args.chunk_size)
@@ -0,0 +1,38 @@
+"""Rebuild the geohash cell index (store_cells) for all stores or one company.
+
+    python -m scripts.index_store_cells                 # every store, in chunks
+    python -m scripts.index_store_cells --company-id 3
+
+Needed once after migration 0011 and after changing STORE_CELL_* settings; afterwards
+the index is kept up to date by the geocoding tasks and radius/geofence updates.
+"""
+import argparse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from app.core.db import SessionLocal
+from app.services.cell_index import index_company, index_stores
+
+CHUNK = 1000
+
+def run(company_id: int | None):
+    db: Session = SessionLocal()
+    try:
+        if company_id is not None:
+            rows = index_company(db, company_id)
+            db.commit()
+            print(f"Indexed company {company_id}: {rows} cell(s)")
+            return
+        ids = list(db.execute(text("SELECT id FROM stores ORDER BY id")).scalars())
+        rows = 0
+        for i in range(0, len(ids), CHUNK):
+            rows += index_stores(db, ids[i:i + CHUNK])
+            db.commit()
+        print(f"Indexed {len(ids)} store(s): {rows} cell(s)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild store_cells")
+    parser.add_argument("--company-id", type=int)
+    args = parser.parse_args()
+    run(args.company_id)
@@ -0,0 +1,30 @@
+"""Drain the task_runs write-behind stream outside the API (TASK_RUN_WRITE_MODE=redis).
+
+    python -m scripts.run_writer
+
+Runs one flusher in the redis consumer group; start as many as the write rate needs and
+set TASK_RUN_FLUSHER_IN_API=false to keep flushing out of the API processes. Stops on
+SIGINT/SIGTERM after writing the batch in flight; anything unacked is picked up again.
+"""
+import asyncio
+import logging
+import signal
+from app.core.config import settings
+from app.core.db import engine
+from app.services.run_buffer import start_flusher, stop_flusher
+
+async def main():
+    if settings.TASK_RUN_WRITE_MODE != "redis":
+        raise SystemExit(f"TASK_RUN_WRITE_MODE={settings.TASK_RUN_WRITE_MODE!r}: only the redis buffer can be drained out of process")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await start_flusher(engine)
+    print(f"Flushing {settings.TASK_RUN_STREAM} in batches of {settings.TASK_RUN_FLUSH_BATCH}")
+    await stop.wait()
+    await stop_flusher()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
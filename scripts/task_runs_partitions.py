@@ -0,0 +1,38 @@
+"""Maintain the monthly task_runs partitions; run daily (cron, a k8s CronJob, ...).
+
+    python -m scripts.task_runs_partitions                      # create upcoming months
+    python -m scripts.task_runs_partitions --retain-months 13 --mode archive
+
+Creates this month's partition and --ahead more. With --retain-months, partitions older
+than that many months are detached (--mode detach), moved to the task_runs_archive
+schema (archive) or dropped (drop). --list prints the current partitions only.
+"""
+import argparse
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.services.partitions import RETIRE_MODES, ensure_partitions, list_partitions, retire_partitions
+
+def run(ahead: int, retain_months: int | None, mode: str, list_only: bool):
+    db: Session = SessionLocal()
+    try:
+        if list_only:
+            for name in list_partitions(db):
+                print(name)
+            return
+        created = ensure_partitions(db, ahead)
+        print(f"Created {len(created)} partition(s): {', '.join(created) or '-'}")
+        if retain_months:
+            retired = retire_partitions(db, retain_months, mode)
+            print(f"Retired ({mode}) {len(retired)} partition(s): {', '.join(retired) or '-'}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain task_runs partitions")
+    parser.add_argument("--ahead", type=int, default=settings.TASK_RUNS_PARTITIONS_AHEAD)
+    parser.add_argument("--retain-months", type=int, default=settings.TASK_RUNS_RETAIN_MONTHS or None)
+    parser.add_argument("--mode", choices=RETIRE_MODES, default=settings.TASK_RUNS_RETIRE_MODE)
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+    run(args.ahead, args.retain_months, args.mode, args.list)
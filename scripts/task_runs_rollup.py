@@ -0,0 +1,28 @@
+"""Backfill or repair the task_run_daily rollup.
+
+    python -m scripts.task_runs_rollup --since 2025-01-01
+    python -m scripts.task_runs_rollup --since 2025-03-01 --until 2025-03-31
+
+Recomputes every day in the range (UTC, inclusive; --until defaults to today) from
+task_runs. The beat task only keeps the last few days fresh.
+"""
+import argparse
+from datetime import date
+from sqlalchemy.orm import Session
+from app.core.db import SessionLocal
+from app.services.run_rollup import refresh_daily
+
+def run(since: date, until: date | None):
+    db: Session = SessionLocal()
+    try:
+        rows = refresh_daily(db, since, until)
+        print(f"Refreshed {rows} store-day row(s) from {since} to {until or 'today'}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute the task_run_daily rollup")
+    parser.add_argument("--since", type=date.fromisoformat, required=True)
+    parser.add_argument("--until", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+    run(args.since, args.until)
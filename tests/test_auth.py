@@ -1,7 +1,12 @@
 import asyncio
+import time
 import jwt
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
 from app.core.config import settings
-from app.core.auth import create_access_token, get_current_user, TokenData
+from app.core.auth import TokenCache, create_access_token, get_current_user, token_digest, verified_tokens, TokenData
 
 
 def test_create_access_token():
@@ -19,3 +24,57 @@ def test_demo_token_allows_get_current_user():
     assert user.sub == "demo@user"
     assert user.role == "worker"
 
+
+
+def _bearer(token):
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def test_verified_tokens_are_cached_until_exp(monkeypatch):
+    verified_tokens.clear()
+    token = create_access_token(subject="w@example.com", role="worker", expires_minutes=5)
+    decodes = []
+    real_decode = jwt.decode
+    monkeypatch.setattr(jwt, "decode", lambda *a, **kw: decodes.append(1) or real_decode(*a, **kw))
+    for _ in range(3):
+        user = asyncio.run(get_current_user(_bearer(token), None))
+        assert (user.sub, user.role) == ("w@example.com", "worker")
+    assert len(decodes) == 1
+
+    # the entry never outlives the token
+    key = token_digest(token)
+    verified_tokens.put(key, user, exp=time.time() - 1)
+    assert verified_tokens.get(key) is None
+
+    # a rotated signing key misses the cache and rejects the old token
+    monkeypatch.setattr(settings, "SECRET_KEY", "rotated")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_user(_bearer(token), None))
+    assert exc.value.status_code == 401
+
+
+def test_cache_is_bounded():
+    cache = TokenCache(max_entries=2, ttl_sec=60)
+    for i in range(3):
+        cache.put(bytes([i]), TokenData(sub=str(i), role="worker"), exp=None)
+    assert len(cache) == 2 and cache.get(bytes([0])) is None
+
+
+def test_user_is_resolved_once_per_request(monkeypatch):
+    import app.core.auth as auth
+    import app.core.ratelimit as ratelimit
+
+    monkeypatch.setattr(ratelimit, "_redis", None)
+    calls = []
+    real_verify = auth.verify_token
+    monkeypatch.setattr(auth, "verify_token", lambda token: calls.append(token) or real_verify(token))
+    api = FastAPI()
+
+    @api.post("/run", dependencies=[Depends(ratelimit.rate_limit("test", 10, 60))])
+    async def run(user=Depends(get_current_user)):
+        return {"sub": user.sub}
+
+    token = create_access_token(subject="w@example.com", role="worker")
+    r = TestClient(api).post("/run", headers={"Authorization": f"Bearer {token}"})
+    assert r.json() == {"sub": "w@example.com"}
+    assert len(calls) == 1
@@ -0,0 +1,162 @@
+import contextlib
+import math
+import random
+import threading
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.core.db import get_db
+from app.services import cell_index, geohash
+from app.services.cell_index import CellIndex, IndexedStore, circle_cells, index_stores, polygon_cells, stores_at
+from app.services.geodesy import vincenty_m
+from app.services.polygons import fence_from_geojson
+
+SQUARE = {"type": "Polygon", "coordinates": [[
+    [29.999, 49.999], [30.001, 49.999], [30.001, 50.001], [29.999, 50.001], [29.999, 49.999],
+]]}
+
+
+def test_geohash_reference_vector_and_prefixes():
+    assert geohash.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    lat_lo, lat_hi, lng_lo, lng_hi = geohash.bounds("u4pruyd")
+    assert lat_lo <= 57.64911 < lat_hi and lng_lo <= 10.40744 < lng_hi
+    assert geohash.encode(57.64911, 10.40744, 5) == "u4pru"
+    assert geohash.cell_size(7) == pytest.approx((180 / 2 ** 17, 360 / 2 ** 18))
+
+
+def test_circle_cover_never_misses_a_point_inside():
+    rng = random.Random(7)
+    lat, lng, radius = 50.4501, 30.5234, 150
+    cells = circle_cells(lat, lng, radius)
+    assert all(len(c) == settings.STORE_CELL_PRECISION for c in cells)
+    for _ in range(2000):
+        bearing, dist = rng.uniform(0, 2 * math.pi), radius * math.sqrt(rng.random())
+        plat = lat + dist * math.cos(bearing) / 111_200
+        plng = lng + dist * math.sin(bearing) / (111_200 * math.cos(math.radians(lat)))
+        if vincenty_m(lat, lng, plat, plng) <= radius:
+            assert geohash.encode(plat, plng, 7) in cells
+
+
+def test_large_fences_fall_back_to_coarser_cells(monkeypatch):
+    monkeypatch.setattr(settings, "STORE_CELL_MAX_CELLS", 50)
+    cells = circle_cells(50.45, 30.52, 5000)
+    assert len(cells) <= 50
+    assert {len(c) for c in cells} == {5}
+
+
+def test_polygon_cover_contains_its_interior():
+    cells = polygon_cells(fence_from_geojson(SQUARE).wkb)
+    for lat in (49.9991, 50.0, 50.0009):
+        for lng in (29.9991, 30.0, 30.0009):
+            assert geohash.encode(lat, lng, 7) in cells
+
+
+def test_index_stores_rewrites_cells_in_one_insert():
+    statements = []
+    rows = [{"id": 1, "lat": 50.0, "lng": 30.0, "radius_m": 100, "fence_wkb": None},
+            {"id": 2, "lat": None, "lng": None, "radius_m": 100, "fence_wkb": fence_from_geojson(SQUARE).wkb}]
+
+    class FakeDB:
+        def execute(self, sql, params):
+            statements.append((" ".join(str(sql).split()), params))
+            return SimpleNamespace(mappings=lambda: rows)
+
+    written = index_stores(FakeDB(), [1, 2, 3])
+    assert statements[1][0].startswith("DELETE FROM store_cells")
+    assert statements[1][1] == {"ids": [1, 2, 3]}  # store 3 is not ready: its cells are dropped
+    insert = statements[2][1]
+    assert len(insert["cells"]) == written == len(insert["store_ids"])
+    assert set(insert["store_ids"]) == {1, 2}
+
+
+def make_index() -> CellIndex:
+    circle = IndexedStore(1, 100, "Circle", 50.0, 30.0, 100, False)
+    far = IndexedStore(2, 100, "Neighbour", 50.0, 30.003, 100, False)
+    big = IndexedStore(3, 200, "Campus", 50.01, 30.01, 5000, False)
+    cells = {c: (1,) for c in circle_cells(50.0, 30.0, 100)}
+    for c in circle_cells(50.0, 30.003, 100):
+        cells[c] = cells.get(c, ()) + (2,)
+    cells[geohash.encode(50.0, 30.0, 5)] = (3,)
+    return CellIndex(cells, {s.id: s for s in (circle, far, big)})
+
+
+def test_candidates_checked_exactly_across_precisions(monkeypatch):
+    monkeypatch.setattr(cell_index, "_index", make_index())
+    index = cell_index._index
+    assert index.precisions == [7, 5]
+    assert index.candidates(50.0, 30.0) == {1, 3}
+    here = stores_at(None, 50.0, 30.0005)
+    assert [s["id"] for s in here] == [1, 3]
+    # ~107 m east: still a candidate of store 1's cells, rejected by the exact check
+    assert [s["id"] for s in stores_at(None, 50.0, 30.0015)] == [3]
+
+
+def test_stores_here_endpoint(monkeypatch):
+    monkeypatch.setattr(cell_index, "_index", make_index())
+    settings.DEMO_TOKEN = "demo-test"
+    app.dependency_overrides[get_db] = lambda: None
+    resp = TestClient(app).get("/stores:here?lat=50.0&lng=30.003", headers={"X-Demo-Token": "demo-test"})
+    app.dependency_overrides.pop(get_db, None)
+    assert resp.status_code == 200, resp.text
+    assert [s["id"] for s in resp.json()] == [2, 3]
+
+
+def test_stale_index_is_served_while_a_background_reload_runs(monkeypatch):
+    old, new = make_index(), CellIndex({}, {})
+    release, calls = threading.Event(), []
+
+    def slow_load(db):
+        calls.append(db)
+        release.wait(5)
+        return new
+
+    monkeypatch.setattr(cell_index, "_index", old)
+    monkeypatch.setattr(cell_index, "SessionLocal", contextlib.nullcontext)
+    monkeypatch.setattr(CellIndex, "load", staticmethod(slow_load))
+    cell_index.invalidate_cell_index()
+
+    assert cell_index.get_cell_index(None) is old
+    assert cell_index.get_cell_index(None) is old  # one reload at a time
+    release.set()
+    with cell_index._loading:  # held until the reload has swapped the index in
+        pass
+    assert cell_index.get_cell_index(None) is new
+    assert len(calls) == 1
+
+
+def test_changed_stores_are_updated_in_place_without_a_full_reload(monkeypatch):
+    index = make_index()
+    moved = circle_cells(50.0, 30.01, 100)
+
+    class FakeDB:
+        def execute(self, sql, params):
+            if "store_cells" in str(sql):
+                return [(cell, 1) for cell in moved]
+            return SimpleNamespace(mappings=lambda: [{
+                "id": 1, "company_id": 100, "name": "Circle", "lat": 50.0, "lng": 30.01,
+                "radius_m": 100, "has_geofence": False,
+            }])
+
+    def no_full_load(db):
+        raise AssertionError("full reload")
+
+    monkeypatch.setattr(cell_index, "_index", index)
+    monkeypatch.setattr(cell_index, "_stale", False)
+    monkeypatch.setattr(cell_index, "_dirty_stores", set())
+    monkeypatch.setattr(cell_index, "_dirty_companies", set())
+    monkeypatch.setattr(cell_index, "SessionLocal", lambda: contextlib.nullcontext(FakeDB()))
+    monkeypatch.setattr(CellIndex, "load", staticmethod(no_full_load))
+    # store 1 moved; company 200's only store (3) lost its location
+    cell_index.invalidate_cell_stores([1])
+    cell_index.invalidate_cell_company(200)
+
+    assert cell_index.get_cell_index(None) is index
+    with cell_index._loading:
+        pass
+    assert index.candidates(50.0, 30.0) == set()
+    assert index.candidates(50.0, 30.01) == {1}
+    assert index.candidates(50.0, 30.003) == {2}
+    assert index.stores[1].lng == 30.01 and 3 not in index.stores
+    assert index.precisions == [7]
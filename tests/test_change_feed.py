@@ -0,0 +1,83 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+from app.core.config import settings
+from app.services import change_feed
+from app.services.change_feed import ChangeFeedSubscriber, company_changed, handle_message, stores_changed
+from app.services.store_cache import store_geofences
+from tests.test_store_cache import make_geo
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(change_feed, "invalidate_cell_index", lambda: invalidated.append("all"))
+    monkeypatch.setattr(change_feed, "invalidate_cell_stores", lambda ids: invalidated.append(("stores", ids)))
+    monkeypatch.setattr(change_feed, "invalidate_cell_company", lambda cid: invalidated.append(("company", cid)))
+    store_geofences.clear()
+    store_geofences.put(make_geo(task_id=1, store_id=10, company_id=100))
+    store_geofences.put(make_geo(task_id=2, store_id=11, company_id=200))
+    yield invalidated
+    store_geofences.clear()
+
+
+def test_changes_apply_locally_and_are_published(monkeypatch, fresh_caches):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(change_feed, "_redis", client)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(settings.CHANGE_FEED_CHANNEL)
+
+    stores_changed([10])
+    assert store_geofences.get(1) is None and store_geofences.get(2) is not None
+    company_changed(200)
+    assert store_geofences.get(2) is None
+    # only the changed stores' cells are reloaded, never the whole index
+    assert fresh_caches == [("stores", [10]), ("company", 200)]
+
+    published = []
+    for _ in range(10):
+        message = pubsub.get_message(timeout=0.1)
+        if message:
+            published.append(json.loads(message["data"]))
+        if len(published) == 2:
+            break
+    assert [(m["kind"], m["ids"]) for m in published] == [("stores", [10]), ("company", [200])]
+    assert {m["origin"] for m in published} == {change_feed.NODE_ID}
+
+
+def test_messages_from_other_nodes_are_applied_own_and_malformed_ignored():
+    handle_message(json.dumps({"kind": "stores", "ids": [10], "origin": change_feed.NODE_ID}))
+    assert store_geofences.get(1) is not None
+    handle_message("not json")
+    handle_message(json.dumps({"kind": "tasks", "ids": [1], "origin": "other"}))
+    assert store_geofences.get(1) is not None
+
+    handle_message(json.dumps({"kind": "company", "ids": [100], "origin": "other"}))
+    assert store_geofences.get(1) is None
+
+
+def test_subscriber_resets_on_connect_then_applies_changes(fresh_caches):
+    async def scenario():
+        server = fakeredis.FakeServer()
+        subscriber = ChangeFeedSubscriber(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        subscriber.start()
+        for _ in range(100):
+            if "all" in fresh_caches:
+                break
+            await asyncio.sleep(0.01)
+        reset = store_geofences.get(1) is None and store_geofences.get(2) is None
+
+        store_geofences.put(make_geo(task_id=3, store_id=12, company_id=300))
+        publisher = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        await publisher.publish(settings.CHANGE_FEED_CHANNEL, json.dumps({"kind": "stores", "ids": [12], "origin": "other"}))
+        for _ in range(100):
+            if store_geofences.get(3) is None:
+                break
+            await asyncio.sleep(0.01)
+        applied = store_geofences.get(3) is None
+        await subscriber.stop()
+        await publisher.aclose()
+        return reset, applied
+
+    assert asyncio.run(scenario()) == (True, True)
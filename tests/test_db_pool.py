@@ -0,0 +1,40 @@
+import sqlite3
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import exc
+from app.main import app
+from app.core.db import InstrumentedQueuePool
+
+client = TestClient(app)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_instrumented_pool_times_checkouts_and_counts_timeouts():
+    pool = InstrumentedQueuePool(lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=0, timeout=0.01, logging_name="test")
+    checkouts = sample("db_pool_checkout_seconds_count", engine="test")
+    timeouts = sample("db_pool_checkout_failures_total", engine="test", reason="timeout")
+
+    conn = pool.connect()
+    with pytest.raises(exc.TimeoutError):
+        pool.connect()
+    conn.close()
+
+    assert sample("db_pool_checkout_seconds_count", engine="test") == checkouts + 1
+    assert sample("db_pool_checkout_failures_total", engine="test", reason="timeout") == timeouts + 1
+
+
+def test_metrics_endpoint_exposes_pool_gauges():
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert 'db_pool_checked_out{engine="sync"}' in resp.text
+
+
+def test_readyz_reports_pool_saturation(monkeypatch):
+    monkeypatch.setattr("app.main.pool_saturation", lambda: {"sync": 1.0})
+    resp = client.get("/readyz")
+    assert resp.status_code == 503
+    assert resp.json()["detail"]["pool_saturation"] == {"sync": 1.0}
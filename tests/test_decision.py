@@ -0,0 +1,74 @@
+import asyncio
+import math
+import random
+import pytest
+from prometheus_client import REGISTRY
+from app.core.config import settings
+from app.services.decision import (
+    FAST_TIER_MAX_M, FAST_TIER_REL_ERROR, adecide, classify, decide_many, fast_distance_m, resolve,
+)
+from app.services.geodesy import vincenty_m
+from app.services.polygons import PreparedFence, fence_from_geojson, metres_per_degree, store_fences
+from app.services.store_cache import StoreGeofence
+from tests.test_polygons import SQUARE
+
+STORE = StoreGeofence(1, True, 10, 100, "success", 50.0, 30.0, 100)
+KY = metres_per_degree(50.0)[1]
+
+
+def north(metres: float) -> float:
+    return 50.0 + metres / KY
+
+
+def decisions(tier: str, result: str) -> float:
+    return REGISTRY.get_sample_value("geofence_decisions_total", {"tier": tier, "result": result}) or 0.0
+
+
+def test_fast_distance_stays_within_its_error_bound():
+    rng = random.Random(7)
+    for _ in range(2000):
+        lat0, lng0 = rng.uniform(-80, 80), rng.uniform(-180, 180)
+        d, bearing = rng.uniform(1, FAST_TIER_MAX_M), rng.uniform(0, 2 * math.pi)
+        kx, ky = metres_per_degree(lat0)
+        lat, lng = lat0 + d * math.cos(bearing) / ky, lng0 + d * math.sin(bearing) / kx
+        exact = vincenty_m(lat0, lng0, lat, lng)
+        assert abs(fast_distance_m(lat0, lng0, lat, lng) - exact) <= FAST_TIER_REL_ERROR * exact
+
+
+def test_accuracy_circle_classification_and_policy():
+    assert classify(-30, 20) == ("allowed", True)
+    assert classify(30, 20) == ("denied", False)
+    assert classify(-10, 20) == ("uncertain", True)
+    assert classify(0, 0) == ("allowed", True)
+    assert resolve("uncertain", True, "center") and not resolve("uncertain", False, "center")
+    assert resolve("uncertain", False, "allow") and not resolve("uncertain", True, "deny")
+    with pytest.raises(ValueError):
+        resolve("uncertain", True, "maybe")
+
+
+def test_only_the_band_around_the_radius_needs_the_exact_tier():
+    lats = [north(20), north(5000), north(99.99), north(100.01)]
+    before = decisions("fast", "denied")
+    out = decide_many(None, [STORE] * 4, lats, [30.0] * 4, [None] * 4, backend="geodesic")
+    assert [(d.tier, d.status) for d in out] == [
+        ("fast", "allowed"), ("fast", "denied"), ("exact", "allowed"), ("exact", "denied"),
+    ]
+    assert decisions("fast", "denied") == before + 1
+
+
+def test_accuracy_makes_edge_check_ins_uncertain(monkeypatch):
+    monkeypatch.setattr(settings, "GEOFENCE_UNCERTAIN_POLICY", "deny")
+    near_edge = asyncio.run(adecide(None, STORE, north(90), 30.0, accuracy=25, backend="geodesic"))
+    assert (near_edge.status, near_edge.allowed, near_edge.tier) == ("uncertain", False, "fast")
+    inside = asyncio.run(adecide(None, STORE, north(50), 30.0, accuracy=25, backend="geodesic"))
+    assert (inside.status, inside.allowed) == ("allowed", True)
+
+
+def test_polygon_stores_use_the_distance_to_the_edge():
+    store_fences.put(11, PreparedFence.from_geometry(fence_from_geojson(SQUARE)))
+    fenced = StoreGeofence(2, True, 11, 100, "pending", None, None, 100, has_geofence=True)
+    (decision,) = decide_many(None, [fenced], [50.0009], [30.0], [None])
+    assert decision.tier == "polygon" and decision.status == "allowed"
+    (edgy,) = decide_many(None, [fenced], [50.0009], [30.0], [decision.distance_m + 1])
+    assert edgy.status == "uncertain"
+    store_fences.invalidate(11)
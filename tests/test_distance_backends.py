@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+import pytest
+from app.services.distances import DISTANCE_BACKENDS, geofence_distance, get_distance_backend
+from app.services.geodesy import haversine_m, haversine_many_m, vincenty_m
+from app.services.store_cache import StoreGeofence
+
+# Flinders Peak -> Buninyong, the worked example from Vincenty (1975), 54972.271 m on GRS80/WGS84
+FLINDERS = (-(37 + 57 / 60 + 3.72030 / 3600), 144 + 25 / 60 + 29.52440 / 3600)
+BUNINYONG = (-(37 + 39 / 60 + 10.15610 / 3600), 143 + 55 / 60 + 35.38390 / 3600)
+FLINDERS_BUNINYONG_M = 54972.271
+
+# one metre north of the store at lat 50 is ~1 / 111229 degrees
+STORE = (50.4501, 30.5234)
+CLIENT_23_7 = (50.4501 + 23.7 / 111229.0, 30.5234)
+
+
+def make_store(ready=True, store_id=1):
+    return StoreGeofence(
+        task_id=1,
+        task_active=True,
+        store_id=store_id,
+        company_id=1,
+        geocode_status="success" if ready else "pending",
+        lat=STORE[0] if ready else None,
+        lng=STORE[1] if ready else None,
+        radius_m=100,
+    )
+
+
+class PostgisDB:
+    """Stands in for the set-based ST_Distance query: one row per point that has a store location."""
+
+    def __init__(self, distances):
+        self._rows = [{"ord": i + 1, "distance_m": d} for i, d in enumerate(distances) if d is not None]
+
+    def execute(self, sql, params):
+        return SimpleNamespace(mappings=lambda: iter(self._rows))
+
+
+def backend_db(name, postgis_distance):
+    return PostgisDB([postgis_distance]) if name == "postgis" else None
+
+
+@pytest.mark.parametrize("name", sorted(DISTANCE_BACKENDS))
+def test_backend_within(name):
+    db = backend_db(name, 23.7)
+    distance = geofence_distance(db, make_store(), *CLIENT_23_7, backend=name)
+    assert abs(distance - 23.7) < 23.7 * 0.0056
+    assert distance <= make_store().radius_m
+
+
+@pytest.mark.parametrize("name", sorted(DISTANCE_BACKENDS))
+def test_backend_no_location(name):
+    db = backend_db(name, None)
+    assert geofence_distance(db, make_store(ready=False), *CLIENT_23_7, backend=name) is None
+
+
+def test_postgis_backend_no_row_keeps_order():
+    # store 2 has no location; the result must still line up with the input points
+    db = SimpleNamespace(execute=lambda sql, params: SimpleNamespace(mappings=lambda: iter([{"ord": 1, "distance_m": 5.0}])))
+    out = DISTANCE_BACKENDS["postgis"](db, [make_store(), make_store(store_id=2)], [1.0, 2.0], [1.0, 2.0])
+    assert out == [5.0, None]
+
+
+def test_vincenty_matches_reference_to_the_millimetre():
+    assert abs(vincenty_m(*FLINDERS, *BUNINYONG) - FLINDERS_BUNINYONG_M) < 0.001
+    assert vincenty_m(*STORE, *STORE) == 0.0
+    # nearly antipodal points fall back instead of looping forever
+    assert vincenty_m(0.0, 0.0, 0.5, 179.7) > 19_000_000
+
+
+def test_haversine_within_documented_bound():
+    d = haversine_m(*FLINDERS, *BUNINYONG)
+    assert abs(d - FLINDERS_BUNINYONG_M) / FLINDERS_BUNINYONG_M < 0.0056
+    many = haversine_many_m([FLINDERS[0], STORE[0]], [FLINDERS[1], STORE[1]], [BUNINYONG[0], STORE[0]], [BUNINYONG[1], STORE[1]])
+    assert abs(many[0] - d) < 1e-6
+    assert many[1] == 0.0
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        get_distance_backend("flat-earth")
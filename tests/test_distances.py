@@ -46,3 +46,10 @@ def test_within_radius_and_distance_no_row():
     assert within is False
     assert distance is None
 
+
+
+def test_haversine_known_distance():
+    from app.services.geodesy import haversine_m
+    # one arc-minute of latitude is ~1853 m on the mean sphere
+    assert abs(haversine_m(50.0, 30.0, 50.0 + 1 / 60, 30.0) - 1853.25) < 1.0
+    assert haversine_m(50.4501, 30.5234, 50.4501, 30.5234) == 0.0
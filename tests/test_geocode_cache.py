@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+import fakeredis
+import pytest
+from app.services import geocode_cache
+from app.services.addresses import normalize_address
+from app.services.geocode_cache import cache_store, cached_lookup
+from app.services.geocoding import GeocodeQuery, GeocodeResult
+from app.workers.tasks import lookup
+
+KYIV = GeocodeResult(50.4501, 30.5234, "google", "ROOFTOP")
+
+
+class FakeDB:
+    def __init__(self, row=None):
+        self.row = row
+        self.upserts = []
+        self.selects = 0
+
+    def execute(self, sql, params):
+        if "lat" in params:
+            self.upserts.append(params)
+            return None
+        self.selects += 1
+        return SimpleNamespace(mappings=lambda: SimpleNamespace(first=lambda: self.row))
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(geocode_cache, "_redis", client)
+    return client
+
+
+def test_normalize_address_ignores_case_accents_punctuation_and_spacing():
+    assert normalize_address("Khreshchatyk 1; Kyiv, 01001") == normalize_address("KHRESHCHATYK  1, kyiv 01001")
+    assert normalize_address("Rua São João, 10") == "rua sao joao 10"
+
+
+def test_miss_then_stored_result_is_served_by_redis():
+    db = FakeDB()
+    key = normalize_address("Khreshchatyk 1, Kyiv")
+    assert cached_lookup(db, key) == (None, "provider")
+    assert db.upserts == []  # a miss writes nothing
+
+    cache_store(db, key, KYIV)
+    assert db.upserts[0]["key"] == "khreshchatyk 1 kyiv"
+    assert db.upserts[0]["precision"] == "ROOFTOP"
+
+    # a differently formatted duplicate is now answered by Redis without touching Postgres
+    other = FakeDB()
+    assert cached_lookup(other, normalize_address("KHRESHCHATYK 1; KYIV")) == (KYIV, "redis")
+    assert other.selects == 0
+
+
+def test_db_tier_backfills_redis(fake_redis):
+    row = {"lat": 50.4501, "lng": 30.5234, "provider": "google", "precision": "APPROXIMATE"}
+    result, source = cached_lookup(FakeDB(row), "mall street 5")
+    assert source == "db"
+    assert result.precision == "APPROXIMATE"
+    assert fake_redis.ttl("geocode:mall street 5") > 0
+
+
+def test_worker_lookup_goes_to_the_providers_without_a_key_or_a_cached_result():
+    query = GeocodeQuery("Nowhere 0", "Kyiv")
+    assert lookup(FakeDB(), "", query, False, ["google"]) == (None, "provider")
+    assert lookup(FakeDB(), "nowhere 0 kyiv", query, False, ["google"]) == (None, "provider")
+    cache_store(FakeDB(), "nowhere 0 kyiv", KYIV)
+    assert lookup(FakeDB(), "nowhere 0 kyiv", query, False, ["google"]) == (KYIV, "redis")
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import fakeredis
+import httpx
+import pytest
+from app.core.config import settings
+from app.services import geocode_throttle
+from app.workers import tasks
+
+
+class FakeDB:
+    def __init__(self):
+        self.jobs = []
+        self.commits = 0
+
+    def execute(self, sql, params):
+        if "UPDATE geocode_jobs" in str(sql):
+            self.jobs.append((params["statuses"][0], params["errors"][0]))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(tasks, "_redis", client)
+    monkeypatch.setattr(geocode_throttle, "_redis", client)
+    return client
+
+
+def test_retry_delay_grows_exponentially_with_jitter_and_a_cap(monkeypatch):
+    monkeypatch.setattr(settings, "GEOCODE_RETRY_BASE_SEC", 10)
+    monkeypatch.setattr(settings, "GEOCODE_RETRY_MAX_SEC", 60)
+    for retries, ceiling in ((0, 10), (1, 20), (2, 40), (3, 60), (8, 60)):
+        delays = {tasks.retry_delay(retries) for _ in range(50)}
+        assert all(ceiling / 2 <= d <= ceiling for d in delays)
+        assert len(delays) > 1
+
+
+def test_store_is_queued_once_until_its_task_finishes(fake_redis, monkeypatch):
+    queued = []
+    monkeypatch.setattr(tasks.enqueue_geocode, "delay", queued.append)
+
+    assert tasks.enqueue_geocode_once(7)
+    assert not tasks.enqueue_geocode_once(7)
+    assert queued == [7]
+    assert 0 < fake_redis.ttl("geocode:pending:7") <= settings.GEOCODE_DEDUP_TTL_SEC
+
+    tasks.release_geocode(7)
+    assert tasks.enqueue_geocode_once(7)
+    assert queued == [7, 7]
+
+
+def test_failing_store_retries_on_one_job_row_then_fails_once(fake_redis, monkeypatch):
+    db = FakeDB()
+    monkeypatch.setattr(tasks, "SessionLocal", lambda: db)
+    monkeypatch.setattr(tasks, "stores_changed", lambda store_ids: None)
+    monkeypatch.setattr(tasks, "retry_delay", lambda retries: 0)
+
+    def down(db, store_id):
+        raise httpx.ConnectError("provider down")
+
+    monkeypatch.setattr(tasks, "geocode_store", down)
+    tasks.claim_geocode(3)
+    tasks.enqueue_geocode.apply(args=[3])
+
+    retries = tasks.enqueue_geocode.max_retries
+    assert db.jobs == [("queued", "provider down")] * retries + [("failed", "provider down")]
+    assert fake_redis.get("geocode:pending:3") is None
+
+
+def test_throttle_shares_one_bucket_per_provider(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "GEOCODE_PROVIDER_QPS", "google=2")
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+        fake_redis.delete("geocode:qps:google")  # as if the bucket refilled meanwhile
+
+    monkeypatch.setattr(geocode_throttle.asyncio, "sleep", fake_sleep)
+
+    async def burst():
+        return [await geocode_throttle.acquire("google") for _ in range(3)] + [await geocode_throttle.acquire("nominatim")]
+
+    waits = asyncio.run(burst())
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] > 0 and len(slept) == 1
+    assert waits[3] == 0.0  # no configured rate: never throttled
+
+
+def test_throttle_checks_redis_off_the_event_loop(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "GEOCODE_PROVIDER_QPS", "google=2")
+    threads = []
+
+    def fake_gcra(client, key, limit, window_ms):
+        threads.append(threading.current_thread())
+        return 1, 0
+
+    monkeypatch.setattr(geocode_throttle, "run_gcra", fake_gcra)
+
+    async def acquire():
+        return await geocode_throttle.acquire("google"), threading.current_thread()
+
+    waited, loop_thread = asyncio.run(acquire())
+    assert waited == 0.0
+    assert threads and threads[0] is not loop_thread
@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+import fakeredis
+import httpx
+import pytest
+from app.services import geocode_cache, geocoding
+from app.services.geocoding import GeocodeQuery, GeocodeResult, geocode_many, get_http_client
+from app.workers import aio, tasks
+
+KYIV = GeocodeResult(50.4501, 30.5234, "google", "ROOFTOP")
+
+
+def store(id, address, city="Kyiv"):
+    return SimpleNamespace(id=id, address_lines=address, city=city, state=None, country="UA", postal_code=None)
+
+
+class NoRows(list):
+    def first(self):
+        return None
+
+
+class FakeDB:
+    def __init__(self, stores):
+        self.stores = stores
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, sql, params):
+        self.statements.append((str(sql), params))
+        if "FROM stores WHERE id" in str(sql):
+            return SimpleNamespace(all=lambda: self.stores)
+        return SimpleNamespace(mappings=NoRows)
+
+    def commit(self):
+        self.commits += 1
+
+    def params_for(self, fragment):
+        return [p for sql, p in self.statements if fragment in sql]
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    monkeypatch.setattr(geocode_cache, "_redis", fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_worker_loop_is_reused_and_keeps_one_http_client():
+    async def client_and_loop():
+        return get_http_client(), asyncio.get_running_loop()
+
+    first = aio.run(client_and_loop())
+    second = aio.run(client_and_loop())
+    assert first == second
+    assert first[1] is aio.get_loop()
+
+
+def test_geocode_many_bounds_concurrency_and_keeps_order(monkeypatch):
+    in_flight = peak = 0
+
+    async def fake_provider(query):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if query.address_lines == "boom":
+            raise httpx.ConnectError("down")
+        return GeocodeResult(float(len(query.address_lines)), 0.0, "google")
+
+    monkeypatch.setitem(geocoding.GEOCODE_PROVIDERS, "google", fake_provider)
+    queries = [GeocodeQuery("a" * n) for n in range(1, 20)] + [GeocodeQuery("boom")]
+    results = asyncio.run(geocode_many(queries, concurrency=4, providers=["google"]))
+
+    assert peak == 4
+    assert [r.lat for r in results[:-1]] == [float(n) for n in range(1, 20)]
+    assert isinstance(results[-1], httpx.ConnectError)
+
+
+def test_geocode_batch_fetches_each_miss_once_and_writes_in_bulk(monkeypatch):
+    fetched = []
+
+    async def fake_many(queries, concurrency=None, providers=None):
+        addresses = [q.text for q in queries]
+        fetched.extend(addresses)
+        return [httpx.ConnectError("down") if "Broken" in a else (None if "Nowhere" in a else KYIV) for a in addresses]
+
+    monkeypatch.setattr(tasks, "geocode_many", fake_many)
+    geocode_cache._redis_set("mall street 5 kyiv ua", KYIV)
+    db = FakeDB([
+        store(1, "Khreshchatyk 1"),
+        store(2, "KHRESHCHATYK 1;"),
+        store(3, "Mall Street 5"),
+        store(4, "Nowhere 0"),
+        store(5, "Broken 9"),
+    ])
+
+    by_store = tasks.geocode_batch(db, [1, 2, 3, 4, 5])
+
+    assert by_store == {1: "provider", 2: "provider", 3: "redis", 4: "provider", 5: "error"}
+    assert fetched == ["Khreshchatyk 1, Kyiv, UA", "Nowhere 0, Kyiv, UA", "Broken 9, Kyiv, UA"]
+    [update] = db.params_for("UPDATE stores")
+    assert update["ids"] == [1, 2, 3, 4]
+    assert update["statuses"] == ["success", "success", "success", "failed"]
+    [started] = db.params_for("INSERT INTO geocode_jobs")
+    assert started["ids"] == [1, 2, 3, 4, 5]
+    [jobs] = db.params_for("UPDATE geocode_jobs")
+    assert jobs["statuses"] == ["success", "success", "success", "failed", "queued"]
+    assert jobs["errors"] == [None, None, None, "geocoder_no_result", "provider_error"]
+    # geocoded stores get their geofence cells in the same transaction
+    [indexed] = db.params_for("DELETE FROM store_cells")
+    assert indexed["ids"] == [1, 2, 3]
+    assert db.commits == 1
@@ -0,0 +1,127 @@
+import asyncio
+import httpx
+import pytest
+from app.core.config import settings
+from app.services import gazetteer, geocoding
+from app.services.gazetteer import Gazetteer, GazetteerRow, build, read_geonames
+from app.services.geocoding import GeocodeQuery, GeocodeResult, geocode, local_lookup, local_precisions, provider_order
+
+ROWS = [
+    GazetteerRow("Ukraine", "01001", "Kyiv", 50.4500, 30.5200),
+    GazetteerRow("Ukraine", "01004", "Kyiv", 50.4400, 30.5200),
+    GazetteerRow("Ukraine", "79000", "Lviv", 49.8400, 24.0300),
+    GazetteerRow("Ukraine", None, "Kyiv", 50.4501, 30.5234, address="Khreshchatyk 1"),
+]
+
+
+@pytest.fixture
+def gazetteer_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "gazetteer.bin")
+    build(ROWS, path)
+    monkeypatch.setattr(settings, "GEOCODE_GAZETTEER_PATH", path)
+    return path
+
+
+def test_gazetteer_prefers_address_then_postal_code_then_city(gazetteer_path):
+    g = Gazetteer(gazetteer_path)
+    assert g.lookup("ukraine", "99999", "KYIV", "Khreshchatyk 1;") == (50.4501, 30.5234, "address")
+    assert g.lookup("Ukraine", "79000", "Lviv", "Nowhere 5") == (49.84, 24.03, "postal_code")
+    lat, lng, precision = g.lookup("Ukraine", None, "Kyiv")
+    assert precision == "locality"
+    assert lat == pytest.approx((50.45 + 50.44 + 50.4501) / 3)
+    assert g.lookup("Poland", "01001", "Kyiv") is None
+    g.close()
+
+
+def test_read_geonames_skips_rows_without_coordinates():
+    lines = [
+        "UA\t01001\tKyiv\tKyiv City\t30\t\t\t\t\t50.4547\t30.5238\t4\n",
+        "UA\t99999\tNowhere\t\t\t\t\t\t\t\t\t\n",
+    ]
+    assert list(read_geonames(lines)) == [GazetteerRow("UA", "01001", "Kyiv", 50.4547, 30.5238)]
+
+
+def test_local_lookup_is_offline_and_only_accepts_addresses(gazetteer_path):
+    result = local_lookup(GeocodeQuery("Khreshchatyk 1", "Kyiv", None, "Ukraine", "01001"))
+    assert result == GeocodeResult(50.4501, 30.5234, "local", "address")
+    # a postal-code or city centroid falls through to the next provider
+    assert local_lookup(GeocodeQuery("Some street 3", "Lviv", None, "Ukraine", "79000")) is None
+    assert local_lookup(GeocodeQuery("Some street 3", "Kyiv", None, "Ukraine")) is None
+
+
+def test_local_lookup_accepts_centroids_when_configured(gazetteer_path, monkeypatch):
+    monkeypatch.setattr(settings, "GEOCODE_LOCAL_PRECISIONS", "postal_code, locality")
+    assert local_lookup(GeocodeQuery("Some street 3", "Lviv", None, "Ukraine", "79000")) == GeocodeResult(
+        49.84, 24.03, "local", "postal_code"
+    )
+    assert local_lookup(GeocodeQuery("Some street 3", "Kyiv", None, "Ukraine")).precision == "locality"
+    # addresses were not opted into
+    assert local_lookup(GeocodeQuery("Khreshchatyk 1", "Kyiv", None, "Ukraine")).precision == "locality"
+    with pytest.raises(ValueError):
+        local_precisions("address,street")
+
+
+def test_providers_are_tried_in_order_and_errors_only_raise_when_nothing_matched(monkeypatch):
+    calls = []
+
+    def provider(name, result=None, error=None):
+        async def fn(query):
+            calls.append(name)
+            if error:
+                raise error
+            return result
+        return fn
+
+    monkeypatch.setitem(geocoding.GEOCODE_PROVIDERS, "local", provider("local"))
+    monkeypatch.setitem(geocoding.GEOCODE_PROVIDERS, "google", provider("google", error=httpx.ConnectError("quota")))
+    hit = GeocodeResult(1.0, 2.0, "nominatim")
+    monkeypatch.setitem(geocoding.GEOCODE_PROVIDERS, "nominatim", provider("nominatim", result=hit))
+    query = GeocodeQuery("Main st 1", "Kyiv")
+
+    assert asyncio.run(geocode(query, provider_order("local, google, nominatim"))) == hit
+    assert calls == ["local", "google", "nominatim"]
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(geocode(query, ["local", "google"]))
+    with pytest.raises(ValueError):
+        provider_order("local,bing")
+
+
+def test_nominatim_sends_structured_query(monkeypatch):
+    seen = {}
+
+    def handler(request):
+        seen.update(request.url.params, ua=request.headers["user-agent"])
+        return httpx.Response(200, json=[{"lat": "50.45", "lon": "30.52", "addresstype": "building"}])
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setitem(geocoding._clients, asyncio.get_running_loop(), client)
+        try:
+            return await geocoding.nominatim_geocode(GeocodeQuery("Khreshchatyk 1", "Kyiv", None, "Ukraine", "01001"))
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == GeocodeResult(50.45, 30.52, "nominatim", "building")
+    assert seen["street"] == "Khreshchatyk 1" and seen["postalcode"] == "01001" and "state" not in seen
+    assert seen["ua"] == settings.NOMINATIM_USER_AGENT
+
+
+def test_long_addresses_that_differ_only_in_the_city_do_not_collide(tmp_path, monkeypatch):
+    street = "Very long industrial park access road number 12, building 7, loading dock B"
+    path = str(tmp_path / "long.bin")
+    build([GazetteerRow("UA", None, "Kyiv", 50.45, 30.52, street), GazetteerRow("UA", None, "Lviv", 49.84, 24.03, street)], path)
+    g = Gazetteer(path)
+    assert g.lookup("UA", None, "Kyiv", street) == (50.45, 30.52, "address")
+    assert g.lookup("UA", None, "Lviv", street) == (49.84, 24.03, "address")
+    g.close()
+
+    monkeypatch.setattr(gazetteer, "digest", lambda key: b"\0" * gazetteer.KEY_BYTES)
+    with pytest.raises(ValueError):
+        build(ROWS, str(tmp_path / "colliding.bin"))
+
+
+def test_old_gazetteer_files_are_rejected(tmp_path):
+    path = tmp_path / "old.bin"
+    path.write_bytes(b"\0" * 80)
+    with pytest.raises(ValueError):
+        Gazetteer(str(path))
@@ -1,37 +1,42 @@
 from types import SimpleNamespace
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.core.config import settings
-from app.core.db import get_db
-import app.services.distances as distances_module
+from app.core.db import get_db, get_async_db
+from app.services.store_cache import store_geofences
+
+
+class FakeMappings(list):
+    def first(self):
+        return self[0] if self else None
 
 
 class FakeDB:
-    def __init__(self, task_obj, store_obj, company_obj, insert_id=1):
-        self._task = task_obj
-        self._store = store_obj
-        self._company = company_obj
+    def __init__(self, lookup_row, insert_id=1, lookup_rows=None, recorded_run_ids=()):
+        self._lookup_rows = lookup_rows if lookup_rows is not None else [r for r in [lookup_row] if r]
         self._insert_id = insert_id
-
-    def get(self, model, id_):
-        name = getattr(model, "__name__", None)
-        if name == "Task":
-            return self._task if self._task and self._task.id == id_ else None
-        if name == "Store":
-            return self._store if self._store and self._store.id == id_ else None
-        if name == "Company":
-            return self._company if self._company and self._company.id == id_ else None
-        return None
+        self.recorded_run_ids = set(recorded_run_ids)
+        self.inserts = []
+        self.commits = 0
 
     def execute(self, sql, params=None):
-        # used for inserting the task_run; return object with scalar_one()
-        return SimpleNamespace(scalar_one=lambda: self._insert_id)
+        # geofence lookups read mappings(); the task_run insert reads scalar_one();
+        # the client_run_id lookup reads scalars()
+        if params and "worker_id" in params:
+            self.inserts.append(params)
+        ids = (params or {}).get("ids", [])
+        return SimpleNamespace(
+            mappings=lambda: FakeMappings(self._lookup_rows),
+            scalar_one=lambda: self._insert_id,
+            scalars=lambda: [i for i in ids if i in self.recorded_run_ids],
+        )
 
     def add(self, *args, **kwargs):
         return None
 
     def commit(self):
-        return None
+        self.commits += 1
 
     def flush(self):
         return None
@@ -40,9 +45,44 @@ class FakeDB:
         return None
 
 
+class FakeAsyncDB(FakeDB):
+    """Same canned results behind the AsyncSession API used by the async handlers."""
+
+    async def execute(self, sql, params=None):
+        return FakeDB.execute(self, sql, params)
+
+    async def commit(self):
+        FakeDB.commit(self)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(self, *args, **kwargs)
+
+
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def clear_store_cache():
+    store_geofences.clear()
+    yield
+    store_geofences.clear()
+
+
+def lookup_row(**overrides):
+    row = {
+        "task_id": 1,
+        "task_active": True,
+        "store_id": 10,
+        "company_id": 100,
+        "geocode_status": "success",
+        "lat": 50.0002,
+        "lng": 30.0002,
+        "radius_m": 100,
+    }
+    row.update(overrides)
+    return row
+
+
 def setup_demo_token(token_value: str = "demo-test"):
     settings.DEMO_TOKEN = token_value
     return token_value
@@ -52,21 +92,14 @@ def test_run_task_allowed_within_radius(monkeypatch):
     # Arrange
     demo_token = setup_demo_token("demo-test")
 
-    task_obj = SimpleNamespace(id=1, store_id=10, active=True)
-    store_obj = SimpleNamespace(id=10, company_id=100, geocode_status="success", location=object(), custom_radius_m=None)
-    company_obj = SimpleNamespace(id=100, geofence_radius_m=100)
+    fake_db = FakeAsyncDB(lookup_row(), insert_id=123)
 
-    fake_db = FakeDB(task_obj, store_obj, company_obj, insert_id=123)
-
-    # Override get_db dependency to return our fake DB
-    app.dependency_overrides[get_db] = lambda: fake_db
+    # Override the async session dependency to return our fake DB
+    app.dependency_overrides[get_async_db] = lambda: fake_db
 
     # Ensure rate limiter is a no-op by setting redis to None (the implementation checks this)
     monkeypatch.setattr("app.core.ratelimit._redis", None)
 
-    # Stub the distance calculation used by the tasks router to return within=True
-    monkeypatch.setattr("app.api.routers.tasks.within_radius_and_distance", lambda db, s_id, lat, lng, radius: (True, 23.7))
-
     # Act
     resp = client.post(
         "/tasks/1/run",
@@ -75,26 +108,24 @@ def test_run_task_allowed_within_radius(monkeypatch):
     )
 
     # Cleanup override
-    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_async_db, None)
 
     # Assert
     assert resp.status_code == 200, resp.text
     data = resp.json()
     assert data["allowed"] is True
-    assert abs(data["distance_m"] - 23.7) < 0.001
+    assert data["decision"] == "allowed"
+    assert 20 < data["distance_m"] < 30
+    assert fake_db.inserts[0]["allowed"] is True
 
 
 def test_run_task_store_not_ready(monkeypatch):
     # Arrange
     demo_token = setup_demo_token("demo-test")
 
-    task_obj = SimpleNamespace(id=1, store_id=10, active=True)
-    store_obj = SimpleNamespace(id=10, company_id=100, geocode_status="pending", location=None, custom_radius_m=None)
-    company_obj = SimpleNamespace(id=100, geofence_radius_m=100)
+    fake_db = FakeAsyncDB(lookup_row(geocode_status="pending", lat=None, lng=None), insert_id=123)
 
-    fake_db = FakeDB(task_obj, store_obj, company_obj, insert_id=123)
-
-    app.dependency_overrides[get_db] = lambda: fake_db
+    app.dependency_overrides[get_async_db] = lambda: fake_db
     monkeypatch.setattr("app.core.ratelimit._redis", None)
 
     # Act
@@ -104,8 +135,99 @@ def test_run_task_store_not_ready(monkeypatch):
         headers={"X-Demo-Token": demo_token},
     )
 
-    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_async_db, None)
 
     # Assert
     assert resp.status_code == 409
     assert resp.json().get("detail") == "Store location not ready"
+
+
+def test_run_task_uses_cached_geofence(monkeypatch):
+    demo_token = setup_demo_token("demo-test")
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(lookup_row(), insert_id=1)
+    resp = client.post("/tasks/1/run", json={"lat": 50.0, "lng": 30.0}, headers={"X-Demo-Token": demo_token})
+    assert resp.status_code == 200, resp.text
+
+    # the second check-in must not need the lookup row any more
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(None, insert_id=2)
+    resp = client.post("/tasks/1/run", json={"lat": 51.0, "lng": 30.0}, headers={"X-Demo-Token": demo_token})
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["allowed"] is False
+
+
+def test_run_tasks_batch_per_item_results(monkeypatch):
+    demo_token = setup_demo_token("demo-test")
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+
+    fake_db = FakeDB(None, lookup_rows=[
+        lookup_row(task_id=1),
+        lookup_row(task_id=2, store_id=11, geocode_status="pending", lat=None, lng=None),
+    ])
+    app.dependency_overrides[get_db] = lambda: fake_db
+    resp = client.post(
+        "/tasks/runs:batch",
+        json={"items": [
+            {"task_id": 1, "lat": 50.0, "lng": 30.0, "client_ts": "2026-01-05T08:00:00Z"},
+            {"task_id": 1, "lat": 51.0, "lng": 30.0},
+            {"task_id": 2, "lat": 50.0, "lng": 30.0},
+            {"task_id": 3, "lat": 50.0, "lng": 30.0},
+        ]},
+        headers={"X-Demo-Token": demo_token},
+    )
+    app.dependency_overrides.pop(get_db, None)
+
+    assert resp.status_code == 200, resp.text
+    results = resp.json()["results"]
+    assert [r["status"] for r in results] == [200, 200, 409, 404]
+    assert results[0]["allowed"] is True
+    assert results[1]["allowed"] is False
+
+    # both recorded runs go out in a single insert and a single commit
+    assert len(fake_db.inserts) == 1
+    assert fake_db.inserts[0]["task_ids"] == [1, 1]
+    assert fake_db.inserts[0]["client_ts"][1] is None
+    assert fake_db.commits == 1
+
+
+def test_batch_retry_inserts_each_client_run_id_once(monkeypatch):
+    demo_token = setup_demo_token("demo-test")
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+    done, new = "00000000-0000-0000-0000-000000000001", "00000000-0000-0000-0000-000000000002"
+
+    fake_db = FakeDB(None, lookup_rows=[lookup_row(task_id=1)], recorded_run_ids=[done])
+    app.dependency_overrides[get_db] = lambda: fake_db
+    resp = client.post(
+        "/tasks/runs:batch",
+        json={"items": [
+            {"task_id": 1, "lat": 50.0, "lng": 30.0, "client_run_id": done},
+            {"task_id": 1, "lat": 50.0, "lng": 30.0, "client_run_id": new},
+            {"task_id": 1, "lat": 50.0, "lng": 30.0, "client_run_id": new},
+            {"task_id": 1, "lat": 51.0, "lng": 30.0},
+        ]},
+        headers={"X-Demo-Token": demo_token},
+    )
+    app.dependency_overrides.pop(get_db, None)
+
+    assert resp.status_code == 200, resp.text
+    assert [r["status"] for r in resp.json()["results"]] == [200, 200, 200, 200]
+    assert fake_db.inserts[0]["client_run_ids"] == [new, None]
+
+
+def test_sync_run_task_retry_is_not_inserted_again(monkeypatch):
+    demo_token = setup_demo_token("demo-test")
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+    run_id = "00000000-0000-0000-0000-000000000003"
+
+    fake_db = FakeAsyncDB(lookup_row(), recorded_run_ids=[run_id])
+    app.dependency_overrides[get_async_db] = lambda: fake_db
+    resp = client.post("/tasks/1/run", json={"lat": 50.0, "lng": 30.0, "client_run_id": run_id},
+                       headers={"X-Demo-Token": demo_token})
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["allowed"] is True
+    assert fake_db.inserts == []
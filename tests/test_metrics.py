@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from app.main import app
+from app.core.config import settings
+from app.core.db import get_async_db
+from app.services.store_cache import store_geofences
+
+client = TestClient(app)
+
+
+def lookup_row(**overrides):
+    row = {"task_id": 1, "task_active": True, "store_id": 10, "company_id": 100,
+           "geocode_status": "success", "lat": 50.0002, "lng": 30.0002, "radius_m": 100}
+    row.update(overrides)
+    return row
+
+
+class FakeAsyncDB:
+    def __init__(self, row):
+        self._row = row
+
+    async def execute(self, sql, params=None):
+        return SimpleNamespace(mappings=lambda: SimpleNamespace(first=lambda: self._row), scalar_one=lambda: 1)
+
+    async def commit(self):
+        return None
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_run_task_records_route_latency_stages_and_outcome(monkeypatch):
+    settings.DEMO_TOKEN = "demo-test"
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+    store_geofences.clear()
+    route = "/tasks/{task_id}/run"
+    before = {
+        "requests": sample("http_request_duration_seconds_count", method="POST", route=route, status="200"),
+        "allowed": sample("checkin_outcomes_total", outcome="allowed"),
+        **{s: sample("http_request_stage_seconds_count", route=route, stage=s) for s in ("auth", "lookup", "distance", "insert", "commit")},
+    }
+
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(lookup_row())
+    resp = client.post("/tasks/1/run", json={"lat": 50.0, "lng": 30.0}, headers={"X-Demo-Token": "demo-test"})
+    app.dependency_overrides.pop(get_async_db, None)
+    store_geofences.clear()
+
+    assert resp.status_code == 200, resp.text
+    assert sample("http_request_duration_seconds_count", method="POST", route=route, status="200") == before["requests"] + 1
+    assert sample("checkin_outcomes_total", outcome="allowed") == before["allowed"] + 1
+    for s in ("auth", "lookup", "distance", "insert", "commit"):
+        assert sample("http_request_stage_seconds_count", route=route, stage=s) == before[s] + 1, s
+
+
+def test_not_ready_counts_409(monkeypatch):
+    settings.DEMO_TOKEN = "demo-test"
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+    before = sample("checkin_outcomes_total", outcome="location_not_ready")
+
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(lookup_row(geocode_status="pending", lat=None, lng=None))
+    resp = client.post("/tasks/1/run", json={"lat": 50.0, "lng": 30.0}, headers={"X-Demo-Token": "demo-test"})
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert resp.status_code == 409
+    assert sample("checkin_outcomes_total", outcome="location_not_ready") == before + 1
@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import inspect
+from app.models.models import Base, TaskRun
+from app.services.partitions import add_months, ensure_partitions, partition_month, retire_partitions
+
+NOW = datetime(2025, 11, 17, 9, 30, tzinfo=timezone.utc)
+
+
+class FakeDB:
+    def __init__(self, partitions, default_rows=0):
+        self.partitions = partitions
+        self.default_rows = default_rows
+        self.statements = []
+        self.commits = 0
+
+    def execute(self, sql, params=None):
+        sql = " ".join(str(sql).split())
+        if "pg_inherits" in sql:
+            return SimpleNamespace(scalars=lambda: iter(self.partitions))
+        if "COUNT(*)" in sql:
+            return SimpleNamespace(scalar=lambda: self.default_rows)
+        self.statements.append(sql)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_month_arithmetic_wraps_years():
+    start = datetime(2025, 11, 1, tzinfo=timezone.utc)
+    assert add_months(start, 2) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert add_months(start, -11) == datetime(2024, 12, 1, tzinfo=timezone.utc)
+    assert partition_month("task_runs_p202602") == datetime(2026, 2, 1, tzinfo=timezone.utc)
+    assert partition_month("task_runs_default") is None
+
+
+def test_ensure_creates_only_missing_months():
+    db = FakeDB(["task_runs_default", "task_runs_p202511", "task_runs_p202512"])
+    created = ensure_partitions(db, ahead=3, now=NOW)
+    assert created == ["task_runs_p202601", "task_runs_p202602"]
+    assert db.statements[0] == (
+        "CREATE TABLE task_runs_p202601 PARTITION OF task_runs "
+        "FOR VALUES FROM ('2026-01-01T00:00:00+00:00') TO ('2026-02-01T00:00:00+00:00')"
+    )
+    assert db.commits == 1
+
+
+def test_rows_stranded_in_default_are_moved_before_attaching():
+    db = FakeDB(["task_runs_default"], default_rows=12)
+    ensure_partitions(db, ahead=0, now=NOW)
+    assert db.statements[0].startswith("CREATE TABLE task_runs_p202511 (LIKE task_runs")
+    assert "DELETE FROM task_runs_default" in db.statements[1]
+    assert db.statements[2].startswith("ALTER TABLE task_runs ATTACH PARTITION task_runs_p202511")
+
+
+def test_retire_detaches_months_outside_retention():
+    db = FakeDB(["task_runs_default", "task_runs_p202409", "task_runs_p202410", "task_runs_p202411"])
+    retired = retire_partitions(db, retain_months=13, mode="archive", now=NOW)
+    assert retired == ["task_runs_p202409"]
+    assert db.statements == [
+        "ALTER TABLE task_runs DETACH PARTITION task_runs_p202409",
+        "CREATE SCHEMA IF NOT EXISTS task_runs_archive",
+        "ALTER TABLE task_runs_p202409 SET SCHEMA task_runs_archive",
+    ]
+    with pytest.raises(ValueError):
+        retire_partitions(db, 13, mode="truncate")
+
+
+def test_only_task_runs_has_created_at_in_its_primary_key():
+    # the partition key must be in task_runs' primary key; elsewhere it would break Session.get(Model, id)
+    for mapper in Base.registry.mappers:
+        keys = [c.name for c in inspect(mapper.class_).primary_key]
+        if mapper.class_ is TaskRun:
+            assert keys == ["id", "created_at"]
+        else:
+            assert "created_at" not in keys, mapper.class_.__name__
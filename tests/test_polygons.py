@@ -0,0 +1,86 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.core.db import get_async_db
+from app.services.decision import decide_many
+from app.services.geodesy import vincenty_m
+from app.services.polygons import FenceCache, PreparedFence, fence_from_geojson, store_fences
+from app.services.store_cache import StoreGeofence, store_geofences
+from tests.test_integration_tasks import FakeAsyncDB, lookup_row
+
+# ~220 m x ~143 m rectangle around (50.0, 30.0)
+SQUARE = {"type": "Polygon", "coordinates": [[
+    [29.999, 49.999], [30.001, 49.999], [30.001, 50.001], [29.999, 50.001], [29.999, 49.999],
+]]}
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    store_fences.clear()
+    store_geofences.clear()
+    yield
+    store_fences.clear()
+    store_geofences.clear()
+
+
+def test_geojson_is_validated_and_normalized_to_multipolygon():
+    assert fence_from_geojson(SQUARE).geom_type == "MultiPolygon"
+    bowtie = {"type": "Polygon", "coordinates": [[[0, 0], [1, 1], [1, 0], [0, 1], [0, 0]]]}
+    for bad in (bowtie, {"type": "Point", "coordinates": [30.0, 50.0]}, {"type": "Polygon"},
+                {"type": "Polygon", "coordinates": [[[0, 0], [0, 95], [1, 95], [0, 0]]]}):
+        with pytest.raises(ValueError):
+            fence_from_geojson(bad)
+
+
+def test_prepared_fence_containment_and_edge_distance():
+    fence = PreparedFence.from_geometry(fence_from_geojson(SQUARE))
+    inside, to_edge = fence.check(50.0, 30.0)
+    assert inside is True
+    # nearest edge is the east/west side, 0.001 degrees of longitude away
+    assert to_edge == pytest.approx(vincenty_m(50.0, 30.0, 50.0, 30.001), rel=1e-3)
+
+    outside, to_edge = fence.check(50.0, 30.0015)
+    assert outside is False
+    assert to_edge == pytest.approx(vincenty_m(50.0, 30.001, 50.0, 30.0015), rel=1e-3)
+    assert fence.check(50.0, 30.001)[0] is True  # on the edge counts as inside
+
+
+def test_prepared_fence_round_trips_through_wkb():
+    geom = fence_from_geojson(SQUARE)
+    assert PreparedFence.from_wkb(memoryview(geom.wkb)).check(50.0, 30.0) == PreparedFence.from_geometry(geom).check(50.0, 30.0)
+
+
+def test_fence_cache_is_bounded_and_invalidated():
+    cache = FenceCache(max_entries=1, ttl_sec=60)
+    fence = PreparedFence.from_geometry(fence_from_geojson(SQUARE))
+    cache.put(1, fence)
+    cache.put(2, fence)
+    assert cache.get(1) is None and cache.get(2) is fence
+    cache.invalidate(2)
+    assert cache.get(2) is None
+
+
+def test_decisions_mix_polygon_and_radius_stores():
+    store_fences.put(11, PreparedFence.from_geometry(fence_from_geojson(SQUARE)))
+    circle = StoreGeofence(1, True, 10, 100, "success", 50.0, 30.0, 100)
+    polygon = StoreGeofence(2, True, 11, 100, "pending", None, None, 100, has_geofence=True)
+    # far outside the 100 m radius of store 10, inside the polygon of store 11
+    out = decide_many(None, [circle, polygon], [50.0009, 50.0009], [30.0, 30.0], [None, None], backend="geodesic")
+    assert out[0].allowed is False and out[0].distance_m > 100
+    assert out[1].allowed is True and out[1].tier == "polygon"
+
+
+def test_run_task_uses_the_cached_fence(monkeypatch):
+    settings.DEMO_TOKEN = "demo-test"
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+    store_fences.put(10, PreparedFence.from_geometry(fence_from_geojson(SQUARE)))
+    # not geocoded, but fenced: the check-in is still decided
+    fake_db = FakeAsyncDB(lookup_row(geocode_status="pending", lat=None, lng=None, has_geofence=True))
+    app.dependency_overrides[get_async_db] = lambda: fake_db
+    resp = TestClient(app).post("/tasks/1/run", json={"lat": 50.0005, "lng": 30.0}, headers={"X-Demo-Token": "demo-test"})
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["allowed"] is True
+    assert resp.json()["distance_m"] == pytest.approx(55.6, abs=0.5)  # to the north edge
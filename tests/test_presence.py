@@ -0,0 +1,111 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from app.api.routers import tasks as tasks_router
+from app.core.auth import create_access_token
+from app.core.config import settings
+from app.main import app
+from app.services.decision import Decision
+from app.services.presence import PresenceTracker
+from app.services.store_cache import StoreGeofence, store_geofences
+from tests.test_decision import north
+from tests.test_integration_tasks import FakeAsyncDB
+
+ALLOWED = Decision("allowed", True, 20.0, "fast")
+DENIED = Decision("denied", False, 500.0, "fast")
+UNCERTAIN = Decision("uncertain", True, 95.0, "fast")
+
+client = TestClient(app)
+
+
+def test_tracker_emits_only_transitions():
+    tracker = PresenceTracker([1], dwell_sec=60)
+    steps = [
+        (DENIED, 0), (UNCERTAIN, 1), (ALLOWED, 2), (ALLOWED, 3), (UNCERTAIN, 4),
+        (ALLOWED, 62), (ALLOWED, 70), (DENIED, 80), (UNCERTAIN, 81), (DENIED, 82),
+    ]
+    events = [tracker.event(1, decision, at) for decision, at in steps]
+    assert events == [None, None, "enter", None, None, "dwell", None, "exit", None, None]
+
+
+def test_tracker_enters_on_the_first_inside_ping_and_dwells_once_per_visit():
+    tracker = PresenceTracker([1, 2], dwell_sec=10)
+    assert tracker.event(1, ALLOWED, 0) == "enter"
+    assert tracker.event(2, UNCERTAIN, 0) is None
+    assert tracker.event(1, UNCERTAIN, 10) == "dwell"
+    assert tracker.event(1, DENIED, 11) == "exit"
+    assert tracker.event(1, ALLOWED, 12) == "enter"
+    assert tracker.event(1, ALLOWED, 15) is None
+
+
+class FakeSessions:
+    """async_session() for the WebSocket handler: every session is the same FakeAsyncDB."""
+
+    def __init__(self):
+        self.db = FakeAsyncDB(None)
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self.db
+
+    async def __aexit__(self, *exc):
+        return None
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    sessions = FakeSessions()
+    monkeypatch.setattr(tasks_router, "async_session", sessions)
+    monkeypatch.setattr(settings, "DEMO_TOKEN", "demo-test")
+    monkeypatch.setattr(settings, "PING_MIN_INTERVAL_MS", 0)
+    monkeypatch.setattr(settings, "PING_DWELL_SEC", 3600)
+    store_geofences.clear()
+    store_geofences.put(StoreGeofence(1, True, 10, 100, "success", 50.0, 30.0, 100))
+    yield sessions
+    store_geofences.clear()
+
+
+def test_stream_persists_enter_and_exit_only(sessions):
+    with client.websocket_connect("/tasks/pings", headers={"X-Demo-Token": "demo-test"}) as ws:
+        ws.send_json({"task_ids": [1, 99, 1]})
+        assert ws.receive_json() == {"type": "ready", "task_ids": [1], "unknown": [99]}
+        for metres in (800, 400, 30, 20, 10, 25, 600):
+            ws.send_json({"lat": north(metres), "lng": 30.0, "accuracy_m": 5})
+        ws.send_json({"lat": 91, "lng": 30.0})
+        enter, exit_, error = ws.receive_json(), ws.receive_json(), ws.receive_json()
+
+    assert [e["event"] for e in enter["events"]] == ["enter"]
+    assert enter["events"][0]["allowed"] is True
+    assert [e["event"] for e in exit_["events"]] == ["exit"]
+    assert error["type"] == "error"
+    assert [p["events"] for p in sessions.db.inserts] == [["enter"], ["exit"]]
+    assert sessions.db.inserts[0]["worker_id"] == "demo@user"
+    assert sessions.db.commits == 2
+
+
+def test_stream_accepts_a_query_token_and_drops_pings_that_come_too_fast(sessions, monkeypatch):
+    monkeypatch.setattr(settings, "PING_MIN_INTERVAL_MS", 60_000)
+    token = create_access_token("w1@example.com", "worker")
+    with client.websocket_connect(f"/tasks/pings?token={token}") as ws:
+        ws.send_json({"task_ids": [1]})
+        ws.receive_json()
+        ws.send_json({"lat": north(10), "lng": 30.0})
+        ws.send_json({"lat": north(900), "lng": 30.0})
+        assert ws.receive_json()["events"][0]["event"] == "enter"
+    assert [(p["events"], p["worker_id"]) for p in sessions.db.inserts] == [(["enter"], "w1@example.com")]
+
+
+def test_stream_rejects_unauthenticated_handshakes_and_too_many_tasks(sessions, monkeypatch):
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/tasks/pings?token=garbage"):
+            pass
+    assert exc.value.code == 1008
+
+    monkeypatch.setattr(settings, "PING_MAX_TASKS", 2)
+    with client.websocket_connect("/tasks/pings", headers={"X-Demo-Token": "demo-test"}) as ws:
+        ws.send_json({"task_ids": [1, 2, 3]})
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 1008
@@ -0,0 +1,61 @@
+import fakeredis
+import pytest
+import redis
+from fastapi import HTTPException
+from app.core import ratelimit
+from app.core.auth import TokenData
+from app.core.config import settings
+
+USER = TokenData(sub="worker@example.com", role="worker")
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(ratelimit, "_redis", client)
+    ratelimit.local_blocks.clear()
+    yield client
+    ratelimit.local_blocks.clear()
+
+
+def test_allows_up_to_limit_then_rejects_with_retry_after(fake_redis):
+    check = ratelimit.rate_limit("test", 3, 60)
+    for _ in range(3):
+        check(USER)
+    with pytest.raises(HTTPException) as exc:
+        check(USER)
+    assert exc.value.status_code == 429
+    assert 1 <= int(exc.value.headers["Retry-After"]) <= 20
+    # one key per user and bucket, expiring on its own
+    assert 0 < fake_redis.pttl("rl:test:worker@example.com") <= 60_000
+
+
+def test_local_prefilter_rejects_without_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_LOCAL_PREFILTER", True)
+    check = ratelimit.rate_limit("test", 1, 60)
+    check(USER)
+    with pytest.raises(HTTPException):
+        check(USER)
+
+    calls = []
+    monkeypatch.setattr(ratelimit, "run_gcra", lambda *a: calls.append(a) or (1, 0))
+    with pytest.raises(HTTPException) as exc:
+        check(USER)
+    assert exc.value.status_code == 429
+    assert calls == []
+
+
+def test_failure_policy(fake_redis, monkeypatch):
+    def broken(*args):
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(ratelimit, "run_gcra", broken)
+    check = ratelimit.rate_limit("test", 1, 60)
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_FAIL_MODE", "open")
+    check(USER)
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_FAIL_MODE", "closed")
+    with pytest.raises(HTTPException) as exc:
+        check(USER)
+    assert exc.value.status_code == 503
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+from uuid import UUID
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.responses import get_encoder, schema_columns
+from app.core.config import settings
+from app.core.db import get_async_db
+from app.models.models import Task
+from app.schemas.schemas import TaskOut
+from tests.test_integration_tasks import FakeAsyncDB
+
+client = TestClient(app)
+
+
+def test_encoders_agree():
+    content = {
+        "at": datetime(2026, 3, 1, 12, 30, tzinfo=timezone.utc),
+        "id": UUID("12345678-1234-5678-1234-567812345678"),
+        "name": "Київ store",
+        "distance_m": np.float64(12.5),
+        "items": [1, None, True],
+    }
+    assert get_encoder("json")(content) == get_encoder("orjson")(content)
+    with pytest.raises(ValueError):
+        get_encoder("ujson")
+
+
+def test_schema_columns_follow_the_schema():
+    assert [c.key for c in schema_columns(TaskOut, Task)] == ["id", "store_id", "title", "description", "active"]
+
+
+@pytest.mark.parametrize("encoder", ["json", "orjson"])
+def test_list_tasks_returns_selected_columns(monkeypatch, encoder):
+    monkeypatch.setattr(settings, "JSON_ENCODER", encoder)
+    rows = [{"id": i, "store_id": 10, "title": f"t{i}", "description": None, "active": True} for i in (1, 2)]
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(None, lookup_rows=rows)
+    resp = client.get("/tasks", params={"store_id": 10})
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.json() == rows
+
+
+def test_get_store_not_found():
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(None)
+    resp = client.get("/stores/99")
+    app.dependency_overrides.pop(get_async_db, None)
+    assert resp.status_code == 404
+
+
+def test_list_tasks_is_complete_without_limit_and_links_the_next_page():
+    rows = [{"id": i, "store_id": 10, "title": f"t{i}", "description": None, "active": True} for i in (1, 2, 3)]
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(None, lookup_rows=rows)
+    everything = client.get("/tasks", params={"store_id": 10})
+    page = client.get("/tasks", params={"store_id": 10, "limit": 2})
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert everything.json() == rows and "link" not in everything.headers
+    assert page.json() == rows[:2]
+    assert page.headers["link"] == '<http://testserver/tasks?store_id=10&limit=2&after_id=2>; rel="next"'
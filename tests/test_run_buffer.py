@@ -0,0 +1,168 @@
+import asyncio
+import uuid
+from datetime import datetime, timezone
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.core.db import get_async_db
+from app.services import run_buffer
+from app.services.run_buffer import MemoryRunBuffer, RedisRunBuffer, RunFlusher, RunRecord, new_record, to_csv
+from app.services.store_cache import store_geofences
+from tests.test_integration_tasks import FakeAsyncDB, lookup_row
+
+RUN_ID = uuid.UUID("6f1c9a4e-0c53-4c61-9a0e-3f5f3b0b1a11")
+
+
+def record(n: int = 0, **overrides) -> RunRecord:
+    fields = dict(
+        client_run_id=f"00000000-0000-0000-0000-{n:012d}", task_id=1, worker_id="w1", lat=50.0001, lng=30.25,
+        distance_m=12.5, allowed=True, client_ts=None, created_at=datetime(2026, 3, 1, 8, 0, n, tzinfo=timezone.utc),
+    )
+    fields.update(overrides)
+    return RunRecord(**fields)
+
+
+def test_record_round_trips_through_stream_fields():
+    r = record(client_ts=datetime(2026, 3, 1, 7, 59, tzinfo=timezone.utc), allowed=False)
+    assert RunRecord.from_fields(r.to_fields()) == r
+    assert RunRecord.from_fields(record().to_fields()).client_ts is None
+
+
+def test_new_record_keeps_client_id_and_stamps_created_at():
+    r = new_record(1, "w1", 50.0, 30.0, 3.0, True, RUN_ID)
+    assert r.client_run_id == str(RUN_ID)
+    assert r.created_at.tzinfo is not None
+    assert new_record(1, "w1", 50.0, 30.0, 3.0, True).client_run_id != new_record(1, "w1", 50.0, 30.0, 3.0, True).client_run_id
+
+
+def test_copy_csv_rows():
+    lines = to_csv([record(), record(1, allowed=False)]).read().splitlines()
+    assert lines[0] == (
+        "00000000-0000-0000-0000-000000000000,1,w1,SRID=4326;POINT(30.25 50.0001),12.5,t,,2026-03-01T08:00:00+00:00"
+    )
+    assert lines[1].split(",")[5] == "f"
+
+
+def test_memory_buffer_requeued_batch_is_read_first():
+    async def scenario():
+        buf = MemoryRunBuffer(max_size=2)
+        assert await buf.append(record(0))
+        assert await buf.append(record(1))
+        assert not await buf.append(record(2))  # full: the caller writes inline
+        first = await buf.read(10, block_ms=10)
+        await buf.requeue(first)
+        again = await buf.read(10, block_ms=10)
+        empty = await buf.read(10, block_ms=10)
+        seen = [await buf.first_seen("a"), await buf.first_seen("a")]
+        return first, again, empty, seen
+
+    first, again, empty, seen = asyncio.run(scenario())
+    assert [r.client_run_id for _, r in first] == [record(0).client_run_id, record(1).client_run_id]
+    assert again == first
+    assert empty == []
+    assert seen == [True, False]
+
+
+def test_redis_entries_of_a_dead_flusher_are_claimed(monkeypatch):
+    monkeypatch.setattr(settings, "TASK_RUN_CLAIM_IDLE_MS", 0)
+
+    async def scenario():
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        dead = RedisRunBuffer(client, "runs", consumer="c1")
+        for n in range(2):
+            await dead.append(record(n))
+        lost = await dead.read(10, block_ms=10)  # c1 dies before acking
+        alive = RedisRunBuffer(client, "runs", consumer="c2")
+        claimed = await alive.read(10, block_ms=10)
+        await alive.ack([msg_id for msg_id, _ in claimed])
+        pending = await client.xpending("runs", run_buffer.CONSUMER_GROUP)
+        return lost, claimed, pending["pending"]
+
+    lost, claimed, pending = asyncio.run(scenario())
+    assert [r for _, r in lost] == [record(0), record(1)]
+    assert claimed == lost
+    assert pending == 0
+
+
+def test_run_not_buffered_is_not_a_duplicate_on_retry(monkeypatch):
+    monkeypatch.setattr(settings, "TASK_RUN_WRITE_MODE", "memory")
+    buf = MemoryRunBuffer(max_size=1)
+    monkeypatch.setattr(run_buffer, "_buffer", buf)
+
+    async def scenario():
+        assert await run_buffer.accept_run(record(0))
+        # queue full: written inline, and if that insert fails the client retries
+        return [await run_buffer.accept_run(record(1)), await run_buffer.accept_run(record(1))]
+
+    assert asyncio.run(scenario()) == [False, False]
+    assert buf.queue.qsize() == 1
+
+
+def test_redis_marker_is_cleared_when_xadd_fails(monkeypatch):
+    monkeypatch.setattr(settings, "TASK_RUN_WRITE_MODE", "redis")
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(run_buffer, "_buffer", RedisRunBuffer(client, "runs"))
+
+    async def fail(*args, **kwargs):
+        raise run_buffer.redis.ResponseError("OOM command not allowed")
+
+    monkeypatch.setattr(client, "xadd", fail)
+
+    async def scenario():
+        accepted = await run_buffer.accept_run(record(0))
+        return accepted, await client.exists(f"task_run:{record(0).client_run_id}")
+
+    assert asyncio.run(scenario()) == (False, 0)
+
+
+def test_flusher_acks_written_batches_and_keeps_failed_ones(monkeypatch):
+    written = []
+
+    def fake_write(engine, records):
+        if not written:
+            written.append(None)
+            raise ConnectionError("db down")
+        written.append(records)
+        return len(records) - 1, 0  # one of them was already in task_runs
+
+    monkeypatch.setattr(run_buffer, "write_isolating_bad_rows", fake_write)
+
+    async def scenario():
+        buf = MemoryRunBuffer(max_size=10)
+        for n in range(3):
+            await buf.append(record(n))
+        flusher = RunFlusher(buf, engine=None, batch=10, block_ms=10)
+        with pytest.raises(ConnectionError):
+            await flusher.flush_once()
+        return await flusher.flush_once(), await flusher.flush_once()
+
+    assert asyncio.run(scenario()) == (3, 0)
+    assert [r.client_run_id for r in written[1]] == [record(n).client_run_id for n in range(3)]
+
+
+def test_run_task_buffers_instead_of_inserting(monkeypatch):
+    store_geofences.clear()
+    settings.DEMO_TOKEN = "demo-test"
+    monkeypatch.setattr("app.core.ratelimit._redis", None)
+    monkeypatch.setattr(settings, "TASK_RUN_WRITE_MODE", "memory")
+    buf = MemoryRunBuffer(max_size=10)
+    monkeypatch.setattr(run_buffer, "_buffer", buf)
+
+    fake_db = FakeAsyncDB(lookup_row())
+    app.dependency_overrides[get_async_db] = lambda: fake_db
+    client = TestClient(app)
+    body = {"lat": 50.0, "lng": 30.0, "client_run_id": str(RUN_ID)}
+    first = client.post("/tasks/1/run", json=body, headers={"X-Demo-Token": "demo-test"})
+    retry = client.post("/tasks/1/run", json=body, headers={"X-Demo-Token": "demo-test"})
+    app.dependency_overrides.pop(get_async_db, None)
+    store_geofences.clear()
+
+    assert first.status_code == retry.status_code == 200, first.text
+    assert retry.json() == first.json()
+    assert fake_db.inserts == [] and fake_db.commits == 0
+    # the retried check-in is acknowledged but buffered once
+    assert buf.queue.qsize() == 1
+    queued = buf.queue.get_nowait()
+    assert (queued.client_run_id, queued.task_id, queued.allowed) == (str(RUN_ID), 1, True)
@@ -0,0 +1,87 @@
+import csv
+import gzip
+import io
+import json
+import uuid
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.api.routers import tasks as tasks_router
+from app.core.auth import create_access_token
+from app.services.run_export import COLUMNS, ExportFilter, export_chunks, export_query
+
+client = TestClient(app)
+ADMIN = {"Authorization": f"Bearer {create_access_token('admin@example.com', 'admin')}"}
+
+
+def rows(n: int):
+    for i in range(n):
+        yield (
+            i, datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc), None, uuid.UUID(int=i), "w1", 1, "Open store",
+            10, "Store, \"Main\"", 100, 50.0, 30.0, 12.5, i % 2 == 0, None,
+        )
+
+
+def test_ndjson_is_emitted_in_row_chunks():
+    chunks = list(export_chunks(rows(5), "ndjson", chunk_rows=2))
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    first = json.loads(lines[0])
+    assert list(first) == list(COLUMNS)
+    assert first["created_at"] == "2026-03-01T08:00:00+00:00"
+    assert first["client_run_id"] == str(uuid.UUID(int=0))
+    assert [json.loads(line)["allowed"] for line in lines] == [True, False, True, False, True]
+
+
+def test_csv_has_header_and_quotes_names():
+    data = b"".join(export_chunks(rows(3), "csv", chunk_rows=2)).decode()
+    parsed = list(csv.reader(io.StringIO(data)))
+    assert parsed[0] == list(COLUMNS)
+    assert parsed[1][8] == 'Store, "Main"'
+    assert len(parsed) == 4
+
+
+def test_gzip_stream_decompresses_to_the_plain_export():
+    plain = b"".join(export_chunks(rows(50), "ndjson", chunk_rows=7))
+    assert gzip.decompress(b"".join(export_chunks(rows(50), "ndjson", "gzip", chunk_rows=7))) == plain
+
+
+def test_zstd_stream_decompresses_to_the_plain_export():
+    zstandard = pytest.importorskip("zstandard")
+    plain = b"".join(export_chunks(rows(50), "csv", chunk_rows=7))
+    packed = b"".join(export_chunks(rows(50), "csv", "zstd", chunk_rows=7))
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(packed) == plain
+
+
+def test_bad_arguments_fail_before_streaming():
+    with pytest.raises(ValueError):
+        export_chunks(rows(1), "xml")
+    with pytest.raises(ValueError):
+        export_chunks(rows(1), "csv", "brotli")
+
+
+def test_filters_bound_created_at_and_scope():
+    sql, params = export_query(ExportFilter(since=datetime(2026, 1, 1), company_id=3))
+    assert "r.created_at >= :since" in sql and "s.company_id = :company_id" in sql
+    assert sql.endswith("ORDER BY r.created_at, r.id")
+    assert params == {"since": datetime(2026, 1, 1), "company_id": 3}
+
+
+def test_export_endpoint_streams_an_attachment(monkeypatch):
+    seen = []
+
+    def fake_rows(f):
+        seen.append(f)
+        return rows(3)
+
+    monkeypatch.setattr(tasks_router, "iter_export_rows", fake_rows)
+    resp = client.get("/tasks/runs:export?compression=gzip&store_id=10", headers=ADMIN)
+    assert resp.status_code == 200, resp.text
+    assert resp.headers["content-type"] == "application/gzip"
+    assert 'filename="task_runs.ndjson.gz"' in resp.headers["content-disposition"]
+    assert len(gzip.decompress(resp.content).splitlines()) == 3
+    assert seen[0].store_id == 10
+
+    worker = {"Authorization": f"Bearer {create_access_token('w1', 'worker')}"}
+    assert client.get("/tasks/runs:export", headers=worker).status_code == 403
@@ -0,0 +1,131 @@
+import json
+from datetime import date, datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.auth import create_access_token
+from app.core.db import get_async_db
+from app.services import run_history
+from app.services.run_history import decode_cursor, encode_cursor, runs_query
+from app.services.run_rollup import DISTANCE_BUCKETS_M, REFRESH_DAILY_SQL, daily_to_out
+from tests.test_integration_tasks import FakeAsyncDB
+
+client = TestClient(app)
+ADMIN = {"Authorization": f"Bearer {create_access_token('admin@example.com', 'admin')}"}
+
+
+def run_row(n: int) -> dict:
+    return {
+        "id": 100 - n, "task_id": 1, "store_id": 10, "worker_id": "w1", "client_run_id": None,
+        "lat": 50.0, "lng": 30.0, "distance_m": 12.5, "allowed": True, "client_ts": None, "event": None,
+        "created_at": datetime(2026, 3, 1, 12, 0, 59 - n, tzinfo=timezone.utc),
+    }
+
+
+class FakeStreamSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+    async def stream(self, sql, params):
+        self.calls.append((str(sql), params))
+        rows = self.rows[:params["limit"]]
+
+        async def mappings():
+            for row in rows:
+                yield row
+
+        return type("Result", (), {"mappings": staticmethod(mappings)})
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = FakeStreamSession([run_row(n) for n in range(3)])
+    monkeypatch.setattr(run_history, "async_session", lambda: fake)
+    return fake
+
+
+def test_cursor_round_trip_and_garbage():
+    ts = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(ts, 42)) == (ts, 42)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_keyset_predicate_replaces_offset():
+    cursor = encode_cursor(datetime(2026, 3, 1, tzinfo=timezone.utc), 7)
+    sql, params = runs_query(
+        "store", cursor, since=datetime(2026, 2, 1, tzinfo=timezone.utc), until=datetime(2026, 3, 2, tzinfo=timezone.utc)
+    )
+    assert "t.store_id = :key" in sql
+    assert "r.created_at <= :after_ts AND (r.created_at, r.id) < (:after_ts, :after_id)" in sql
+    assert "ORDER BY r.created_at DESC, r.id DESC LIMIT :limit" in sql
+    assert "OFFSET" not in sql
+    assert params["after_id"] == 7
+
+
+def test_store_runs_are_bounded_by_a_window(session):
+    until = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    _, params = runs_query("store", until=until)
+    assert params["since"] == until - run_history.STORE_WINDOW
+    # task runs are not windowed
+    assert "since" not in runs_query("task")[1]
+    with pytest.raises(ValueError):
+        runs_query("store", since=datetime(2025, 1, 1), until=until)
+
+    assert client.get("/stores/10/runs?since=2025-01-01T00:00:00Z", headers=ADMIN).status_code == 400
+    assert client.get("/stores/10/runs", headers=ADMIN).status_code == 200
+    assert session.calls[-1][1]["since"] > datetime.now(timezone.utc) - run_history.STORE_WINDOW * 2
+
+
+def test_task_runs_page_is_streamed_with_next_cursor(session):
+    resp = client.get("/tasks/1/runs?limit=2", headers=ADMIN)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    assert [r["id"] for r in body["items"]] == [100, 99]
+    assert decode_cursor(body["next_cursor"]) == (run_row(1)["created_at"], 99)
+    assert session.calls[0][1]["limit"] == 3  # one extra row to detect the next page
+
+    last = client.get(f"/tasks/1/runs?limit=5&cursor={body['next_cursor']}", headers=ADMIN).json()
+    assert last["next_cursor"] is None
+    assert len(last["items"]) == 3
+
+
+def test_worker_runs_are_private(session):
+    worker = {"Authorization": f"Bearer {create_access_token('w1', 'worker')}"}
+    assert client.get("/workers/w1/runs", headers=worker).status_code == 200
+    assert client.get("/workers/w2/runs", headers=worker).status_code == 403
+    assert client.get("/stores/10/runs?cursor=bogus", headers=ADMIN).status_code == 400
+
+
+def test_rollup_histogram_has_an_open_ended_bucket():
+    assert str(REFRESH_DAILY_SQL).count("count(*) FILTER (WHERE width_bucket") == len(DISTANCE_BUCKETS_M) + 1
+    row = {
+        "day": date(2026, 3, 1), "runs": 8, "allowed": 6, "distance_p50": 20.0, "distance_p90": 80.0,
+        "distance_p99": 900.0, "distance_histogram": [1, 2, 1, 2, 0, 0, 1, 0, 1],
+    }
+    out = daily_to_out(row)
+    assert (out["denied"], out["allow_rate"], out["deny_rate"]) == (2, 0.75, 0.25)
+    assert out["distance_histogram"][0] == {"lt_m": 10, "count": 1}
+    assert out["distance_histogram"][-1] == {"lt_m": None, "count": 1}
+
+
+def test_store_daily_endpoint_reads_the_rollup():
+    row = {
+        "day": date(2026, 3, 1), "runs": 4, "allowed": 1, "distance_p50": 150.0, "distance_p90": 300.0,
+        "distance_p99": 310.0, "distance_histogram": [0, 0, 0, 1, 2, 1, 0, 0, 0],
+    }
+    app.dependency_overrides[get_async_db] = lambda: FakeAsyncDB(row)
+    resp = client.get("/stores/10/runs:daily?start=2026-03-01&end=2026-03-07", headers=ADMIN)
+    bad = client.get("/stores/10/runs:daily?start=2026-03-07&end=2026-03-01", headers=ADMIN)
+    app.dependency_overrides.pop(get_async_db, None)
+
+    assert resp.status_code == 200, resp.text
+    assert json.loads(resp.text)[0]["deny_rate"] == 0.75
+    assert bad.status_code == 400
@@ -0,0 +1,49 @@
+from app.services.store_cache import StoreGeofence, StoreGeofenceCache
+
+
+def make_geo(task_id=1, store_id=10, company_id=100, status="success"):
+    return StoreGeofence(
+        task_id=task_id,
+        task_active=True,
+        store_id=store_id,
+        company_id=company_id,
+        geocode_status=status,
+        lat=50.0 if status == "success" else None,
+        lng=30.0 if status == "success" else None,
+        radius_m=100,
+    )
+
+
+def test_cache_skips_stores_that_are_not_ready():
+    cache = StoreGeofenceCache(max_entries=10, ttl_sec=60)
+    cache.put(make_geo(status="pending"))
+    assert cache.get(1) is None
+
+
+def test_cache_invalidation_by_store_and_company():
+    cache = StoreGeofenceCache(max_entries=10, ttl_sec=60)
+    cache.put(make_geo(task_id=1, store_id=10, company_id=100))
+    cache.put(make_geo(task_id=2, store_id=11, company_id=100))
+    cache.put(make_geo(task_id=3, store_id=12, company_id=200))
+
+    cache.invalidate_store(10)
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+
+    cache.invalidate_company(100)
+    assert cache.get(2) is None
+    assert cache.get(3) is not None
+
+
+def test_cache_evicts_least_recently_used_and_expired():
+    cache = StoreGeofenceCache(max_entries=2, ttl_sec=60)
+    cache.put(make_geo(task_id=1))
+    cache.put(make_geo(task_id=2))
+    cache.get(1)
+    cache.put(make_geo(task_id=3))
+    assert cache.get(2) is None
+    assert cache.get(1) is not None
+
+    expired = StoreGeofenceCache(max_entries=2, ttl_sec=-1)
+    expired.put(make_geo(task_id=1))
+    assert expired.get(1) is None
@@ -0,0 +1,84 @@
+import io
+from itertools import count
+from types import SimpleNamespace
+from app.services.store_import import format_for, parse_rows, run_import
+
+CSV = """name,address_lines,city,state,country,postal_code
+Kyiv Center,Khreshchatyk 1,Kyiv,,Ukraine,01001
+No City,Somewhere 2,,,Ukraine,
+Lviv Mall,"Under Dubom 7b; floor 2",Lviv,,Ukraine,79000
+"""
+
+NDJSON = """{"name": "A", "address_lines": ["Main St 1", "Unit 4"], "city": "Kyiv", "country": "Ukraine"}
+
+not json
+{"name": "B", "address_lines": "Side St 2", "city": "Lviv", "country": "Ukraine", "postal_code": 79000}
+"""
+
+
+class FakeDB:
+    def __init__(self, imp):
+        self.imp = imp
+        self.ids = count(1)
+        self.store_chunks = []
+        self.job_chunks = []
+        self.commits = 0
+
+    def get(self, model, id_):
+        return self.imp
+
+    def execute(self, sql, params):
+        if "names" in params:
+            self.store_chunks.append(params)
+            ids = [next(self.ids) for _ in params["names"]]
+            return SimpleNamespace(scalars=lambda: ids)
+        self.job_chunks.append(params["store_ids"])
+        return None
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        return None
+
+
+def make_import(source):
+    return SimpleNamespace(id=1, company_id=5, source=source, status="queued", total_rows=0, inserted=0, failed=0, error_msg=None)
+
+
+def test_parse_csv_and_ndjson_rows():
+    rows = list(parse_rows(io.StringIO(CSV), "csv"))
+    assert [(n, err) for n, _, err in rows] == [(1, None), (2, "missing city"), (3, None)]
+    assert rows[0][1]["postal_code"] == "01001"
+    assert rows[0][1]["state"] is None
+
+    rows = list(parse_rows(io.StringIO(NDJSON), "ndjson"))
+    assert [n for n, _, _ in rows] == [1, 2, 3]
+    assert rows[0][1]["address_lines"] == "Main St 1; Unit 4"
+    assert rows[1][2] is not None
+    assert rows[2][1]["postal_code"] == "79000"
+
+
+def test_format_detection():
+    assert format_for("text/csv; charset=utf-8") == "csv"
+    assert format_for("application/x-ndjson") == "ndjson"
+    assert format_for(None, "stores.jsonl") == "ndjson"
+    assert format_for("application/octet-stream") is None
+
+
+def test_run_import_inserts_in_chunks_and_enqueues_geocoding():
+    imp = make_import("csv")
+    db = FakeDB(imp)
+    enqueued = []
+    lines = io.StringIO("name,address_lines,city,country\n" + "".join(f"S{i},Street {i},Kyiv,Ukraine\n" for i in range(5)) + ",x,y,z\n")
+
+    run_import(db, 1, lines, enqueue=enqueued.append, chunk_size=2)
+
+    assert imp.status == "done"
+    assert (imp.total_rows, imp.inserted, imp.failed) == (6, 5, 1)
+    assert "row 6: missing name" in imp.error_msg
+    # 5 valid rows in chunks of 2 -> three multi-row INSERTs, each with its geocode_jobs insert
+    assert [len(c["names"]) for c in db.store_chunks] == [2, 2, 1]
+    assert db.job_chunks == [[1, 2], [3, 4], [5]]
+    assert enqueued == [[1, 2], [3, 4], [5]]
+    assert all(c["import_id"] == 1 and c["company_id"] == 5 for c in db.store_chunks)
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.core.db import get_db
+
+client = TestClient(app)
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self._rows = rows
+        self.params = None
+
+    def execute(self, sql, params=None):
+        self.params = params
+        return SimpleNamespace(mappings=lambda: iter(self._rows))
+
+    def close(self):
+        return None
+
+
+def test_nearby_stores_reports_distance_and_geofence():
+    settings.DEMO_TOKEN = "demo-test"
+    fake_db = FakeDB([
+        {"id": 7, "company_id": 1, "name": "Mall", "distance_m": 42.5, "radius_m": 100},
+        {"id": 8, "company_id": 1, "name": "Depot", "distance_m": 420.0, "radius_m": 150},
+    ])
+    app.dependency_overrides[get_db] = lambda: fake_db
+    resp = client.get("/stores:nearby", params={"lat": 50.45, "lng": 30.52, "limit": 5}, headers={"X-Demo-Token": "demo-test"})
+    app.dependency_overrides.pop(get_db, None)
+
+    assert resp.status_code == 200, resp.text
+    assert [(s["id"], s["within"]) for s in resp.json()] == [(7, True), (8, False)]
+    assert fake_db.params == {"lat": 50.45, "lng": 30.52, "radius": 1000.0, "limit": 5}
+
+
+def test_nearby_stores_validates_coordinates():
+    settings.DEMO_TOKEN = "demo-test"
+    resp = client.get("/stores:nearby", params={"lat": 123, "lng": 30.52}, headers={"X-Demo-Token": "demo-test"})
+    assert resp.status_code == 422